@@ -0,0 +1,215 @@
+"""
+Горячие резервные копии базы задач.
+
+Копия снимается через sqlite3.Connection.backup по BACKUP_PAGES страниц за шаг
+с паузой BACKUP_STEP_SLEEP между шагами: бот продолжает писать, копия — снимок
+базы на момент начала (на время копирования держится транзакция чтения).
+Снимки — каталоги backups/snapshot-ГГГГММДД-ЧЧММСС-мкс с той же раскладкой, что
+и DATABASE_PATH (один файл или шарды с shards.json); хранятся BACKUP_KEEP последних.
+
+Запуск:
+    python backup.py create                     # снять снимок сейчас
+    python backup.py list
+    python backup.py restore snapshot-20261015-120000-000000   # бот должен быть остановлен
+"""
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime
+
+import storage
+
+# ================== НАСТРОЙКИ ==================
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_INTERVAL_MINUTES = float(os.getenv("BACKUP_INTERVAL_MINUTES", "0"))   # 0 — по расписанию не снимать
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_PAGES = int(os.getenv("BACKUP_PAGES", "256"))
+BACKUP_STEP_SLEEP = float(os.getenv("BACKUP_STEP_SLEEP", "0.005"))
+
+SNAPSHOT_PREFIX = "snapshot-"
+
+logger = logging.getLogger(__name__)
+
+# ================== КОПИРОВАНИЕ ==================
+def copy_database(source: str, target: str, pages: int = BACKUP_PAGES, sleep: float = BACKUP_STEP_SLEEP) -> int:
+    """
+    Постраничная копия source → target. Возвращает число скопированных страниц.
+
+    Транзакция чтения на исходном соединении фиксирует снимок WAL: запись в базу
+    продолжается, а backup не начинает копирование заново после каждого commit.
+    """
+    src = sqlite3.connect(source, isolation_level=None)
+    dst = sqlite3.connect(target)
+    copied = [0]
+
+    def progress(status, remaining, total):
+        copied[0] = total - remaining
+        # Параметр sleep у backup() ждёт только при SQLITE_BUSY — паузу между шагами делаем сами
+        if remaining and sleep > 0:
+            time.sleep(sleep)
+
+    try:
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        src.backup(dst, pages=pages, progress=progress)
+        src.execute("COMMIT")
+        check, = dst.execute("PRAGMA quick_check").fetchone()
+        if check != "ok":
+            raise RuntimeError(f"Копия {target} повреждена: {check}")
+    finally:
+        dst.close()
+        src.close()
+    return copied[0]
+
+def _database_files() -> list:
+    """Имена файлов базы: DATABASE_PATH или файлы шардов — в снимке они лежат под теми же именами"""
+    return [os.path.basename(path) for path in storage.shard_paths()]
+
+# ================== СНИМКИ ==================
+def create_snapshot(backup_dir: str = BACKUP_DIR) -> str:
+    """
+    Снимаем копию всех файлов базы в новый каталог снимка и возвращаем путь к нему.
+    Снимок пишется во временный каталог и переименовывается, только когда готов.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    # Микросекунды в имени и атомарный mkdir: ручной create, совпавший по времени
+    # с плановым, получает свой каталог, а не «Directory not empty» при rename
+    base = SNAPSHOT_PREFIX + datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    for attempt in range(100):
+        final = os.path.join(backup_dir, base if attempt == 0 else f"{base}-{attempt}")
+        tmp = final + ".tmp"
+        if os.path.exists(final):
+            continue
+        try:
+            os.mkdir(tmp)
+            break
+        except FileExistsError:
+            continue
+    else:
+        raise RuntimeError(f"Не удалось выбрать имя снимка {base}")
+    start = time.perf_counter()
+    try:
+        pages = 0
+        for path, filename in zip(storage.shard_paths(), _database_files()):
+            pages += copy_database(path, os.path.join(tmp, filename))
+        if os.path.isdir(storage.DB_PATH):
+            shutil.copy(os.path.join(storage.DB_PATH, storage.SHARDS_META), tmp)
+        os.replace(tmp, final)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    logger.info(f"Резервная копия {final}: {pages} страниц за {time.perf_counter() - start:.1f} с")
+    return final
+
+def list_snapshots(backup_dir: str = BACKUP_DIR) -> list:
+    """Готовые снимки, от старых к новым"""
+    if not os.path.isdir(backup_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(backup_dir)
+        if name.startswith(SNAPSHOT_PREFIX) and not name.endswith(".tmp")
+    )
+
+def rotate_snapshots(backup_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP) -> list:
+    """Удаляем снимки сверх keep последних, возвращаем имена удалённых"""
+    snapshots = list_snapshots(backup_dir)
+    removed = snapshots[:-keep] if keep > 0 else []
+    for name in removed:
+        shutil.rmtree(os.path.join(backup_dir, name), ignore_errors=True)
+    return removed
+
+def restore_snapshot(snapshot: str, backup_dir: str = BACKUP_DIR):
+    """
+    Восстанавливаем базу из снимка. Бот должен быть остановлен: файлы базы
+    перезаписываются через тот же backup API, поэтому WAL остаётся согласованным.
+    """
+    path = snapshot if os.path.isdir(snapshot) else os.path.join(backup_dir, snapshot)
+    if not os.path.isdir(path):
+        raise ValueError(f"Снимок {snapshot} не найден")
+    snapshot_meta = os.path.join(path, storage.SHARDS_META)
+    if os.path.exists(snapshot_meta) != os.path.isdir(storage.DB_PATH):
+        raise ValueError("Раскладка снимка (файл/шарды) не совпадает с DATABASE_PATH")
+    if os.path.exists(snapshot_meta) and storage.read_shards_meta(path) != storage.shard_count():
+        raise ValueError("Число шардов в снимке не совпадает с DATABASE_PATH")
+
+    storage.close_writer()
+    storage.close_pool()
+    for target, filename in zip(storage.shard_paths(), _database_files()):
+        source = os.path.join(path, filename)
+        if not os.path.exists(source):
+            raise ValueError(f"В снимке нет файла {filename}")
+        copy_database(source, target, pages=-1, sleep=0)
+    storage.upcoming_cache.clear()
+    logger.info(f"База восстановлена из {path}")
+
+def run_backup() -> str:
+    """Один проход по расписанию: снимок и ротация"""
+    path = create_snapshot()
+    removed = rotate_snapshots()
+    if removed:
+        logger.info(f"Удалены старые копии: {', '.join(removed)}")
+    return path
+
+# ================== РАСПИСАНИЕ ==================
+_backup_stop = threading.Event()
+_backup_thread = None
+
+def start_backups(interval_minutes: float = BACKUP_INTERVAL_MINUTES):
+    """Фоновый поток, который раз в interval_minutes снимает резервную копию"""
+    global _backup_thread
+    if _backup_thread is not None or interval_minutes <= 0:
+        return _backup_thread
+
+    def loop():
+        while not _backup_stop.wait(interval_minutes * 60):
+            try:
+                run_backup()
+            except Exception as e:
+                logger.error(f"Ошибка резервного копирования: {e}")
+
+    _backup_stop.clear()
+    _backup_thread = threading.Thread(target=loop, name="db-backup", daemon=True)
+    _backup_thread.start()
+    return _backup_thread
+
+def stop_backups():
+    global _backup_thread
+    _backup_stop.set()
+    if _backup_thread is not None:
+        _backup_thread.join()
+        _backup_thread = None
+
+# ================== КОМАНДНАЯ СТРОКА ==================
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["create", "list", "restore"])
+    parser.add_argument("snapshot", nargs="?", help="имя или путь снимка для restore")
+    parser.add_argument("--dir", default=BACKUP_DIR, help="каталог снимков (BACKUP_DIR)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    try:
+        if args.command == "create":
+            print(f"✅ {create_snapshot(args.dir)}")
+            for name in rotate_snapshots(args.dir):
+                print(f"🗑 {name}")
+        elif args.command == "list":
+            for name in list_snapshots(args.dir):
+                print(name)
+        else:
+            if not args.snapshot:
+                parser.error("укажите снимок: python backup.py restore snapshot-...")
+            restore_snapshot(args.snapshot, args.dir)
+            print(f"✅ База {storage.DB_PATH} восстановлена из {args.snapshot}")
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
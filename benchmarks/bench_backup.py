@@ -0,0 +1,109 @@
+"""
+Бенчмарк: задержка команд бота во время горячей резервной копии.
+
+Строит базу примерно на --mb мегабайт, затем замеряет задержку «команды»
+(/add + первая страница /list случайного пользователя) без копирования и
+пока backup.create_snapshot() копирует базу по BACKUP_PAGES страниц за шаг.
+
+Запуск:
+    python benchmarks/bench_backup.py                  # база ~256 МБ
+    python benchmarks/bench_backup.py --mb 1024 --pages 256 --sleep 0.005
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+import backup  # noqa: E402
+
+USERS = 10_000
+
+def build_db(path, megabytes):
+    """Синтетическая база: задачи с описаниями ~1 КБ, пока файл не дорастёт до megabytes"""
+    storage.DB_PATH = path
+    storage.init_db()
+    storage.close_writer()
+    storage.close_pool()
+    conn = sqlite3.connect(path)
+    rng = random.Random(42)
+    now = int(time.time())
+    filler = "x" * 1000
+    while os.path.getsize(path) < megabytes * 1024 * 1024:
+        batch = []
+        for i in range(20_000):
+            due_ts = now + rng.randint(-30 * 86400, 365 * 86400)
+            dt = datetime.fromtimestamp(due_ts, timezone.utc).isoformat()
+            batch.append((rng.randrange(USERS), f"Задача {i} {filler}", dt, due_ts))
+        conn.executemany("INSERT INTO tasks (user_id, description, datetime, due_ts) VALUES (?, ?, ?, ?)", batch)
+        conn.commit()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+def measure(stop: threading.Event, seconds: float) -> list:
+    """Задержки команд (мс), пока не выставлен stop или не прошло seconds"""
+    rng = random.Random(1)
+    due = datetime.now(timezone.utc) + timedelta(days=1)
+    latencies = []
+    deadline = time.monotonic() + seconds
+    while not stop.is_set() and time.monotonic() < deadline:
+        user_id = rng.randrange(USERS)
+        start = time.perf_counter()
+        storage.add_task(user_id, "bench", due)
+        storage.get_tasks_page(user_id)
+        latencies.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.002)
+    return latencies
+
+def report(name, latencies):
+    latencies.sort()
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]  # noqa: E731
+    print(f"{name:<18} {len(latencies):>7} {p(0.5):>9.2f} {p(0.99):>9.2f} {latencies[-1]:>9.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=int, default=256)
+    parser.add_argument("--pages", type=int, default=backup.BACKUP_PAGES)
+    parser.add_argument("--sleep", type=float, default=backup.BACKUP_STEP_SLEEP)
+    args = parser.parse_args()
+    backup.BACKUP_PAGES, backup.BACKUP_STEP_SLEEP = args.pages, args.sleep
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        print(f"Строим базу ~{args.mb} МБ...")
+        build_db(path, args.mb)
+        storage.DB_PATH = path
+
+        baseline = measure(threading.Event(), 10)
+
+        done = threading.Event()
+        elapsed = []
+
+        def run_backup():
+            start = time.perf_counter()
+            backup.create_snapshot(os.path.join(tmp, "backups"))
+            elapsed.append(time.perf_counter() - start)
+            done.set()
+
+        thread = threading.Thread(target=run_backup)
+        thread.start()
+        during = measure(done, 3600)
+        thread.join()
+
+        storage.close_writer()
+        storage.close_pool()
+
+    print(f"\nКопия {args.mb} МБ за {elapsed[0]:.1f} с ({args.pages} страниц за шаг, пауза {args.sleep} с)")
+    print(f"{'':<18} {'команд':>7} {'p50, мс':>9} {'p99, мс':>9} {'max, мс':>9}")
+    report("без копирования", baseline)
+    report("во время копии", during)
+
+if __name__ == "__main__":
+    main()
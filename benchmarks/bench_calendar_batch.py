@@ -0,0 +1,126 @@
+"""
+Бенчмарк: создание и удаление событий Google Calendar по одному и batch-запросами.
+
+Вместо Google — поддельный HTTP-транспорт с задержкой RTT на каждый вызов:
+он отвечает на обычные запросы и разбирает multipart batch-запросы так же,
+как сервер Calendar API. Сеть не нужна.
+
+До: один HTTP-вызов на задачу. После: google_calendar.EventBatch, до 50 операций за вызов.
+
+Запуск:
+    python benchmarks/bench_calendar_batch.py               # 200 задач, RTT 30 мс
+    python benchmarks/bench_calendar_batch.py 500 --rtt 80
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from email.parser import Parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httplib2  # noqa: E402
+
+import google_calendar  # noqa: E402
+
+class FakeCalendarHttp:
+    """Поддельный Calendar API: события в памяти, задержка rtt секунд на HTTP-вызов"""
+
+    def __init__(self, rtt):
+        self.rtt = rtt
+        self.calls = 0
+        self.events = set()
+        self._lock = threading.Lock()
+
+    def _handle(self, method, path):
+        """(статус, тело JSON) для одного запроса к /calendar/v3/calendars/primary/events[/id]"""
+        path = path.split("?", 1)[0]
+        with self._lock:
+            if method == "POST":
+                event_id = uuid.uuid4().hex
+                self.events.add(event_id)
+                return 200, {"id": event_id}
+            event_id = path.rsplit("/", 1)[-1]
+            if event_id not in self.events:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            if method == "DELETE":
+                self.events.discard(event_id)
+                return 204, None
+            return 200, {"id": event_id}
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        time.sleep(self.rtt)
+        self.calls += 1
+        if uri.endswith("/batch/calendar/v3"):
+            return self._batch(body, headers)
+        status, data = self._handle(method, uri.split("googleapis.com", 1)[1])
+        content = json.dumps(data).encode() if data is not None else b""
+        return httplib2.Response({"status": status, "content-type": "application/json"}), content
+
+    def _batch(self, body, headers):
+        message = Parser().parsestr(f"content-type: {headers['content-type']}\r\n\r\n{body}")
+        boundary = "batch_response"
+        parts = []
+        for part in message.get_payload():
+            request_line = part.get_payload().splitlines()[0]
+            method, path, _ = request_line.split(" ", 2)
+            status, data = self._handle(method, path)
+            content_id = part["Content-ID"].strip("<>")
+            payload = json.dumps(data) if data is not None else ""
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n\r\n{payload}\r\n"
+            )
+        content = "".join(parts) + f"--{boundary}--"
+        return (httplib2.Response({"status": 200, "content-type": f"multipart/mixed; boundary={boundary}"}),
+                content.encode())
+
+def event(i):
+    return {"summary": f"Задача {i}", "start": {"dateTime": "2026-10-15T12:00:00+03:00"},
+            "end": {"dateTime": "2026-10-15T13:00:00+03:00"}}
+
+def one_by_one(service, tasks):
+    ids = [service.events().insert(calendarId="primary", body=event(i)).execute()["id"] for i in range(tasks)]
+    for event_id in ids:
+        service.events().delete(calendarId="primary", eventId=event_id).execute()
+    return ids
+
+def batched(service, tasks):
+    batch = google_calendar.EventBatch(service)
+    for i in range(tasks):
+        batch.insert(i, event(i))
+    created = batch.execute()
+    ids = {task: response["id"] for task, (response, exception) in created.items() if not exception}
+    for task, event_id in ids.items():
+        batch.delete(task, event_id)
+    deleted = batch.execute()
+    assert all(exception is None for _, exception in deleted.values())
+    return ids
+
+def run(name, func, tasks, rtt):
+    http = FakeCalendarHttp(rtt)
+    service = google_calendar.build_service(http)
+    start = time.perf_counter()
+    ids = func(service, tasks)
+    elapsed = time.perf_counter() - start
+    assert len(ids) == tasks and not http.events
+    print(f"  {name:<12} {elapsed:8.2f} с  HTTP-вызовов: {http.calls}")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("tasks", type=int, nargs="?", default=200)
+    parser.add_argument("--rtt", type=float, default=30, help="задержка HTTP-вызова, мс")
+    args = parser.parse_args()
+
+    print(f"Создать и удалить {args.tasks} событий, RTT {args.rtt:.0f} мс:")
+    before = run("по одному", one_by_one, args.tasks, args.rtt / 1000)
+    after = run("batch", batched, args.tasks, args.rtt / 1000)
+    print(f"  ускорение: x{before / after:.1f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
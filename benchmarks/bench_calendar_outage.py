@@ -0,0 +1,88 @@
+"""
+Бенчмарк: вызовы Google Calendar во время сбоя Google.
+
+Поддельный транспорт (как в bench_calendar_batch.py) сначала отвечает нормально,
+затем на время сбоя — 503 после задержки, затем снова нормально. Сравниваем
+время одного вызова create: голый execute() и google_calendar.execute()
+с повторами и предохранителем. Во время сбоя предохранитель размыкается и
+вызовы сразу получают CircuitOpenError вместо ожидания Google.
+
+Запуск:
+    python benchmarks/bench_calendar_outage.py
+    python benchmarks/bench_calendar_outage.py --calls 600 --slow 200
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httplib2  # noqa: E402
+
+import google_calendar  # noqa: E402
+from bench_calendar_batch import FakeCalendarHttp, event  # noqa: E402
+
+class FlakyCalendarHttp(FakeCalendarHttp):
+    """Во время сбоя (outage=True) каждый вызов ждёт slow секунд и получает 503"""
+
+    def __init__(self, rtt, slow):
+        super().__init__(rtt)
+        self.slow = slow
+        self.outage = False
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        if self.outage:
+            time.sleep(self.slow)
+            self.calls += 1
+            return httplib2.Response({"status": 503, "content-type": "application/json"}), b'{"error": {"code": 503}}'
+        return super().request(uri, method, body, headers, **kwargs)
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def run(name, make_call, calls, rtt, slow, interval):
+    http = FlakyCalendarHttp(rtt, slow)
+    service = google_calendar.build_service(http)
+    events = service.events()
+    timings, errors = [], 0
+    for i in range(calls):
+        # Сбой — средняя треть вызовов
+        http.outage = calls // 3 <= i < 2 * calls // 3
+        started = time.perf_counter()
+        try:
+            make_call(events.insert(calendarId="primary", body=event(i)))
+        except Exception:
+            errors += 1
+        timings.append((time.perf_counter() - started) * 1000)
+        time.sleep(interval)
+    print(f"  {name:<22} {sum(timings) / 1000:7.2f} {percentile(timings, 0.5):8.2f} {percentile(timings, 0.99):8.1f} "
+          f"{errors:>7} {http.calls:>11}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--rtt", type=float, default=20, help="задержка нормального ответа, мс")
+    parser.add_argument("--slow", type=float, default=100, help="задержка ответа 503 во время сбоя, мс")
+    parser.add_argument("--interval", type=float, default=20, help="пауза между вызовами, мс")
+    args = parser.parse_args()
+
+    # Короткие паузы и остывание, чтобы сбой и восстановление уложились в секунды
+    logging.basicConfig(level=logging.ERROR)
+    google_calendar.GOOGLE_BACKOFF, google_calendar.GOOGLE_BACKOFF_MAX = 0.05, 0.2
+    circuit = google_calendar.CircuitBreaker(cooldown=1)
+
+    print(f"{args.calls} вызовов create, сбой (503 через {args.slow:.0f} мс) на средней трети:")
+    print(f"  {'режим':<22} {'всего, с':>7} {'p50, мс':>8} {'p99, мс':>8} {'ошибок':>7} {'HTTP-вызовов':>11}")
+    run("execute()", lambda request: request.execute(), args.calls, args.rtt / 1000, args.slow / 1000, args.interval / 1000)
+    run("повторы+предохранитель",
+        lambda request: google_calendar.call(request.execute, circuit=circuit),
+        args.calls, args.rtt / 1000, args.slow / 1000, args.interval / 1000)
+    print(f"  предохранитель: {circuit.stats()}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Бенчмарк: накладные расходы на сервис Google Calendar в каждом /add.
+
+До: на каждый вызов читаем token.json, создаём Credentials и вызываем
+build("calendar", "v3"). После: один CalendarServiceCache на процесс.
+Сеть не нужна: токен синтетический и действителен ещё час, build() берёт
+discovery-документ из пакета googleapiclient.
+
+Запуск:
+    python benchmarks/bench_calendar_service.py          # 50 вызовов
+    python benchmarks/bench_calendar_service.py --calls 200
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.oauth2.credentials import Credentials  # noqa: E402
+from googleapiclient.discovery import build  # noqa: E402
+
+import google_calendar  # noqa: E402
+
+def write_fake_secrets(directory):
+    """credentials.json и token.json с токеном, который истекает через час"""
+    credentials_file = os.path.join(directory, "credentials.json")
+    token_file = os.path.join(directory, "token.json")
+    with open(credentials_file, "w") as f:
+        json.dump({"installed": {"client_id": "bench", "client_secret": "bench",
+                                 "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+                                 "token_uri": "https://oauth2.googleapis.com/token"}}, f)
+    expiry = (datetime.now(timezone.utc) + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    with open(token_file, "w") as f:
+        json.dump({"token": "bench-token", "refresh_token": "bench-refresh", "client_id": "bench",
+                   "client_secret": "bench", "token_uri": "https://oauth2.googleapis.com/token",
+                   "scopes": google_calendar.SCOPES, "expiry": expiry}, f)
+    return credentials_file, token_file
+
+def uncached_service(token_file):
+    """Старый путь get_google_calendar_service() при действительном токене"""
+    creds = Credentials.from_authorized_user_file(token_file, google_calendar.SCOPES)
+    return build("calendar", "v3", credentials=creds)
+
+def timed(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls * 1000
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=50)
+    args = parser.parse_args()
+    calls = args.calls
+    with tempfile.TemporaryDirectory() as tmp:
+        credentials_file, token_file = write_fake_secrets(tmp)
+        before = timed(lambda: uncached_service(token_file), calls)
+
+        cache = google_calendar.CalendarServiceCache(credentials_file, token_file)
+        start = time.perf_counter()
+        cache.get()
+        first = (time.perf_counter() - start) * 1000
+        after = timed(cache.get, calls * 100)
+
+    print(f"build() на каждый /add:   {before:9.3f} мс на вызов")
+    print(f"кэш, первый вызов:        {first:9.3f} мс")
+    print(f"кэш, следующие вызовы:    {after:9.4f} мс на вызов | x{before / after:.0f}")
+    print(f"статистика кэша: {cache.stats()}")
@@ -0,0 +1,82 @@
+"""
+Бенчмарк: сборка клиента Calendar API при холодном старте.
+
+Каждый режим запускается в отдельном процессе (как первый /add после рестарта
+на Render) и замеряет первую сборку сервиса, затем — повторные сборки в том же
+процессе:
+    network  — build(..., static_discovery=False): discovery-документ качается из сети
+    package  — build(...) с документом из пакета googleapiclient (читается и разбирается каждый раз)
+    bundled  — google_calendar.build_service: документ из discovery/, разобран один раз
+
+Запуск:
+    python benchmarks/bench_discovery.py               # package и bundled, без сети
+    python benchmarks/bench_discovery.py --network     # плюс загрузка документа из сети
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def make_builder(mode):
+    import httplib2
+    from googleapiclient.discovery import build
+    import google_calendar
+
+    if mode == "network":
+        return lambda: build("calendar", "v3", http=httplib2.Http(), static_discovery=False, cache_discovery=False)
+    if mode == "package":
+        return lambda: build("calendar", "v3", http=httplib2.Http(), cache_discovery=False)
+    return lambda: google_calendar.build_service(httplib2.Http())
+
+def run_child(mode, repeats):
+    """Замеры внутри дочернего процесса: импорт, первая сборка, среднее по повторным"""
+    start = time.perf_counter()
+    builder = make_builder(mode)
+    imported = time.perf_counter()
+    builder()
+    first = time.perf_counter()
+    for _ in range(repeats):
+        builder()
+    repeated = (time.perf_counter() - first) / repeats if repeats else 0
+    print(json.dumps({"import_ms": (imported - start) * 1000, "first_ms": (first - imported) * 1000,
+                      "repeat_ms": repeated * 1000}))
+
+def measure(mode, repeats, runs):
+    results = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, __file__, "--child", mode, "--repeats", str(repeats)],
+                             check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    return {key: sorted(r[key] for r in results)[len(results) // 2] for key in results[0]}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--network", action="store_true", help="замерить и загрузку документа из сети")
+    parser.add_argument("--runs", type=int, default=5, help="холодных стартов на режим (берётся медиана)")
+    parser.add_argument("--repeats", type=int, default=20, help="повторных сборок в одном процессе")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.repeats)
+        return 0
+
+    modes = (["network"] if args.network else []) + ["package", "bundled"]
+    print(f"Медиана по {args.runs} холодным стартам, мс:")
+    print(f"  {'режим':<10} {'импорт':>9} {'первая сборка':>14} {'повторная':>10}")
+    for mode in modes:
+        try:
+            r = measure(mode, args.repeats, args.runs)
+        except subprocess.CalledProcessError as e:
+            print(f"  {mode:<10} ошибка: {e.stderr.strip().splitlines()[-1]}")
+            continue
+        print(f"  {mode:<10} {r['import_ms']:>9.1f} {r['first_ms']:>14.2f} {r['repeat_ms']:>10.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
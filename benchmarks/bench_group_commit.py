@@ -0,0 +1,59 @@
+"""
+Бенчмарк: вставки задач с commit на каждую операцию против групповой записи.
+
+Несколько потоков одновременно вызывают storage.add_task — как класс студентов,
+которые разом отправляют /add.
+
+Запуск:
+    python benchmarks/bench_group_commit.py                 # 8 потоков × 500 вставок
+    python benchmarks/bench_group_commit.py --threads 16 --per-thread 1000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+def run(group_commit: bool, threads: int, per_thread: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DB_PATH = os.path.join(tmp, "bench.db")
+        storage.DB_GROUP_COMMIT = group_commit
+        storage.init_db()
+        due = datetime.now(timezone.utc) + timedelta(days=1)
+
+        def worker(n):
+            for i in range(per_thread):
+                storage.add_task(n, f"task {i}", due)
+
+        pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        start = time.perf_counter()
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        storage.close_writer()
+        storage.close_pool()
+    return threads * per_thread / elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--per-thread", type=int, default=500)
+    args = parser.parse_args()
+    threads, per_thread = args.threads, args.per_thread
+    storage.DB_POOL_SIZE = threads
+
+    before = run(False, threads, per_thread)
+    after = run(True, threads, per_thread)
+    print(f"{threads} потоков × {per_thread} вставок")
+    print(f"commit на каждую вставку: {before:8.0f} вставок/с")
+    print(f"групповая запись:         {after:8.0f} вставок/с "
+          f"(пачка до {storage.DB_GROUP_COMMIT_BATCH}, {storage.DB_GROUP_COMMIT_DELAY_MS} мс) | x{after / before:.1f}")
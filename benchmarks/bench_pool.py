@@ -0,0 +1,83 @@
+"""
+Бенчмарк: новое соединение на каждый вызов против общего пула соединений.
+
+Запуск:
+    python benchmarks/bench_pool.py            # 1 000 и 10 000 операций
+    python benchmarks/bench_pool.py --sizes 50000      # свои размеры
+"""
+import os
+import sys
+import time
+import argparse
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    description TEXT,
+    datetime TEXT,
+    google_event_id TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+def op_connect_per_call(path, i):
+    """Старый путь: connect → statement → commit → close"""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    if i % 2:
+        cursor.execute(
+            "INSERT INTO tasks (user_id, description, datetime) VALUES (?, ?, ?)",
+            (i % 100, f"task {i}", "2030-01-01T10:00:00+03:00")
+        )
+        conn.commit()
+    else:
+        cursor.execute("SELECT id FROM tasks WHERE user_id=? LIMIT 10", (i % 100,)).fetchall()
+    conn.close()
+
+def op_pooled(pool, i):
+    """Новый путь: соединение берётся из пула"""
+    with pool.connection() as conn:
+        if i % 2:
+            conn.execute(
+                "INSERT INTO tasks (user_id, description, datetime) VALUES (?, ?, ?)",
+                (i % 100, f"task {i}", "2030-01-01T10:00:00+03:00")
+            )
+        else:
+            conn.execute("SELECT id FROM tasks WHERE user_id=? LIMIT 10", (i % 100,)).fetchall()
+
+def run(ops):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        conn.execute(SCHEMA)
+        conn.commit()
+        conn.close()
+
+        start = time.perf_counter()
+        for i in range(ops):
+            op_connect_per_call(path, i)
+        per_call = time.perf_counter() - start
+
+        pool = storage.ConnectionPool(path, size=4)
+        start = time.perf_counter()
+        for i in range(ops):
+            op_pooled(pool, i)
+        pooled = time.perf_counter() - start
+        pool.close()
+
+    print(f"{ops:>7} операций | connect на вызов: {per_call:7.3f} с ({ops / per_call:8.0f} оп/с)"
+          f" | пул: {pooled:7.3f} с ({ops / pooled:8.0f} оп/с) | ускорение x{per_call / pooled:.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000], help="число операций")
+    args = parser.parse_args()
+    for n in args.sizes:
+        run(n)
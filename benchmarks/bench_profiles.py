@@ -0,0 +1,129 @@
+"""
+Бенчмарк профилей SQLITE_PROFILE на синтетической базе задач.
+
+Строит базу на --tasks задач (по умолчанию 1 000 000) для --users пользователей,
+затем для каждого профиля замеряет:
+  * чтение — первая страница /list (storage.get_tasks_page) у случайного пользователя;
+  * запись — storage.add_task с commit на каждую задачу;
+  * смешанную нагрузку — читатели и писатель в разных потоках одновременно.
+
+Запуск:
+    python benchmarks/bench_profiles.py
+    python benchmarks/bench_profiles.py --tasks 200000 --ops 5000 --keep /tmp/tasks-1m.db
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+def build_db(path, tasks, users):
+    """Синтетическая база: задачи равномерно по пользователям на год вперёд"""
+    storage.DB_PATH = path
+    storage.SQLITE_PROFILE = "fast"
+    storage.init_db()
+    storage.close_pool()
+
+    conn = sqlite3.connect(path)
+    now = int(time.time())
+    rng = random.Random(42)
+    batch = []
+    for i in range(tasks):
+        due_ts = now + rng.randint(-30 * 86400, 365 * 86400)
+        dt = datetime.fromtimestamp(due_ts, timezone.utc).isoformat()
+        batch.append((rng.randrange(users), f"Синтетическая задача {i}", dt, due_ts))
+        if len(batch) == 50_000:
+            conn.executemany("INSERT INTO tasks (user_id, description, datetime, due_ts) VALUES (?, ?, ?, ?)", batch)
+            conn.commit()
+            batch.clear()
+    conn.executemany("INSERT INTO tasks (user_id, description, datetime, due_ts) VALUES (?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+
+def bench_reads(ops, users):
+    rng = random.Random(1)
+    start = time.perf_counter()
+    for _ in range(ops):
+        storage.get_tasks_page(rng.randrange(users))
+    return ops / (time.perf_counter() - start)
+
+def bench_writes(ops, users):
+    rng = random.Random(2)
+    due = datetime.now(timezone.utc) + timedelta(days=1)
+    start = time.perf_counter()
+    for i in range(ops):
+        storage.add_task(rng.randrange(users), f"bench {i}", due)
+    return ops / (time.perf_counter() - start)
+
+def bench_mixed(ops, users, readers=4):
+    """Чтения в нескольких потоках на фоне непрерывной записи"""
+    done = threading.Event()
+    write_count = [0]
+
+    def writer():
+        due = datetime.now(timezone.utc) + timedelta(days=1)
+        while not done.is_set():
+            storage.add_task(0, "mixed", due)
+            write_count[0] += 1
+
+    def reader(seed):
+        rng = random.Random(seed)
+        for _ in range(ops // readers):
+            storage.get_tasks_page(rng.randrange(users))
+
+    w = threading.Thread(target=writer)
+    rs = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    start = time.perf_counter()
+    w.start()
+    for t in rs:
+        t.start()
+    for t in rs:
+        t.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    w.join()
+    return ops / elapsed, write_count[0] / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--ops", type=int, default=2_000)
+    parser.add_argument("--keep", help="путь к базе: переиспользовать/сохранить между запусками")
+    args = parser.parse_args()
+
+    tmp = None
+    path = args.keep
+    if not path:
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, "bench.db")
+    if not os.path.exists(path):
+        print(f"Строим базу: {args.tasks} задач, {args.users} пользователей...")
+        start = time.perf_counter()
+        build_db(path, args.tasks, args.users)
+        print(f"Готово за {time.perf_counter() - start:.1f} с\n")
+
+    storage.DB_PATH = path
+    print(f"{'профиль':<10} {'чтение, оп/с':>14} {'запись, оп/с':>14} {'смеш. чтение':>14} {'смеш. запись':>14}")
+    for profile in storage.PROFILES:
+        storage.SQLITE_PROFILE = profile
+        storage.close_pool()
+        reads = bench_reads(args.ops, args.users)
+        writes = bench_writes(args.ops, args.users)
+        mixed_reads, mixed_writes = bench_mixed(args.ops, args.users)
+        print(f"{profile:<10} {reads:>14.0f} {writes:>14.0f} {mixed_reads:>14.0f} {mixed_writes:>14.0f}")
+    storage.close_pool()
+
+    if tmp:
+        tmp.cleanup()
+
+if __name__ == "__main__":
+    main()
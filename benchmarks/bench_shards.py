@@ -0,0 +1,74 @@
+"""
+Бенчмарк: пропускная способность вставок в зависимости от числа шардов.
+
+Несколько потоков вставляют задачи разных пользователей. По умолчанию групповая
+запись выключена и каждая вставка идёт своим commit: у каждого шарда своя блокировка
+записи и свой fsync, поэтому с ростом числа шардов писатели меньше ждут друг друга.
+С --group-commit (как в боте по умолчанию) пишет по потоку-писателю на шард, и один
+fsync уже покрывает пачку вставок — выигрыш от шардов заметен только при
+тяжёлой записи, когда один писатель не успевает.
+
+Запуск:
+    python benchmarks/bench_shards.py                       # 1, 2, 4, 8 шардов; 16 потоков × 200 вставок
+    python benchmarks/bench_shards.py --shards 1 4 16 --threads 32 --per-thread 500
+    python benchmarks/bench_shards.py --profile balanced    # без fsync на каждый commit
+    python benchmarks/bench_shards.py --group-commit        # потоки-писатели шардов
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+def run(shards: int, threads: int, per_thread: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DB_PATH = os.path.join(tmp, "shards") if shards > 1 else os.path.join(tmp, "bench.db")
+        storage.DB_SHARDS = shards if shards > 1 else 0
+        storage.init_db()
+        due = datetime.now(timezone.utc) + timedelta(days=1)
+
+        def worker(n):
+            for i in range(per_thread):
+                # Пользователи потока разбросаны по шардам, как настоящие user_id
+                storage.add_task(n * per_thread + i, f"task {i}", due)
+
+        pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        start = time.perf_counter()
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        storage.close_writer()
+        storage.close_pool()
+    return threads * per_thread / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--per-thread", type=int, default=200)
+    parser.add_argument("--profile", default="durable", choices=list(storage.PROFILES))
+    parser.add_argument("--group-commit", action="store_true", help="писать через потоки-писатели шардов")
+    args = parser.parse_args()
+
+    storage.DB_GROUP_COMMIT = args.group_commit
+    storage.SQLITE_PROFILE = args.profile
+    storage.DB_POOL_SIZE = args.threads
+    mode = "групповая запись" if args.group_commit else "commit на каждую вставку"
+    print(f"{args.threads} потоков × {args.per_thread} вставок, профиль {args.profile}, {mode}")
+    base = None
+    for shards in args.shards:
+        rate = run(shards, args.threads, args.per_thread)
+        base = base or rate
+        print(f"{shards:>3} шардов: {rate:8.0f} вставок/с | x{rate / base:.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Бенчмарк реализаций TaskStore: SQLite (storage) против хранилища в памяти.
+
+Та же нагрузка, что у обработчиков бота: /add, первая страница /list,
+/today (задачи за сутки) и /delete — на одном и том же наборе пользователей.
+Показывает, сколько стоит диск и SQL по сравнению с чистыми bisect по спискам.
+
+Запуск:
+    python benchmarks/bench_store.py                 # 2 000 операций каждого вида
+    python benchmarks/bench_store.py --ops 20000 --users 1000
+"""
+import os
+import sys
+import time
+import argparse
+import random
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+from task_store import SqliteTaskStore, MemoryTaskStore  # noqa: E402
+
+def run(store, ops, users):
+    """Операций в секунду по видам"""
+    rng = random.Random(42)
+    now = datetime.now(timezone.utc)
+    results = {}
+
+    start = time.perf_counter()
+    ids = []
+    for i in range(ops):
+        user_id = rng.randrange(users)
+        ids.append((user_id, store.add_task(user_id, f"задача {i}", now + timedelta(minutes=rng.randint(1, 7 * 1440)))))
+    results["add"] = ops / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(ops):
+        store.get_tasks_page(rng.randrange(users))
+    results["list"] = ops / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(ops):
+        store.get_tasks_between(rng.randrange(users), now, now + timedelta(days=1))
+    results["today"] = ops / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for user_id, task_id in ids:
+        store.delete_tasks(user_id, [task_id])
+    results["delete"] = ops / (time.perf_counter() - start)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=2_000, help="операций каждого вида")
+    parser.add_argument("--users", type=int, default=100)
+    args = parser.parse_args()
+    ops, users = args.ops, args.users
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DB_PATH = os.path.join(tmp, "bench.db")
+        sqlite_store = SqliteTaskStore()
+        sqlite_store.init_db()
+        stores = {"sqlite": run(sqlite_store, ops, users), "memory": run(MemoryTaskStore(), ops, users)}
+        storage.close_writer()
+        storage.close_pool()
+
+    print(f"{ops} операций, {users} пользователей, оп/с")
+    print(f"{'хранилище':<10}" + "".join(f"{kind:>12}" for kind in stores["sqlite"]))
+    for name, results in stores.items():
+        print(f"{name:<10}" + "".join(f"{rate:>12.0f}" for rate in results.values()))
@@ -0,0 +1,109 @@
+"""
+Бенчмарк: сервис Calendar API для пользователя, привязавшего свой аккаунт (/connect).
+
+До: на каждый вызов читаем зашифрованный refresh token из SQLite, расшифровываем,
+обновляем access token у Google и собираем сервис. После: UserCalendarServices —
+LRU живых credentials и сервисов, горячий пользователь не ходит ни в базу, ни в Google.
+
+Вместо Google — поддельный token endpoint с задержкой RTT. Сеть не нужна.
+
+Запуск:
+    python benchmarks/bench_user_calendars.py                  # 1000 пользователей, 5000 вызовов
+    python benchmarks/bench_user_calendars.py --users 5000 --hot 0.9
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cryptography.fernet import Fernet  # noqa: E402
+from google.oauth2.credentials import Credentials  # noqa: E402
+
+import storage  # noqa: E402
+import google_calendar  # noqa: E402
+from bench_calendar_service import write_fake_secrets  # noqa: E402
+
+class FakeTokenResponse:
+    def __init__(self, data):
+        self.status = 200
+        self.headers = {"content-type": "application/json"}
+        self.data = json.dumps(data).encode()
+
+class FakeTokenEndpoint:
+    """Транспорт google-auth: на обновление токена отвечает новым access token через rtt секунд"""
+    rtt = 0.05
+    calls = 0
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=None, **kwargs):
+        time.sleep(self.rtt)
+        FakeTokenEndpoint.calls += 1
+        return FakeTokenResponse({"access_token": f"token-{FakeTokenEndpoint.calls}", "expires_in": 3600})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--hot", type=float, default=0.8, help="доля вызовов от 10%% самых активных пользователей")
+    parser.add_argument("--rtt", type=float, default=50, help="задержка token endpoint, мс")
+    parser.add_argument("--cache", type=int, default=google_calendar.GOOGLE_USER_CACHE)
+    args = parser.parse_args()
+
+    FakeTokenEndpoint.rtt = args.rtt / 1000
+    google_calendar.TimeoutRequest = FakeTokenEndpoint
+    rng = random.Random(1)
+    hot = max(1, args.users // 10)
+    calls = [rng.randrange(hot) if rng.random() < args.hot else rng.randrange(args.users)
+             for _ in range(args.calls)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DB_PATH = os.path.join(tmp, "bench.db")
+        storage.init_db()
+        credentials_file, _ = write_fake_secrets(tmp)
+        cipher = google_calendar.TokenCipher(Fernet.generate_key().decode())
+        services = google_calendar.UserCalendarServices(credentials_file, cipher, max_entries=args.cache)
+        for user_id in range(args.users):
+            creds = Credentials("token", refresh_token=f"refresh-{user_id}", token_uri="https://oauth2.googleapis.com/token",
+                                client_id="bench", client_secret="bench", scopes=google_calendar.SCOPES)
+            storage.save_google_account(user_id, cipher.encrypt(creds.refresh_token), " ".join(creds.scopes))
+
+        # До: без LRU — каждый вызов как первый
+        uncached = google_calendar.UserCalendarServices(credentials_file, cipher, max_entries=0)
+        sample = calls[:max(1, args.calls // 20)]
+        start = time.perf_counter()
+        for user_id in sample:
+            assert uncached.get(user_id) is not None
+        before = (time.perf_counter() - start) / len(sample) * 1000
+
+        FakeTokenEndpoint.calls = 0
+        start = time.perf_counter()
+        for user_id in calls:
+            assert services.get(user_id) is not None
+        after = (time.perf_counter() - start) / len(calls) * 1000
+        refreshes = FakeTokenEndpoint.calls
+
+        # Через час токены горячих пользователей подходят к истечению — обновление только у них
+        for creds, _ in list(services._entries.values()):
+            creds.expiry -= timedelta(minutes=58)
+        FakeTokenEndpoint.calls = 0
+        for user_id in calls[:500]:
+            services.get(user_id)
+        storage.close_writer()
+        storage.close_pool()
+
+    print(f"{args.users} пользователей, {args.calls} вызовов ({args.hot:.0%} от 10% активных), "
+          f"token endpoint {args.rtt:.0f} мс, LRU на {args.cache}:")
+    print(f"  без LRU:  {before:8.2f} мс на вызов")
+    print(f"  LRU:      {after:8.3f} мс на вызов | x{before / after:.0f}, обновлений токена: {refreshes}")
+    print(f"  после истечения токенов: обновлений {FakeTokenEndpoint.calls} на 500 вызовов")
+    print(f"  статистика LRU: {services.stats()}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""
+Регрессионная проверка планов запросов и времени выполнения storage.
+
+Строит синтетическую базу (по умолчанию 100 000 пользователей и 5 000 000 задач),
+вызывает функции storage и перехватывает SQL, который они реально выполняют
+(set_trace_callback на каждом соединении). Для каждого запроса проверяется
+EXPLAIN QUERY PLAN: нужный индекс, без полного сканирования таблицы и без
+временного B-дерева для ORDER BY. Затем замеряется время вызовов и сравнивается
+с бюджетом из query_budget.json (p95 в миллисекундах).
+
+Код возврата 1, если план или время вышли за рамки — скрипт можно запускать в CI.
+Планы без замеров времени (включая claim_outbox) проверяет tests/test_query_plans.py.
+
+Запуск:
+    python benchmarks/check_query_plans.py
+    python benchmarks/check_query_plans.py --users 10000 --tasks 500000     # быстрая проверка
+    python benchmarks/check_query_plans.py --keep /tmp/plans-5m.db          # база переиспользуется
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_budget.json")
+
+# Функция → (обязательные фрагменты плана, запрещённые фрагменты)
+EXPECTED_PLANS = {
+    "get_tasks": (["SEARCH tasks USING INDEX idx_tasks_user_due (user_id=? AND due_ts>?)"],
+                  ["SCAN tasks", "TEMP B-TREE"]),
+    "get_tasks_page": (["SEARCH tasks USING INDEX idx_tasks_user_due (user_id=? AND due_ts>?)"],
+                       ["SCAN tasks", "TEMP B-TREE"]),
+    "get_tasks_between": (["SEARCH tasks USING INDEX idx_tasks_user_due (user_id=? AND due_ts>? AND due_ts<?)"],
+                          ["SCAN tasks", "TEMP B-TREE"]),
+    "get_task_by_id": (["SEARCH tasks USING INTEGER PRIMARY KEY (rowid=?)"],
+                       ["SCAN tasks"]),
+    "delete_task": (["SEARCH tasks USING INTEGER PRIMARY KEY (rowid=?)"],
+                    ["SCAN tasks"]),
+}
+
+def build_db(path, users, tasks):
+    """Синтетическая база: задачи равномерно по пользователям, от месяца назад до года вперёд"""
+    storage.DB_PATH = path
+    storage.SQLITE_PROFILE = "fast"
+    storage.init_db()
+    storage.close_writer()
+    storage.close_pool()
+
+    conn = sqlite3.connect(path)
+    storage.apply_profile(conn, "fast")
+    # Триггеры FTS на время загрузки снимаем: индекс один раз перестраивается в конце
+    triggers = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type='trigger' AND tbl_name='tasks'"
+    ).fetchall()
+    for name, _ in triggers:
+        conn.execute(f"DROP TRIGGER {name}")
+    now = int(time.time())
+    rng = random.Random(42)
+    for start in range(0, tasks, 100_000):
+        batch = []
+        for i in range(start, min(start + 100_000, tasks)):
+            due_ts = now + rng.randint(-30 * 86400, 365 * 86400)
+            dt = datetime.fromtimestamp(due_ts, timezone.utc).isoformat()
+            batch.append((rng.randrange(users), f"Синтетическая задача {i}", dt, due_ts))
+        conn.executemany("INSERT INTO tasks (user_id, description, datetime, due_ts) VALUES (?, ?, ?, ?)", batch)
+        conn.commit()
+    for _, sql in triggers:
+        conn.execute(sql)
+    if triggers:
+        conn.execute("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')")
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+class StatementLog:
+    """Собирает SQL, выполненный на соединениях storage, пока включён"""
+
+    def __init__(self):
+        self.statements = []
+        self.active = False
+
+    def __call__(self, sql):
+        # Служебные запросы FTS5 к теневым таблицам tasks_fts_* не наши
+        if "tasks_fts_" in sql:
+            return
+        if self.active and sql.lstrip().split(" ", 1)[0].upper() in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+            self.statements.append(sql)
+
+    def capture(self, func, *args):
+        self.statements = []
+        self.active = True
+        try:
+            result = func(*args)
+            if hasattr(result, "__next__"):
+                list(result)
+        finally:
+            self.active = False
+        return self.statements
+
+def install_trace(log):
+    """Каждое новое соединение storage (пулы и поток-писатель) пишет SQL в log"""
+    apply_profile = storage.apply_profile
+
+    def traced(conn, profile=None):
+        conn.set_trace_callback(log)
+        return apply_profile(conn, profile)
+    storage.apply_profile = traced
+
+def query_plan(conn, sql) -> list:
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+def calls(users, tasks, now):
+    """Вызовы storage для проверки: имя → функция от генератора случайных чисел"""
+    tz = timezone.utc
+    start = datetime.fromtimestamp(now, tz) + timedelta(days=1)
+    return {
+        "get_tasks": lambda rng: storage.get_tasks(rng.randrange(users), now),
+        "get_tasks_page": lambda rng: storage.get_tasks_page(rng.randrange(users), (now + 86400, 0), now_ts=now),
+        "get_tasks_between": lambda rng: storage.get_tasks_between(
+            rng.randrange(users), start, start + timedelta(days=7), now),
+        "get_task_by_id": lambda rng: storage.get_task_by_id(rng.randrange(1, tasks), rng.randrange(users)),
+        "delete_task": lambda rng: storage.delete_task(rng.randrange(1, tasks), rng.randrange(users)),
+    }
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--tasks", type=int, default=5_000_000)
+    parser.add_argument("--runs", type=int, default=500, help="вызовов каждой функции для замера времени")
+    parser.add_argument("--keep", help="путь к базе: переиспользовать/сохранить между запусками")
+    parser.add_argument("--budget", default=BUDGET_FILE)
+    args = parser.parse_args()
+
+    tmp = None
+    path = args.keep
+    if not path:
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, "plans.db")
+    if not os.path.exists(path):
+        print(f"Строим базу: {args.users} пользователей, {args.tasks} задач...")
+        started = time.perf_counter()
+        build_db(path, args.users, args.tasks)
+        print(f"Готово за {time.perf_counter() - started:.1f} с\n")
+
+    with open(args.budget) as f:
+        budget = json.load(f)
+
+    log = StatementLog()
+    install_trace(log)
+    storage.DB_PATH = path
+    storage.SQLITE_PROFILE = "balanced"
+    storage.upcoming_cache.max_entries = 0      # проверяем SQL, а не кэш
+    now = int(time.time())
+    checks = calls(args.users, args.tasks, now)
+    failures = []
+
+    plan_conn = sqlite3.connect(path)
+    print("Планы запросов:")
+    for name, call in checks.items():
+        required, forbidden = EXPECTED_PLANS[name]
+        statements = log.capture(call, random.Random(0))
+        if not statements:
+            failures.append(f"{name}: не выполнил ни одного запроса")
+            continue
+        plan = [line for sql in statements for line in query_plan(plan_conn, sql)]
+        missing = [fragment for fragment in required if not any(fragment in line for line in plan)]
+        present = [fragment for fragment in forbidden if any(fragment in line for line in plan)]
+        ok = not missing and not present
+        print(f"  {'✅' if ok else '❌'} {name}: {' | '.join(plan)}")
+        if missing:
+            failures.append(f"{name}: в плане нет {missing}")
+        if present:
+            failures.append(f"{name}: в плане есть {present}")
+    plan_conn.close()
+
+    print(f"\nВремя ({args.runs} вызовов), мс:")
+    print(f"  {'функция':<20} {'p50':>8} {'p95':>8} {'бюджет p95':>11}")
+    for name, call in checks.items():
+        rng = random.Random(1)
+        timings = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            call(rng)
+            timings.append((time.perf_counter() - started) * 1000)
+        p95 = percentile(timings, 0.95)
+        limit = budget.get(name, {}).get("p95_ms")
+        ok = limit is None or p95 <= limit
+        print(f"  {name:<20} {percentile(timings, 0.5):>8.3f} {p95:>8.3f} {limit if limit is not None else '—':>11} "
+              f"{'' if ok else '❌'}")
+        if not ok:
+            failures.append(f"{name}: p95 {p95:.3f} мс > бюджета {limit} мс")
+
+    storage.close_writer()
+    storage.close_pool()
+    if tmp:
+        tmp.cleanup()
+
+    if failures:
+        print("\n❌ Регрессии:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print("\n✅ Планы и время в пределах бюджета")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
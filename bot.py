@@ -1,18 +1,22 @@
 import os
 import logging
-import sqlite3
+import tempfile
 from datetime import datetime, timedelta
 import pytz
 from dotenv import load_dotenv
 
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Updater, CommandHandler, CallbackContext
+from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import Updater, CommandHandler, CallbackQueryHandler, MessageHandler, Filters, CallbackContext
+
+import backup
+import storage
+import task_io
+from task_store import TaskStore, SqliteTaskStore
 
 # ================== НАСТРОЙКИ ==================
 load_dotenv()
 
 TOKEN = os.getenv("TELEGRAM_TOKEN")
-DB_PATH = os.getenv("DATABASE_PATH", "tasks.db")
 TIMEZONE = os.getenv("TIMEZONE", "Europe/Moscow")
 
 logging.basicConfig(
@@ -22,71 +26,75 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # ================== БАЗА ДАННЫХ ==================
+# Хранилище задач; тесты и бенчмарки подменяют его через use_store(MemoryTaskStore())
+store: TaskStore = SqliteTaskStore()
+
+def use_store(new_store: TaskStore):
+    global store
+    store = new_store
+
 def init_db():
-    """Инициализация базы данных SQLite"""
+    """Инициализация хранилища задач"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS tasks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            description TEXT,
-            datetime TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """)
-        conn.commit()
-        conn.close()
-        logger.info("База данных инициализирована")
+        version = store.init_db()
+        logger.info(f"База данных инициализирована (версия схемы {version})")
     except Exception as e:
         logger.error(f"Ошибка инициализации БД: {e}")
 
 def add_task(user_id: int, description: str, dt: datetime):
     """Добавление задачи в базу данных"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO tasks (user_id, description, datetime) VALUES (?, ?, ?)",
-            (user_id, description, dt.isoformat())
-        )
-        task_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return task_id
+        return store.add_task(user_id, description, dt)
     except Exception as e:
         logger.error(f"Ошибка добавления задачи: {e}")
         return None
 
-def get_tasks(user_id: int):
-    """Получение всех задач пользователя"""
+def get_tasks_page(user_id: int, after=None):
+    """Получение одной страницы предстоящих задач: (задачи, курсор следующей страницы)"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, description, datetime FROM tasks WHERE user_id=? AND datetime > ? ORDER BY datetime",
-            (user_id, datetime.now().isoformat())
-        )
-        rows = cursor.fetchall()
-        conn.close()
-        return rows
+        return store.get_tasks_page(user_id, after)
     except Exception as e:
         logger.error(f"Ошибка получения задач: {e}")
+        return [], None
+
+def delete_tasks(user_id: int, target):
+    """
+    Удаление задач: target — список ID или "past". Возвращает ID удалённых задач.
+    Календарём этот бот не занимается, но база может быть общей с simple_bot.py: удаление
+    созданных им событий (и отмена ещё не созданных) уходит в тот же outbox
+    """
+    try:
+        if target == "past":
+            deleted = store.delete_past_tasks(user_id, sync_calendar=True)
+        else:
+            deleted = store.delete_tasks(user_id, target, sync_calendar=True)
+        return [task_id for task_id, _ in deleted]
+    except Exception as e:
+        logger.error(f"Ошибка удаления задач: {e}")
         return []
 
-def delete_task(task_id: int, user_id: int):
-    """Удаление задачи по ID"""
+def get_tasks_between(user_id: int, start: datetime, end: datetime):
+    """Получение задач пользователя в интервале [start, end)"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM tasks WHERE id=? AND user_id=?", (task_id, user_id))
-        conn.commit()
-        conn.close()
-        return True
+        return store.get_tasks_between(user_id, start, end)
     except Exception as e:
-        logger.error(f"Ошибка удаления задачи: {e}")
-        return False
+        logger.error(f"Ошибка получения задач за период: {e}")
+        return []
+
+def local_dt(due_ts: int) -> datetime:
+    """Время задачи (секунды UTC) в настроенном часовом поясе"""
+    return datetime.fromtimestamp(due_ts, pytz.timezone(TIMEZONE))
+
+def day_window(days_ahead: int, days: int = 1):
+    """
+    Границы суток в настроенном часовом поясе:
+    [начало дня через days_ahead дней, начало дня через days_ahead + days дней)
+    """
+    tz = pytz.timezone(TIMEZONE)
+    today = datetime.now(tz).date()
+    start = tz.localize(datetime.combine(today + timedelta(days=days_ahead), datetime.min.time()))
+    end = tz.localize(datetime.combine(today + timedelta(days=days_ahead + days), datetime.min.time()))
+    return start, end
 
 # ================== ПРОСТОЙ ПАРСИНГ ДАТ ==================
 def parse_datetime(date_str: str, time_str: str) -> datetime:
@@ -163,8 +171,8 @@ def start(update: Update, context: CallbackContext):
     try:
         keyboard = [
             [KeyboardButton("/add"), KeyboardButton("/list")],
-            [KeyboardButton("/today"), KeyboardButton("/delete")],
-            [KeyboardButton("/help")]
+            [KeyboardButton("/today"), KeyboardButton("/tomorrow"), KeyboardButton("/week")],
+            [KeyboardButton("/delete"), KeyboardButton("/help")]
         ]
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
         
@@ -175,6 +183,8 @@ def start(update: Update, context: CallbackContext):
 /add - Добавить задачу
 /list - Все задачи  
 /today - Задачи на сегодня
+/tomorrow - Задачи на завтра
+/week - Задачи на неделю
 /delete - Удалить задачу
 /help - Помощь
 
@@ -205,7 +215,13 @@ def help_command(update: Update, context: CallbackContext):
 
 /list - Все задачи
 /today - Задачи на сегодня  
-/delete - Удалить задачу
+/tomorrow - Задачи на завтра
+/week - Задачи на неделю
+/find - Поиск задач по словам
+/edit - Изменить задачу (/edit 5 Новое описание, /edit 5 пн 14.30)
+/delete - Удалить задачу (/delete 3 5 7, /delete 10-25, /delete past)
+/import - Загрузить задачи из CSV/JSON
+/export - Выгрузить задачи (csv, jsonl, ics)
 /help - Помощь
 
 📅 **Форматы дат:**
@@ -257,108 +273,252 @@ def add_command(update: Update, context: CallbackContext):
         logger.error(f"Ошибка в команде /add: {e}")
         update.message.reply_text("❌ Ошибка при добавлении задачи. Проверьте формат.")
 
+def edit_command(update: Update, context: CallbackContext):
+    """Обработчик команды /edit ID [дата время] [описание]"""
+    try:
+        try:
+            task_id, description, dt = task_io.parse_edit_args(" ".join(context.args or []), parse_datetime)
+        except ValueError as e:
+            update.message.reply_text(f"❌ {e}")
+            return
+
+        user_id = update.message.from_user.id
+        if not store.update_task(task_id, user_id, description, dt):
+            update.message.reply_text(f"❌ Задача {task_id} не найдена!")
+            return
+
+        task = store.get_task_by_id(task_id, user_id)
+        update.message.reply_text(
+            f"✏️ **Задача {task_id} изменена**\n\n📝 {task[1]}\n🕐 {local_dt(task[2]).strftime('%d.%m.%Y в %H:%M')}"
+        )
+
+    except Exception as e:
+        logger.error(f"Ошибка в команде /edit: {e}")
+        update.message.reply_text("❌ Ошибка при изменении задачи.")
+
+def render_page(kind: str, user_id: int, after=None):
+    """
+    Текст и inline-кнопка «Далее» для одной страницы задач.
+    kind: "list" — список задач, "del" — выбор задачи для удаления.
+    Курсор следующей страницы хранится прямо в callback_data: kind:due_ts:id
+    """
+    tasks, next_cursor = get_tasks_page(user_id, after)
+    if not tasks:
+        return None, None
+
+    if kind == "del":
+        message = "🗑 **Выберите задачу для удаления:**\n\n"
+        for task_id, description, due_ts, _ in tasks:
+            message += f"/{task_id} - {description}\n   {local_dt(due_ts).strftime('%d.%m.%Y %H:%M')}\n\n"
+        message += "Используйте /delete номер или нажмите на команду выше"
+    else:
+        message = "📋 **Ваши задачи:**\n\n"
+        for task_id, description, due_ts, _ in tasks:
+            message += f"{task_id:2d}. {description}\n   🕐 {local_dt(due_ts).strftime('%d.%m.%Y %H:%M')}\n\n"
+        message += "\nИспользуйте /delete номер чтобы удалить задачу"
+
+    reply_markup = None
+    if next_cursor:
+        button = InlineKeyboardButton("Далее ▶️", callback_data=f"{kind}:{next_cursor[0]}:{next_cursor[1]}")
+        reply_markup = InlineKeyboardMarkup([[button]])
+    return message, reply_markup
+
 def list_command(update: Update, context: CallbackContext):
     """Обработчик команды /list"""
     try:
-        tasks = get_tasks(update.message.from_user.id)
-        
-        if not tasks:
+        message, reply_markup = render_page("list", update.message.from_user.id)
+
+        if not message:
             update.message.reply_text("📭 У вас пока нет предстоящих задач.")
             return
 
-        message = "📋 **Ваши задачи:**\n\n"
-        for task_id, description, dt_str in tasks:
-            dt = datetime.fromisoformat(dt_str)
-            message += f"{task_id:2d}. {description}\n   🕐 {dt.strftime('%d.%m.%Y %H:%M')}\n\n"
-
-        message += "\nИспользуйте /delete номер чтобы удалить задачу"
-        update.message.reply_text(message)
+        update.message.reply_text(message, reply_markup=reply_markup)
         
     except Exception as e:
         logger.error(f"Ошибка в команде /list: {e}")
         update.message.reply_text("❌ Ошибка при получении задач.")
 
+def page_callback(update: Update, context: CallbackContext):
+    """Обработчик кнопки «Далее» в /list и /delete"""
+    query = update.callback_query
+    try:
+        kind, due_ts, task_id = query.data.split(":")
+        message, reply_markup = render_page(kind, query.from_user.id, (int(due_ts), int(task_id)))
+        query.answer()
+        if message:
+            query.edit_message_text(message, reply_markup=reply_markup)
+        else:
+            query.edit_message_text("📭 Больше задач нет.")
+    except Exception as e:
+        logger.error(f"Ошибка при переключении страницы: {e}")
+        query.answer("❌ Ошибка при получении задач.")
+
+def send_period_tasks(update: Update, title: str, start: datetime, end: datetime, show_date: bool):
+    """Отправляем задачи из окна [start, end) — фильтрация делается в SQL"""
+    tasks = get_tasks_between(update.message.from_user.id, start, end)
+
+    if not tasks:
+        update.message.reply_text(f"🎉 {title}: задач нет!")
+        return
+
+    message = f"📅 **{title}:**\n\n"
+    for task_id, description, due_ts, _ in tasks:
+        dt = local_dt(due_ts)
+        time_str = dt.strftime('%d.%m.%Y %H:%M' if show_date else '%H:%M')
+        message += f"{task_id:2d}. {description}\n   🕐 {time_str}\n\n"
+
+    update.message.reply_text(message)
+
 def today_command(update: Update, context: CallbackContext):
     """Обработчик команды /today"""
     try:
-        tasks = get_tasks(update.message.from_user.id)
-        
-        if not tasks:
-            update.message.reply_text("📭 На сегодня задач нет!")
+        now = datetime.now(pytz.timezone(TIMEZONE))
+        _, end = day_window(0)
+        send_period_tasks(update, f"Задачи на сегодня ({now.strftime('%d.%m.%Y')})", now, end, show_date=False)
+    except Exception as e:
+        logger.error(f"Ошибка в команде /today: {e}")
+        update.message.reply_text("❌ Ошибка при получении задач на сегодня.")
+
+def tomorrow_command(update: Update, context: CallbackContext):
+    """Обработчик команды /tomorrow"""
+    try:
+        start, end = day_window(1)
+        send_period_tasks(update, f"Задачи на завтра ({start.strftime('%d.%m.%Y')})", start, end, show_date=False)
+    except Exception as e:
+        logger.error(f"Ошибка в команде /tomorrow: {e}")
+        update.message.reply_text("❌ Ошибка при получении задач на завтра.")
+
+def week_command(update: Update, context: CallbackContext):
+    """Обработчик команды /week — ближайшие 7 дней, начиная с сегодняшнего"""
+    try:
+        now = datetime.now(pytz.timezone(TIMEZONE))
+        _, end = day_window(0, days=7)
+        send_period_tasks(update, "Задачи на неделю", now, end, show_date=True)
+    except Exception as e:
+        logger.error(f"Ошибка в команде /week: {e}")
+        update.message.reply_text("❌ Ошибка при получении задач на неделю.")
+
+def find_command(update: Update, context: CallbackContext):
+    """Обработчик команды /find — полнотекстовый поиск по описаниям задач"""
+    try:
+        if not context.args:
+            update.message.reply_text("🔍 Используйте: /find слова для поиска\n\nПример: /find встреча")
             return
 
-        tz = pytz.timezone(TIMEZONE)
-        today = datetime.now(tz).date()
-        
-        today_tasks = []
-        for task in tasks:
-            task_id, description, dt_str = task
-            dt = datetime.fromisoformat(dt_str)
-            if dt.date() == today:
-                today_tasks.append(task)
-
-        if not today_tasks:
-            update.message.reply_text("🎉 На сегодня задач нет!")
+        tasks = store.search_tasks(update.message.from_user.id, " ".join(context.args))
+
+        if not tasks:
+            update.message.reply_text("🔍 Ничего не найдено.")
             return
 
-        today_str = today.strftime('%d.%m.%Y')
-        message = f"📅 **Задачи на сегодня ({today_str}):**\n\n"
-        
-        for task_id, description, dt_str in today_tasks:
-            dt = datetime.fromisoformat(dt_str)
-            time_str = dt.strftime('%H:%M')
-            message += f"{task_id:2d}. {description}\n   🕐 {time_str}\n\n"
+        message = "🔍 **Найденные задачи:**\n\n"
+        for task_id, description, due_ts, _ in tasks:
+            message += f"{task_id:2d}. {description}\n   🕐 {local_dt(due_ts).strftime('%d.%m.%Y %H:%M')}\n\n"
 
         update.message.reply_text(message)
-        
+
     except Exception as e:
-        logger.error(f"Ошибка в команде /today: {e}")
-        update.message.reply_text("❌ Ошибка при получении задач на сегодня.")
+        logger.error(f"Ошибка в команде /find: {e}")
+        update.message.reply_text("❌ Ошибка при поиске задач.")
 
 def delete_command(update: Update, context: CallbackContext):
     """Обработчик команды /delete"""
     try:
         if not context.args:
-            # Показываем список задач для удаления
-            tasks = get_tasks(update.message.from_user.id)
+            # Показываем первую страницу задач для удаления
+            message, reply_markup = render_page("del", update.message.from_user.id)
             
-            if not tasks:
+            if not message:
                 update.message.reply_text("📭 Нет задач для удаления.")
                 return
 
-            message = "🗑 **Выберите задачу для удаления:**\n\n"
-            for task_id, description, dt_str in tasks[:10]:
-                dt = datetime.fromisoformat(dt_str)
-                message += f"/{task_id} - {description}\n   {dt.strftime('%d.%m.%Y %H:%M')}\n\n"
-            
-            message += "Используйте /delete номер или нажмите на команду выше"
-            update.message.reply_text(message)
+            update.message.reply_text(message, reply_markup=reply_markup)
             return
 
         try:
-            task_id = int(context.args[0])
-        except ValueError:
-            update.message.reply_text("❌ ID задачи должен быть числом!")
+            target = task_io.parse_delete_args(" ".join(context.args))
+        except ValueError as e:
+            update.message.reply_text(f"❌ {e}")
             return
 
-        # Удаляем задачу
-        success = delete_task(task_id, update.message.from_user.id)
+        # Удаляем все задачи одним запросом
+        deleted = delete_tasks(update.message.from_user.id, target)
         
-        if success:
-            update.message.reply_text(f"✅ Задача {task_id} удалена!")
+        if not deleted:
+            update.message.reply_text("❌ Задачи не найдены!")
+        elif len(deleted) == 1:
+            update.message.reply_text(f"✅ Задача {deleted[0]} удалена!")
         else:
-            update.message.reply_text("❌ Задача не найдена!")
+            update.message.reply_text(f"✅ Удалено задач: {len(deleted)}")
             
     except Exception as e:
         logger.error(f"Ошибка в команде /delete: {e}")
         update.message.reply_text("❌ Ошибка при удалении задачи.")
 
+def import_command(update: Update, context: CallbackContext):
+    """Обработчик команды /import — ждём файл с задачами"""
+    context.user_data["awaiting_import"] = True
+    update.message.reply_text(
+        "📥 **Импорт задач**\n\n"
+        "Пришлите файл .csv, .json или .jsonl с колонками description, date, time "
+        "(как в /add) или description, datetime (ISO 8601).\n\n"
+        "**Пример CSV:**\n"
+        "description,date,time\n"
+        "Встреча,пн,14.30"
+    )
+
+def import_document(update: Update, context: CallbackContext):
+    """Загрузка файла после /import (или с подписью /import)"""
+    caption = (update.message.caption or "").strip()
+    if not context.user_data.pop("awaiting_import", False) and not caption.startswith("/import"):
+        return
+    try:
+        document = update.message.document
+        if document.file_size and document.file_size > task_io.IMPORT_MAX_BYTES:
+            update.message.reply_text(f"❌ Файл больше {task_io.IMPORT_MAX_BYTES // (1024 * 1024)} МБ")
+            return
+
+        # Небольшие файлы остаются в памяти, большие уходят на диск
+        with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as buffer:
+            document.get_file().download(out=buffer)
+            buffer.seek(0)
+            batches, errors = task_io.read_import(buffer, document.file_name, parse_datetime, pytz.timezone(TIMEZONE))
+
+        task_ids = store.import_tasks(update.message.from_user.id, batches)
+        update.message.reply_text(task_io.format_import_report(len(task_ids), errors))
+
+    except ValueError as e:
+        update.message.reply_text(f"❌ {e}")
+    except Exception as e:
+        logger.error(f"Ошибка импорта: {e}")
+        update.message.reply_text("❌ Ошибка при импорте задач.")
+
+def export_command(update: Update, context: CallbackContext):
+    """Обработчик команды /export [csv|jsonl|ics]"""
+    try:
+        fmt = context.args[0].lower() if context.args else "csv"
+        if fmt not in task_io.EXPORT_FORMATS:
+            update.message.reply_text("❌ Используйте: /export csv, /export jsonl или /export ics")
+            return
+
+        rows = store.iter_tasks(update.message.from_user.id)
+        with task_io.spool_export(rows, fmt, pytz.timezone(TIMEZONE)) as buffer:
+            update.message.reply_document(document=buffer, filename=task_io.export_filename(fmt),
+                                          caption="📤 Ваши задачи")
+
+    except Exception as e:
+        logger.error(f"Ошибка экспорта: {e}")
+        update.message.reply_text("❌ Ошибка при экспорте задач.")
+
 # ================== ЗАПУСК БОТА ==================
 def main():
     """Основная функция запуска бота"""
     try:
-        # Инициализация базы данных
+        # Инициализация базы данных и фоновое архивирование прошедших задач
         init_db()
+        if isinstance(store, SqliteTaskStore):
+            storage.start_maintenance()
+            backup.start_backups()
         
         # Создание updater
         updater = Updater(TOKEN, use_context=True)
@@ -372,7 +532,15 @@ def main():
         dp.add_handler(CommandHandler("add", add_command))
         dp.add_handler(CommandHandler("list", list_command))
         dp.add_handler(CommandHandler("today", today_command))
+        dp.add_handler(CommandHandler("tomorrow", tomorrow_command))
+        dp.add_handler(CommandHandler("week", week_command))
+        dp.add_handler(CommandHandler("find", find_command))
+        dp.add_handler(CommandHandler("edit", edit_command))
         dp.add_handler(CommandHandler("delete", delete_command))
+        dp.add_handler(CommandHandler("import", import_command))
+        dp.add_handler(CommandHandler("export", export_command))
+        dp.add_handler(CallbackQueryHandler(page_callback, pattern=r"^(list|del):"))
+        dp.add_handler(MessageHandler(Filters.document, import_document))
         
         # Запуск бота
         updater.start_polling()
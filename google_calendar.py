@@ -0,0 +1,692 @@
+import os
+import hmac
+import json
+import time
+import hashlib
+import random
+import secrets
+import socket
+import logging
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+
+import httplib2
+import google_auth_httplib2
+import google.auth.exceptions
+from google.oauth2.credentials import Credentials
+from google.auth.transport.requests import Request
+from google_auth_oauthlib.flow import Flow, InstalledAppFlow
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
+
+import storage
+import task_io
+
+# ================== НАСТРОЙКИ ==================
+SCOPES = ['https://www.googleapis.com/auth/calendar']
+GOOGLE_REFRESH_MARGIN = int(os.getenv("GOOGLE_REFRESH_MARGIN", "300"))   # обновлять токен за N секунд до истечения
+CALENDAR_BATCH_SIZE = 50   # максимум запросов в одном batch-запросе Calendar API
+
+# Устойчивость вызовов Google: таймаут HTTP-вызова, повторы с паузой и предохранитель
+GOOGLE_TIMEOUT = float(os.getenv("GOOGLE_TIMEOUT", "10"))                  # секунд на один HTTP-вызов
+GOOGLE_RETRIES = int(os.getenv("GOOGLE_RETRIES", "3"))                     # повторов временных ошибок
+GOOGLE_BACKOFF = float(os.getenv("GOOGLE_BACKOFF", "0.5"))                 # первая пауза, секунд
+GOOGLE_BACKOFF_MAX = float(os.getenv("GOOGLE_BACKOFF_MAX", "8"))
+GOOGLE_DEADLINE = float(os.getenv("GOOGLE_DEADLINE", "30"))                # на вызов вместе с повторами
+BREAKER_WINDOW = int(os.getenv("GOOGLE_BREAKER_WINDOW", "20"))             # последних исходов в окне
+BREAKER_MIN_CALLS = int(os.getenv("GOOGLE_BREAKER_MIN_CALLS", "5"))
+BREAKER_ERROR_RATE = float(os.getenv("GOOGLE_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_COOLDOWN = float(os.getenv("GOOGLE_BREAKER_COOLDOWN", "30"))       # секунд до пробного вызова
+
+# Календари пользователей (/connect)
+GOOGLE_TOKEN_KEY = os.getenv("GOOGLE_TOKEN_KEY", "")              # ключи Fernet через запятую, первым шифруем
+GOOGLE_USER_CACHE = int(os.getenv("GOOGLE_USER_CACHE", "256"))    # живых сервисов пользователей в памяти
+GOOGLE_UNLINKED_CACHE = int(os.getenv("GOOGLE_UNLINKED_CACHE", "10000"))   # пользователей без привязки в памяти
+OAUTH_STATE_TTL = int(os.getenv("OAUTH_STATE_TTL", "600"))        # секунд на прохождение /connect
+
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+# Discovery-документ Calendar v3 лежит в репозитории: клиент собирается без сети
+DISCOVERY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "discovery", "calendar.v3.json")
+
+logger = logging.getLogger(__name__)
+
+# ================== DISCOVERY-ДОКУМЕНТ ==================
+_discovery = None
+_discovery_lock = threading.Lock()
+
+def discovery_document() -> dict:
+    """
+    Разобранный discovery-документ Calendar v3 (читается один раз на процесс).
+    Если файла нет, берём копию, встроенную в googleapiclient.
+    """
+    global _discovery
+    if _discovery is None:
+        with _discovery_lock:
+            if _discovery is None:
+                if os.path.exists(DISCOVERY_FILE):
+                    with open(DISCOVERY_FILE, encoding="utf-8") as f:
+                        _discovery = json.load(f)
+                else:
+                    logger.warning(f"{DISCOVERY_FILE} не найден, используется документ из googleapiclient")
+                    _discovery = json.loads(discovery_cache.get_static_doc("calendar", "v3"))
+    return _discovery
+
+def build_service(http):
+    """Клиент Calendar API из закэшированного discovery-документа — без сети и повторного разбора JSON"""
+    return build_from_document(discovery_document(), http=http)
+
+# ================== ПОВТОРЫ И ПРЕДОХРАНИТЕЛЬ ==================
+class CircuitOpenError(Exception):
+    """Предохранитель разомкнут: Google недавно часто отвечал ошибками, вызов не выполнялся"""
+
+def http_status(exc):
+    return getattr(getattr(exc, "resp", None), "status", None)
+
+def is_retryable(exc) -> bool:
+    """Временная ошибка: таймаут, обрыв соединения, 429/5xx или 403 из-за лимита запросов"""
+    if isinstance(exc, CircuitOpenError):
+        return False
+    if isinstance(exc, HttpError):
+        status = http_status(exc)
+        if status == 403:
+            return any(detail.get("reason") in RATE_LIMIT_REASONS
+                       for detail in (exc.error_details or []) if isinstance(detail, dict))
+        return status in RETRYABLE_STATUSES
+    return isinstance(exc, (socket.timeout, socket.gaierror, TimeoutError, ConnectionError,
+                            httplib2.HttpLib2Error, google.auth.exceptions.TransportError))
+
+def backoff_delay(attempt: int, exc=None) -> float:
+    """Экспоненциальная пауза с джиттером: ~0.5 с, 1 с, 2 с ... не больше GOOGLE_BACKOFF_MAX; учитываем Retry-After"""
+    delay = min(GOOGLE_BACKOFF_MAX, GOOGLE_BACKOFF * 2 ** attempt) * random.uniform(0.5, 1.0)
+    retry_after = getattr(getattr(exc, "resp", None), "get", lambda *_: None)("retry-after")
+    if retry_after and str(retry_after).isdigit():
+        delay = max(delay, min(GOOGLE_BACKOFF_MAX, float(retry_after)))
+    return delay
+
+class CircuitBreaker:
+    """
+    Предохранитель для вызовов Google.
+
+    Считает исходы последних window вызовов; когда доля временных ошибок достигает
+    error_rate (и вызовов не меньше min_calls), размыкается: вызовы сразу получают
+    CircuitOpenError, а работа остаётся в outbox. Через cooldown секунд пропускает
+    один пробный вызов: успех замыкает цепь, ошибка снова размыкает.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window: int = BREAKER_WINDOW, min_calls: int = BREAKER_MIN_CALLS,
+                 error_rate: float = BREAKER_ERROR_RATE, cooldown: float = BREAKER_COOLDOWN):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)   # True — успех
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe = False
+        self.opened = 0
+        self.rejected = 0
+        self.failures = 0
+        self.retries = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                return self.HALF_OPEN
+            return self._state
+
+    def retry_after(self) -> float:
+        """Сколько секунд ещё не стоит обращаться к Google (0 — можно)"""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self._state, self._probe = self.HALF_OPEN, False
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._probe:
+                self._probe = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok: bool):
+        with self._lock:
+            if not ok:
+                self.failures += 1
+            if self._state == self.HALF_OPEN:
+                self._probe = False
+                if ok:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                    logger.info("✅ Google Calendar снова отвечает, предохранитель замкнут")
+                else:
+                    self._trip()
+                return
+            self._outcomes.append(ok)
+            errors = self._outcomes.count(False)
+            if self._state == self.CLOSED and len(self._outcomes) >= self.min_calls \
+                    and errors / len(self._outcomes) >= self.error_rate:
+                self._trip()
+
+    def _trip(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self.opened += 1
+        logger.warning(f"⚠️ Google Calendar отвечает ошибками, вызовы приостановлены на {self.cooldown:.0f} с")
+
+    def call(self, func):
+        """Один вызов через предохранитель; временная ошибка засчитывается как отказ"""
+        if not self.allow():
+            raise CircuitOpenError(f"Google Calendar недоступен, повтор через {self.retry_after():.0f} с")
+        try:
+            result = func()
+        except Exception as e:
+            self.record(not is_retryable(e))
+            raise
+        self.record(True)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            outcomes = list(self._outcomes)
+        return {
+            "state": self.state,
+            "error_rate": round(outcomes.count(False) / len(outcomes), 3) if outcomes else 0.0,
+            "retry_after": round(self.retry_after(), 1),
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "failures": self.failures,
+            "retries": self.retries,
+        }
+
+# Один предохранитель на процесс: все вызовы идут к одному и тому же Google
+breaker = CircuitBreaker()
+
+def call(func, retries: int = GOOGLE_RETRIES, deadline: float = GOOGLE_DEADLINE, circuit: CircuitBreaker = None):
+    """
+    Вызов Google с повторами временных ошибок (пауза с джиттером) через предохранитель.
+    Повторы прекращаются, если следующая пауза выходит за deadline секунд от начала.
+    """
+    circuit = circuit or breaker
+    started = time.monotonic()
+    for attempt in range(retries + 1):
+        try:
+            return circuit.call(func)
+        except Exception as e:
+            if not is_retryable(e) or attempt == retries:
+                raise
+            delay = backoff_delay(attempt, e)
+            if time.monotonic() - started + delay > deadline:
+                raise
+            circuit.retries += 1
+            logger.warning(f"Временная ошибка Google Calendar ({e}), повтор через {delay:.1f} с")
+            time.sleep(delay)
+
+def execute(request):
+    """request.execute() для запроса googleapiclient через call()"""
+    return call(request.execute)
+
+# ================== HTTP ДЛЯ ПОТОКОВ ==================
+class ThreadLocalHttp:
+    """
+    httplib2.Http не потокобезопасен, поэтому общий сервис ходит в сеть через
+    отдельный AuthorizedHttp в каждом потоке; credentials у всех потоков общие.
+    """
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self._local = threading.local()
+
+    def _http(self):
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = self._local.http = google_auth_httplib2.AuthorizedHttp(
+                self.credentials, http=httplib2.Http(timeout=GOOGLE_TIMEOUT),
+                refresh_http=httplib2.Http(timeout=GOOGLE_TIMEOUT))
+        return http
+
+    def request(self, *args, **kwargs):
+        return self._http().request(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._http(), name)
+
+def needs_refresh(creds, margin: timedelta) -> bool:
+    """Токена нет или до его истечения осталось меньше margin"""
+    if creds is None or not creds.token:
+        return True
+    if creds.expiry is None:
+        return not creds.valid
+    # expiry в google-auth — naive UTC
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return creds.expiry - now < margin
+
+class TimeoutRequest(Request):
+    """Транспорт обновления токена с таймаутом GOOGLE_TIMEOUT (по умолчанию у google-auth — 120 с)"""
+
+    def __call__(self, *args, timeout=None, **kwargs):
+        return super().__call__(*args, timeout=timeout or GOOGLE_TIMEOUT, **kwargs)
+
+# ================== СЕРВИС НА ПРОЦЕСС ==================
+class CalendarServiceCache:
+    """
+    Один сервис Google Calendar на процесс.
+
+    build() и чтение token.json выполняются один раз; токен обновляется, только
+    когда до его истечения осталось меньше refresh_margin секунд, а token.json
+    перезаписывается, только если его содержимое действительно изменилось.
+    Быстрый путь get() не берёт блокировку.
+
+    interactive=False — без token.json не запускаем авторизацию в браузере
+    (на сервере она заблокировала бы процесс), а бросаем исключение.
+    """
+
+    def __init__(self, credentials_file: str, token_file: str, scopes=SCOPES,
+                 refresh_margin: int = GOOGLE_REFRESH_MARGIN, interactive: bool = True):
+        self.credentials_file = credentials_file
+        self.token_file = token_file
+        self.interactive = interactive
+        self.scopes = scopes
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self._lock = threading.Lock()
+        self._creds = None
+        self._service = None
+        self._saved_json = None
+        self._saved_token = None
+        self.builds = 0
+        self.refreshes = 0
+        self.token_writes = 0
+
+    def _needs_refresh(self) -> bool:
+        return needs_refresh(self._creds, self.refresh_margin)
+
+    def _load(self):
+        if not os.path.exists(self.credentials_file):
+            raise FileNotFoundError(f"Файл {self.credentials_file} не найден")
+        creds = None
+        if os.path.exists(self.token_file):
+            with open(self.token_file, encoding="utf-8") as f:
+                self._saved_json = f.read()
+            creds = Credentials.from_authorized_user_file(self.token_file, self.scopes)
+        if not creds or not creds.refresh_token:
+            if not self.interactive:
+                raise RuntimeError(f"Нет {self.token_file} с refresh token, общий календарь не подключён")
+            logger.info("🔑 Запускаю авторизацию Google Calendar...")
+            flow = InstalledAppFlow.from_client_secrets_file(self.credentials_file, self.scopes)
+            creds = flow.run_local_server(port=8081)
+        return creds
+
+    def _save_token(self):
+        data = self._creds.to_json()
+        self._saved_token = self._creds.token
+        if self._saved_json and json.loads(data) == json.loads(self._saved_json):
+            return
+        tmp = self.token_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, self.token_file)
+        self._saved_json = data
+        self.token_writes += 1
+
+    def get(self):
+        """Сервис Calendar API; при ошибке авторизации исключение, а кэш сбрасывается"""
+        service, creds = self._service, self._creds
+        if service is not None and creds is not None and creds.token == self._saved_token \
+                and not self._needs_refresh():
+            return service
+        with self._lock:
+            try:
+                if self._creds is None:
+                    self._creds = self._load()
+                if self._needs_refresh() and self._creds.refresh_token:
+                    call(lambda: self._creds.refresh(TimeoutRequest()))
+                    self.refreshes += 1
+                # Токен мог обновить и сам AuthorizedHttp (после 401) — сохраняем и такой
+                self._save_token()
+                if self._service is None:
+                    self._service = build_service(ThreadLocalHttp(self._creds))
+                    self.builds += 1
+                    logger.info("✅ Сервис Google Calendar создан")
+                return self._service
+            except Exception:
+                self._creds = self._service = None
+                raise
+
+    def reset(self):
+        """Забываем сервис и credentials (например, после отзыва доступа)"""
+        with self._lock:
+            self._creds = self._service = None
+
+    def stats(self) -> dict:
+        return {"builds": self.builds, "refreshes": self.refreshes, "token_writes": self.token_writes}
+
+# ================== BATCH-ЗАПРОСЫ ==================
+class EventBatch:
+    """
+    Копит операции над событиями и отправляет их batch-запросами Calendar API —
+    до batch_size операций за один HTTP-вызов вместо вызова на каждую задачу.
+
+    Каждая операция помечается ключом вызывающего (ID задачи или операции outbox);
+    execute() возвращает {ключ: (ответ, исключение)}. Удаление уже удалённого
+    события (404/410) считается успешным. Операции с временной ошибкой (429/5xx,
+    таймаут) повторяются с паузой, каждый HTTP-вызов идёт через предохранитель.
+    """
+
+    def __init__(self, service, calendar_id: str = "primary", batch_size: int = CALENDAR_BATCH_SIZE,
+                 retries: int = GOOGLE_RETRIES, circuit: CircuitBreaker = None):
+        self.service = service
+        self.calendar_id = calendar_id
+        self.batch_size = batch_size
+        self.retries = retries
+        self.circuit = circuit or breaker
+        # service.events() каждый раз заново собирает методы ресурса (~10 мс) — берём один раз
+        self._events = service.events()
+        self._ops = []   # (ключ, вид, запрос)
+
+    def __len__(self):
+        return len(self._ops)
+
+    def insert(self, key, body: dict):
+        self._ops.append((key, "insert", self._events.insert(calendarId=self.calendar_id, body=body)))
+
+    def patch(self, key, event_id: str, body: dict):
+        self._ops.append((key, "patch", self._events.patch(
+            calendarId=self.calendar_id, eventId=event_id, body=body)))
+
+    def delete(self, key, event_id: str):
+        self._ops.append((key, "delete", self._events.delete(calendarId=self.calendar_id, eventId=event_id)))
+
+    def _send(self, ops, results) -> list:
+        """Один batch-запрос через предохранитель; возвращает операции с временной ошибкой"""
+        retry = []
+
+        def on_response(request_id, response, exception):
+            op = ops[int(request_id)]
+            if op[1] == "delete" and http_status(exception) in (404, 410):
+                exception = None
+            results[op[0]] = (response, exception)
+            if exception is not None and is_retryable(exception):
+                retry.append(op)
+            self.circuit.record(exception is None or not is_retryable(exception))
+
+        batch = self.service.new_batch_http_request(callback=on_response)
+        # request_id уходит в заголовок Content-ID, поэтому это номер в пачке, а не ключ
+        for i, (_, _, request) in enumerate(ops):
+            batch.add(request, request_id=str(i))
+        self.circuit.call(batch.execute)
+        return retry
+
+    def _execute_chunk(self, ops, results):
+        """Пачка с повторами: заново отправляются только операции с временной ошибкой"""
+        for attempt in range(self.retries + 1):
+            try:
+                ops = self._send(ops, results)
+                error = None
+            except Exception as e:
+                error = e
+                if not is_retryable(e):
+                    break
+            if not ops:
+                return
+            if attempt < self.retries:
+                self.circuit.retries += 1
+                time.sleep(backoff_delay(attempt, error))
+        if error is not None:
+            logger.error(f"Ошибка batch-запроса к Google Calendar ({len(ops)} операций): {error}")
+            for key, _, _ in ops:
+                results[key] = (None, error)
+
+    def execute(self) -> dict:
+        """Отправляем накопленные операции; ошибка всего HTTP-вызова достаётся каждой операции пачки"""
+        ops, self._ops = self._ops, []
+        results = {}
+        for start in range(0, len(ops), self.batch_size):
+            self._execute_chunk(ops[start:start + self.batch_size], results)
+        return results
+
+# ================== ШИФРОВАНИЕ ТОКЕНОВ ==================
+class TokenCipher:
+    """
+    Шифрование refresh token пользователей (Fernet) для хранения в SQLite.
+    Ключей может быть несколько через запятую: шифруем первым, расшифровываем любым —
+    так ключ можно сменить, не теряя привязанные аккаунты.
+    """
+
+    def __init__(self, keys: str):
+        self._fernet = MultiFernet([Fernet(key.strip().encode()) for key in keys.split(",") if key.strip()])
+
+    @classmethod
+    def from_env(cls, keys: str = GOOGLE_TOKEN_KEY):
+        """Шифр из GOOGLE_TOKEN_KEY или None, если ключ не задан (привязка календарей выключена)"""
+        return cls(keys) if keys.strip() else None
+
+    def encrypt(self, value: str) -> bytes:
+        return self._fernet.encrypt(value.encode("utf-8"))
+
+    def decrypt(self, token: bytes) -> str:
+        """ValueError, если токен зашифрован неизвестным ключом или повреждён"""
+        try:
+            return self._fernet.decrypt(bytes(token)).decode("utf-8")
+        except InvalidToken:
+            raise ValueError("не удалось расшифровать refresh token")
+
+# ================== OAUTH ДЛЯ ПОЛЬЗОВАТЕЛЕЙ ==================
+# state — подписанные user_id, одноразовый nonce и срок действия (task_io.make_signed_token).
+# Nonce лежит в БД (storage.save_oauth_nonce), callback его гасит: чужую, перехваченную или
+# уже использованную ссылку второй раз не принять.
+# PKCE code_verifier выводится из state и секрета, поэтому его не нужно запоминать
+def make_oauth_state(user_id: int, secret: str, ttl: int = OAUTH_STATE_TTL) -> str:
+    nonce = secrets.token_hex(16)
+    storage.save_oauth_nonce(user_id, nonce, int(time.time()) + ttl)
+    return task_io.make_signed_token((user_id, nonce), secret, ttl)
+
+def _parse_oauth_state(state: str, secret: str) -> tuple:
+    try:
+        user_id, nonce = task_io.parse_signed_token(state, secret, 2)
+    except task_io.TokenExpired:
+        raise ValueError("срок действия ссылки истёк, отправь /connect ещё раз")
+    return int(user_id), nonce
+
+def parse_oauth_state(state: str, secret: str) -> int:
+    """user_id из подписанного state (nonce не гасится); ValueError, если подпись неверна или срок истёк"""
+    return _parse_oauth_state(state, secret)[0]
+
+def consume_oauth_state(state: str, secret: str) -> int:
+    """Как parse_oauth_state, но гасит nonce; ValueError, если ссылкой уже воспользовались"""
+    user_id, nonce = _parse_oauth_state(state, secret)
+    if not storage.consume_oauth_nonce(user_id, nonce):
+        raise ValueError("ссылка уже использована, отправь /connect ещё раз")
+    return user_id
+
+def _oauth_flow(credentials_file: str, redirect_uri: str, state: str, secret: str):
+    flow = Flow.from_client_secrets_file(credentials_file, SCOPES, redirect_uri=redirect_uri, state=state,
+                                         autogenerate_code_verifier=False)
+    flow.code_verifier = hmac.new(secret.encode("utf-8"), f"pkce:{state}".encode("ascii"), hashlib.sha256).hexdigest()
+    return flow
+
+def authorization_url(credentials_file: str, redirect_uri: str, user_id: int, secret: str) -> str:
+    """Ссылка на согласие Google для /connect; prompt=consent, чтобы Google всегда выдал refresh token"""
+    state = make_oauth_state(user_id, secret)
+    url, _ = _oauth_flow(credentials_file, redirect_uri, state, secret).authorization_url(
+        access_type="offline", prompt="consent")
+    return url
+
+def exchange_code(credentials_file: str, redirect_uri: str, state: str, code: str, secret: str):
+    """
+    (user_id, Credentials) по коду из callback; ValueError, если state неверен.
+    Nonce state к этому моменту уже погашен consume_oauth_state.
+    """
+    user_id = parse_oauth_state(state, secret)
+    flow = _oauth_flow(credentials_file, redirect_uri, state, secret)
+    call(lambda: flow.fetch_token(code=code, timeout=GOOGLE_TIMEOUT), retries=0)
+    return user_id, flow.credentials
+
+# ================== КАЛЕНДАРИ ПОЛЬЗОВАТЕЛЕЙ ==================
+class UserCalendarServices:
+    """
+    Сервисы Calendar API для пользователей, привязавших свой Google-аккаунт.
+
+    Refresh token хранится в SQLite (google_accounts) зашифрованным, access token —
+    только в памяти. Живые credentials и сервисы лежат в LRU на max_entries
+    пользователей: у активного пользователя /add не читает базу и не обновляет
+    токен, пока до истечения не осталось меньше refresh_margin.
+
+    Большинство пользователей календарь не привязывают — «не привязан» тоже кэшируется
+    (LRU на unlinked_entries), link и unlink сбрасывают эту отметку. Привязка идёт
+    через /oauth2/callback того же процесса, поэтому отметка не устаревает.
+    """
+
+    def __init__(self, credentials_file: str, cipher: TokenCipher = None, max_entries: int = GOOGLE_USER_CACHE,
+                 refresh_margin: int = GOOGLE_REFRESH_MARGIN, unlinked_entries: int = GOOGLE_UNLINKED_CACHE):
+        self.credentials_file = credentials_file
+        self.cipher = cipher if cipher is not None else TokenCipher.from_env()
+        self.max_entries = max_entries
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # user_id → (credentials, сервис)
+        self.unlinked_entries = unlinked_entries
+        self._unlinked = OrderedDict()  # user_id → None: аккаунт не привязан
+        self._client = None
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self.unlinked_hits = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.cipher is not None and os.path.exists(self.credentials_file)
+
+    def _client_info(self) -> dict:
+        if self._client is None:
+            with open(self.credentials_file, encoding="utf-8") as f:
+                data = json.load(f)
+            self._client = data.get("web") or data.get("installed")
+        return self._client
+
+    def _put(self, user_id, creds):
+        service = build_service(ThreadLocalHttp(creds))
+        with self._lock:
+            self._entries[user_id] = (creds, service)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return service
+
+    def _mark_unlinked(self, user_id):
+        with self._lock:
+            # link мог успеть положить сервис, пока мы читали пустую строку из базы
+            if user_id in self._entries:
+                return
+            self._unlinked[user_id] = None
+            self._unlinked.move_to_end(user_id)
+            while len(self._unlinked) > self.unlinked_entries:
+                self._unlinked.popitem(last=False)
+
+    def _known_unlinked(self, user_id) -> bool:
+        with self._lock:
+            if user_id not in self._unlinked:
+                return False
+            self._unlinked.move_to_end(user_id)
+            self.unlinked_hits += 1
+            return True
+
+    def _save(self, user_id, creds):
+        storage.save_google_account(user_id, self.cipher.encrypt(creds.refresh_token), " ".join(creds.scopes or SCOPES))
+
+    def link(self, user_id: int, creds):
+        """Сохраняем аккаунт после /connect и сразу кладём сервис в LRU"""
+        if not creds.refresh_token:
+            raise ValueError("Google не выдал refresh token")
+        self._save(user_id, creds)
+        self._put(user_id, creds)
+        with self._lock:
+            self._unlinked.pop(user_id, None)
+
+    def unlink(self, user_id: int) -> bool:
+        with self._lock:
+            self._entries.pop(user_id, None)
+        deleted = storage.delete_google_account(user_id)
+        self._mark_unlinked(user_id)
+        return deleted
+
+    def is_linked(self, user_id: int) -> bool:
+        if not self.enabled:
+            return False
+        with self._lock:
+            if user_id in self._entries:
+                return True
+        if self._known_unlinked(user_id):
+            return False
+        if storage.get_google_account(user_id) is None:
+            self._mark_unlinked(user_id)
+            return False
+        return True
+
+    def get(self, user_id: int):
+        """
+        Сервис календаря пользователя или None, если аккаунт не привязан.
+        Если Google отозвал доступ (invalid_grant), привязка удаляется.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+        if entry is not None and not needs_refresh(entry[0], self.refresh_margin):
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+
+        if entry is None:
+            if self._known_unlinked(user_id):
+                return None
+            row = storage.get_google_account(user_id)
+            if row is None:
+                self._mark_unlinked(user_id)
+                return None
+            client = self._client_info()
+            creds = Credentials(
+                None, refresh_token=self.cipher.decrypt(row[0]), token_uri=client["token_uri"],
+                client_id=client["client_id"], client_secret=client["client_secret"],
+                scopes=(row[1] or "").split() or SCOPES,
+            )
+        else:
+            creds = entry[0]
+        refresh_token = creds.refresh_token
+        try:
+            call(lambda: creds.refresh(TimeoutRequest()))
+        except google.auth.exceptions.RefreshError as e:
+            if "invalid_grant" not in str(e):
+                raise
+            logger.warning(f"Доступ к Google Calendar пользователя {user_id} отозван: {e}")
+            self.unlink(user_id)
+            return None
+        self.refreshes += 1
+        # Google может выдать новый refresh token — храним актуальный
+        if creds.refresh_token != refresh_token:
+            self._save(user_id, creds)
+        if entry is not None:
+            return entry[1]
+        return self._put(user_id, creds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, unlinked = len(self._entries), len(self._unlinked)
+        return {"entries": entries, "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses,
+                "refreshes": self.refreshes, "evictions": self.evictions,
+                "unlinked": unlinked, "unlinked_hits": self.unlinked_hits}
@@ -0,0 +1,37 @@
+"""
+Перенос однофайловой базы задач в каталог шардов.
+
+Пользователи раскладываются по шардам тем же хешем, что и в storage.shard_of(),
+ID задач сохраняются, новые ID в разных шардах не пересекаются. Бот на время переноса должен быть остановлен.
+
+Запуск:
+    python reshard.py tasks.db data/ --shards 8
+Затем запускаем бота с DATABASE_PATH=data/ DATABASE_SHARDS=8.
+"""
+import sys
+import time
+import argparse
+
+import storage
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="однофайловая база (DATABASE_PATH без шардов)")
+    parser.add_argument("target", help="новый пустой каталог для шардов")
+    parser.add_argument("--shards", type=int, required=True, help="число шардов")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        counts = storage.reshard(args.source, args.target, args.shards)
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ {e}")
+        return 1
+    for shard, count in enumerate(counts):
+        print(f"{storage.shard_file(args.target, shard)}: {count} задач")
+    print(f"✅ Перенесено {sum(counts)} задач за {time.perf_counter() - start:.1f} с")
+    print(f"Запуск: DATABASE_PATH={args.target} DATABASE_SHARDS={args.shards}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
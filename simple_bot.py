@@ -1,28 +1,35 @@
 import os
+import hmac
 import json
+import random
 import logging
-import sqlite3
+import threading
 from datetime import datetime, timedelta
 import pytz
 from dotenv import load_dotenv
 import telebot
-from telebot.types import ReplyKeyboardMarkup, KeyboardButton
-from flask import Flask, request
+from telebot.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from flask import Flask, request, jsonify, Response, stream_with_context
 
-# Google Calendar imports
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
+import backup
+import google_calendar
+import storage
+import task_io
+from task_store import TaskStore, SqliteTaskStore
 
 # ================== НАСТРОЙКИ ==================
 load_dotenv()
 
 TOKEN = os.getenv("TELEGRAM_TOKEN")
-DB_PATH = os.getenv("DATABASE_PATH", "tasks.db")
 TIMEZONE = os.getenv("TIMEZONE", "Europe/Moscow")
 GOOGLE_CREDENTIALS_FILE = os.getenv("GOOGLE_CREDENTIALS", "credentials.json")
 GOOGLE_TOKEN_FILE = os.getenv("GOOGLE_TOKEN", "token.json")
+RENDER_URL = os.getenv("RENDER_URL")
+EXPORT_SECRET = os.getenv("EXPORT_SECRET") or TOKEN or ""
+OAUTH_SECRET = os.getenv("OAUTH_SECRET") or EXPORT_SECRET
+# /metrics: заголовок Authorization: Bearer <METRICS_TOKEN>; без токена — только запросы с localhost
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+OAUTH_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI") or (f"{RENDER_URL.rstrip('/')}/oauth2/callback" if RENDER_URL else None)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -43,135 +50,170 @@ else:
 bot = telebot.TeleBot(TOKEN)
 
 # ================== GOOGLE CALENDAR ==================
+# Общий календарь из token.json (как раньше) и календари пользователей, привязанные через /connect.
+# Авторизация в браузере на сервере не запускается: без token.json общего календаря просто нет
+calendar_service = google_calendar.CalendarServiceCache(GOOGLE_CREDENTIALS_FILE, GOOGLE_TOKEN_FILE, interactive=False)
+user_calendars = google_calendar.UserCalendarServices(GOOGLE_CREDENTIALS_FILE)
+
 def get_google_calendar_service():
-    """Получаем сервис для работы с Google Calendar"""
+    """Сервис Google Calendar: один на процесс, token.json читается и обновляется только при необходимости"""
     try:
-        SCOPES = ['https://www.googleapis.com/auth/calendar']
-        creds = None
-
         if not os.path.exists(GOOGLE_CREDENTIALS_FILE):
             print(f"❌ Файл {GOOGLE_CREDENTIALS_FILE} не найден!")
             return None
-
-        if os.path.exists(GOOGLE_TOKEN_FILE):
-            creds = Credentials.from_authorized_user_file(GOOGLE_TOKEN_FILE, SCOPES)
-
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                print("🔑 Запускаю авторизацию Google Calendar...")
-                flow = InstalledAppFlow.from_client_secrets_file(GOOGLE_CREDENTIALS_FILE, SCOPES)
-                creds = flow.run_local_server(port=8081)
-            with open(GOOGLE_TOKEN_FILE, "w") as token:
-                token.write(creds.to_json())
-
-        service = build("calendar", "v3", credentials=creds)
-        print("✅ Сервис Google Calendar создан")
-        return service
+        return calendar_service.get()
 
     except Exception as e:
         logger.error(f"Ошибка получения сервиса Google Calendar: {e}")
         return None
 
-def create_google_event(description, start_time, end_time):
-    """Создаем событие в Google Calendar"""
-    try:
-        service = get_google_calendar_service()
-        if not service:
-            return None
-
-        event = {
-            'summary': description,
-            'description': 'Создано через Telegram бота',
-            'start': {'dateTime': start_time.isoformat(), 'timeZone': TIMEZONE},
-            'end': {'dateTime': end_time.isoformat(), 'timeZone': TIMEZONE},
-        }
+def get_user_calendar_service(user_id, calendar=None):
+    """
+    Календарь для событий пользователя: (сервис или None, storage.CALENDAR_*).
+    calendar=None — новое событие: свой (/connect), иначе общий из token.json; если свой
+    привязан, но сейчас недоступен — None, в общий не пишем. Уже созданное событие
+    меняем и удаляем только в том календаре, где оно лежит
+    """
+    if calendar != storage.CALENDAR_SHARED:
+        try:
+            service = user_calendars.get(user_id)
+        except Exception as e:
+            logger.error(f"Ошибка получения календаря пользователя {user_id}: {e}")
+            return None, storage.CALENDAR_OWN
+        if service is not None or calendar == storage.CALENDAR_OWN:
+            return service, storage.CALENDAR_OWN
+    service = get_google_calendar_service() if os.path.exists(GOOGLE_TOKEN_FILE) else None
+    return service, storage.CALENDAR_SHARED
+
+def event_body(description, start_time, end_time, created=False, event_id=None):
+    """Тело события для insert (created=True, event_id — заранее выбранный ID) или patch"""
+    body = {
+        'summary': description,
+        'start': {'dateTime': start_time.isoformat(), 'timeZone': TIMEZONE},
+        'end': {'dateTime': end_time.isoformat(), 'timeZone': TIMEZONE},
+    }
+    if created:
+        body['description'] = 'Создано через Telegram бота'
+    if event_id:
+        body['id'] = event_id
+    return body
+
+def calendar_enabled(user_id):
+    """Синхронизировать ли задачи пользователя: есть свой календарь (/connect) или общий token.json"""
+    if not os.path.exists(GOOGLE_CREDENTIALS_FILE):
+        return False
+    return os.path.exists(GOOGLE_TOKEN_FILE) or user_calendars.is_linked(user_id)
+
+# ================== OUTBOX → GOOGLE CALENDAR ==================
+# Изменения задач записывают операции в таблицу outbox в той же транзакции;
+# фоновый поток выполняет их с повторами, так что вебхук не ждёт Google.
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_CLAIM_LIMIT = int(os.getenv("OUTBOX_CLAIM_LIMIT", "200"))   # операций за проход: 4 batch-запроса по 50
+
+def outbox_delay(attempts):
+    """Экспоненциальная пауза с джиттером: ~10 с, 20 с, 40 с ... не больше часа"""
+    return min(3600, 5 * 2 ** attempts) * random.uniform(0.5, 1.0)
+
+def drain_outbox_once():
+    """
+    Один проход: забираем готовые операции outbox и выполняем их batch-запросами
+    (create, update и delete вперемешку, до 50 за HTTP-вызов) — по batch на календарь
+    каждого пользователя: create — в календарь по текущей привязке, update и delete — в тот,
+    где лежит событие (payload["calendar"]). Результат каждой операции сопоставляется с её строкой
+    outbox по ID. Возвращает число операций
+    """
+    # Предохранитель разомкнут — не забираем операции (и не тратим их попытки), пока Google не оживёт
+    if google_calendar.breaker.retry_after() > 0:
+        return 0
+    items = storage.claim_outbox(limit=OUTBOX_CLAIM_LIMIT)
+    if not items:
+        return 0
+    by_calendar = {}
+    for item in items:
+        by_calendar.setdefault((item[2], item[4].get("calendar")), []).append(item)
+    for (user_id, calendar), calendar_items in by_calendar.items():
+        drain_user_items(*get_user_calendar_service(user_id, calendar), calendar_items)
+    return len(items)
+
+def drain_user_items(service, calendar, items):
+    """Операции outbox одного пользователя — одним EventBatch в календарь calendar (storage.CALENDAR_*)"""
+    if not service:
+        for outbox_id, _, _, _, _, attempts in items:
+            storage.retry_outbox(outbox_id, attempts, "Google Calendar недоступен", outbox_delay(attempts))
+        return
 
-        event = service.events().insert(calendarId='primary', body=event).execute()
-        logger.info(f'Событие создано в Google Calendar: {event.get("id")}')
-        return event.get('id')
+    tz = pytz.timezone(TIMEZONE)
+    batch = google_calendar.EventBatch(service)
+    for outbox_id, task_id, user_id, op, payload, attempts in items:
+        if op == "delete":
+            batch.delete(outbox_id, payload["event_id"])
+            continue
+        start = datetime.fromtimestamp(payload["due_ts"], tz)
+        end = start + timedelta(hours=1)
+        if op == "create":
+            batch.insert(outbox_id, event_body(payload["description"], start, end, created=True,
+                                               event_id=payload.get("event_id")))
+        else:
+            batch.patch(outbox_id, payload["event_id"], event_body(payload["description"], start, end))
+    results = batch.execute()
+
+    done, failed = [], 0
+    for outbox_id, task_id, user_id, op, payload, attempts in items:
+        response, exception = results.get(outbox_id, (None, "нет ответа в batch"))
+        if op == "create" and payload.get("event_id") and google_calendar.http_status(exception) == 409:
+            # Событие с нашим ID уже есть: прошлая попытка дошла до Google, но не до complete_outbox
+            response, exception = {"id": payload["event_id"]}, None
+        if exception:
+            failed += 1
+            storage.retry_outbox(outbox_id, attempts, f"{op}: {exception}", outbox_delay(attempts))
+        else:
+            done.append((outbox_id, task_id, user_id, response.get("id") if op == "create" else None, calendar))
+    storage.complete_outbox_many(done)
+    logger.info(f"Outbox: выполнено операций {len(done)}, с ошибкой {failed}")
+
+def outbox_drainer():
+    while True:
+        try:
+            if drain_outbox_once():
+                continue
+        except Exception as e:
+            logger.error(f"Ошибка обработки outbox: {e}")
+        storage.wait_for_outbox(OUTBOX_POLL_SECONDS)
+
+def start_outbox_drainer():
+    thread = threading.Thread(target=outbox_drainer, name="outbox-drainer", daemon=True)
+    thread.start()
+    return thread
 
-    except Exception as e:
-        logger.error(f"Ошибка создания события в Google Calendar: {e}")
-        return None
+# ================== БАЗА ДАННЫХ ==================
+# Хранилище задач; тесты и бенчмарки подменяют его через use_store(MemoryTaskStore()).
+# Outbox, кэш и обслуживание БД остаются в storage и работают только с SQLite
+store: TaskStore = SqliteTaskStore()
 
-def delete_google_event(event_id):
-    """Удаляем событие из Google Calendar"""
-    try:
-        service = get_google_calendar_service()
-        if not service or not event_id:
-            return False
-        service.events().delete(calendarId='primary', eventId=event_id).execute()
-        logger.info(f'Событие удалено из Google Calendar: {event_id}')
-        return True
-    except Exception as e:
-        logger.error(f"Ошибка удаления события из Google Calendar: {e}")
-        return False
+def use_store(new_store: TaskStore):
+    global store
+    store = new_store
 
-# ================== БАЗА ДАННЫХ ==================
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS tasks (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        description TEXT,
-        datetime TEXT,
-        google_event_id TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    """)
-    conn.commit()
-    conn.close()
-    print("✅ База данных готова")
-
-def add_task(user_id, description, task_datetime, google_event_id=None):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO tasks (user_id, description, datetime, google_event_id) VALUES (?, ?, ?, ?)",
-        (user_id, description, task_datetime, google_event_id)
-    )
-    task_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return task_id
-
-def get_tasks(user_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, description, datetime, google_event_id FROM tasks WHERE user_id=? AND datetime > ? ORDER BY datetime",
-        (user_id, datetime.now().isoformat())
-    )
-    tasks = cursor.fetchall()
-    conn.close()
-    return tasks
-
-def get_task_by_id(task_id, user_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, description, datetime, google_event_id FROM tasks WHERE id=? AND user_id=?", (task_id, user_id))
-    task = cursor.fetchone()
-    conn.close()
-    return task
-
-def delete_task(task_id, user_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT google_event_id FROM tasks WHERE id=? AND user_id=?", (task_id, user_id))
-    result = cursor.fetchone()
-    google_event_id = result[0] if result else None
-    cursor.execute("DELETE FROM tasks WHERE id=? AND user_id=?", (task_id, user_id))
-    conn.commit()
-    conn.close()
-    if google_event_id:
-        delete_google_event(google_event_id)
-    return True
+    version = store.init_db()
+    print(f"✅ База данных готова (версия схемы {version})")
+
+def delete_tasks(user_id, target):
+    """
+    Удаляем задачи одним запросом (target — список ID или "past"); удаление событий
+    календаря попадает в outbox той же транзакцией. Возвращает ID удалённых задач
+    """
+    if target == "past":
+        deleted = store.delete_past_tasks(user_id, sync_calendar=calendar_enabled(user_id))
+    else:
+        deleted = store.delete_tasks(user_id, target, sync_calendar=calendar_enabled(user_id))
+    return [task_id for task_id, _ in deleted]
 
 # ================== ПАРСИНГ ДАТ ==================
+def local_dt(due_ts):
+    """Время задачи (секунды UTC) в настроенном часовом поясе"""
+    return datetime.fromtimestamp(due_ts, pytz.timezone(TIMEZONE))
+
 def parse_datetime(date_str, time_str):
     try:
         tz = pytz.timezone(TIMEZONE)
@@ -209,13 +251,19 @@ def parse_datetime(date_str, time_str):
 @bot.message_handler(commands=['start'])
 def start_command(message):
     kb = ReplyKeyboardMarkup(resize_keyboard=True)
-    kb.add(KeyboardButton("/add"), KeyboardButton("/list"), KeyboardButton("/today"), KeyboardButton("/delete"), KeyboardButton("/help"))
-    has_calendar = "✅" if os.path.exists(GOOGLE_CREDENTIALS_FILE) else "❌"
+    kb.add(KeyboardButton("/add"), KeyboardButton("/list"), KeyboardButton("/today"), KeyboardButton("/tomorrow"),
+           KeyboardButton("/week"), KeyboardButton("/delete"), KeyboardButton("/help"))
+    if user_calendars.is_linked(message.from_user.id):
+        has_calendar = "✅ свой"
+    elif calendar_enabled(message.from_user.id):
+        has_calendar = "✅ общий"
+    else:
+        has_calendar = "❌ (подключить: /connect)"
     bot.reply_to(message, f"👋 Привет! Я бот для задач.\n📅 Google Calendar: {has_calendar}", reply_markup=kb)
 
 @bot.message_handler(commands=['help'])
 def help_command(message):
-    bot.reply_to(message, "📋 Команды:\n/add описание дата время\n/list\n/today\n/delete\n")
+    bot.reply_to(message, "📋 Команды:\n/add описание дата время\n/list\n/today\n/tomorrow\n/week\n/find слова\n/edit ID [дата время] [описание]\n/delete\n/import — загрузить задачи из файла\n/export csv|jsonl|ics — выгрузить задачи\n/connect — подключить свой Google Calendar\n/disconnect — отключить его\n")
 
 @bot.message_handler(commands=['add'])
 def add_command(message):
@@ -226,37 +274,201 @@ def add_command(message):
             return
         description, date_str, time_str = parts[1], parts[2], parts[3]
         parsed_datetime = parse_datetime(date_str, time_str)
-        end_time = parsed_datetime + timedelta(hours=1)
-        google_event_id = create_google_event(description, parsed_datetime, end_time)
-        task_id = add_task(message.from_user.id, description, parsed_datetime.isoformat(), google_event_id)
+        sync_calendar = calendar_enabled(message.from_user.id)
+        task_id = store.add_task(message.from_user.id, description, parsed_datetime, sync_calendar=sync_calendar)
         resp = f"✅ Задача #{task_id} добавлена: {description}\n🕐 {parsed_datetime.strftime('%d.%m %H:%M')}"
-        if google_event_id: resp += "\n📅 Добавлено в Google Calendar"
+        if sync_calendar: resp += "\n📅 Будет добавлено в Google Calendar"
         bot.reply_to(message, resp)
     except Exception as e:
         bot.reply_to(message, f"❌ Ошибка: {e}")
 
+@bot.message_handler(commands=['edit'])
+def edit_command(message):
+    parts = message.text.split(maxsplit=1)
+    try:
+        task_id, description, dt = task_io.parse_edit_args(parts[1] if len(parts) > 1 else "", parse_datetime)
+        if not store.update_task(task_id, message.from_user.id, description, dt,
+                                 sync_calendar=calendar_enabled(message.from_user.id)):
+            bot.reply_to(message, f"❌ Задача #{task_id} не найдена")
+            return
+        task = store.get_task_by_id(task_id, message.from_user.id)
+        bot.reply_to(message, f"✏️ Задача #{task_id}: {task[1]}\n🕐 {local_dt(task[2]).strftime('%d.%m %H:%M')}")
+    except Exception as e:
+        bot.reply_to(message, f"❌ Ошибка: {e}")
+
+def render_list_page(user_id, after=None):
+    """Страница /list и кнопка «Далее» с курсором list:due_ts:id"""
+    tasks, next_cursor = store.get_tasks_page(user_id, after)
+    if not tasks:
+        return None, None
+    resp = "📋 Твои задачи:\n"
+    for tid, desc, due_ts, gid in tasks:
+        dt = local_dt(due_ts)
+        resp += f"#{tid} - {desc} {'📅' if gid else ''}\n   {dt.strftime('%d.%m %H:%M')}\n"
+    kb = None
+    if next_cursor:
+        kb = InlineKeyboardMarkup()
+        kb.add(InlineKeyboardButton("Далее ▶️", callback_data=f"list:{next_cursor[0]}:{next_cursor[1]}"))
+    return resp, kb
+
 @bot.message_handler(commands=['list'])
 def list_command(message):
-    tasks = get_tasks(message.from_user.id)
-    if not tasks:
+    resp, kb = render_list_page(message.from_user.id)
+    if not resp:
         bot.reply_to(message, "📭 У тебя нет задач")
         return
-    resp = "📋 Твои задачи:\n"
-    for tid, desc, dt_str, gid in tasks:
-        dt = datetime.fromisoformat(dt_str)
-        resp += f"#{tid} - {desc} {'📅' if gid else ''}\n   {dt.strftime('%d.%m %H:%M')}\n"
+    bot.reply_to(message, resp, reply_markup=kb)
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("list:"))
+def list_page_callback(call):
+    try:
+        _, due_ts, tid = call.data.split(":")
+        resp, kb = render_list_page(call.from_user.id, (int(due_ts), int(tid)))
+        bot.answer_callback_query(call.id)
+        bot.edit_message_text(resp or "📭 Больше задач нет", call.message.chat.id, call.message.message_id, reply_markup=kb)
+    except Exception as e:
+        bot.answer_callback_query(call.id, f"❌ Ошибка: {e}")
+
+@bot.message_handler(commands=['find'])
+def find_command(message):
+    parts = message.text.split(' ', 1)
+    if len(parts) < 2 or not parts[1].strip():
+        bot.reply_to(message, "❌ Укажи слова для поиска: /find встреча")
+        return
+    tasks = store.search_tasks(message.from_user.id, parts[1])
+    if not tasks:
+        bot.reply_to(message, "🔍 Ничего не найдено")
+        return
+    resp = "🔍 Найдено:\n"
+    for tid, desc, due_ts, gid in tasks:
+        resp += f"#{tid} - {desc} {'📅' if gid else ''}\n   {local_dt(due_ts).strftime('%d.%m.%Y %H:%M')}\n"
+    bot.reply_to(message, resp)
+
+def day_window(days_ahead, days=1):
+    """Границы суток [начало дня +days_ahead, начало дня +days_ahead+days) в TIMEZONE"""
+    tz = pytz.timezone(TIMEZONE)
+    today = datetime.now(tz).date()
+    start = tz.localize(datetime.combine(today + timedelta(days=days_ahead), datetime.min.time()))
+    end = tz.localize(datetime.combine(today + timedelta(days=days_ahead + days), datetime.min.time()))
+    return start, end
+
+def reply_period(message, title, start, end, fmt):
+    tasks = store.get_tasks_between(message.from_user.id, start, end)
+    if not tasks:
+        bot.reply_to(message, f"🎉 {title}: задач нет")
+        return
+    resp = f"📅 {title}:\n"
+    for tid, desc, due_ts, gid in tasks:
+        resp += f"#{tid} - {desc} {'📅' if gid else ''}\n   {local_dt(due_ts).strftime(fmt)}\n"
     bot.reply_to(message, resp)
 
+@bot.message_handler(commands=['today'])
+def today_command(message):
+    _, end = day_window(0)
+    reply_period(message, "Сегодня", datetime.now(pytz.timezone(TIMEZONE)), end, '%H:%M')
+
+@bot.message_handler(commands=['tomorrow'])
+def tomorrow_command(message):
+    start, end = day_window(1)
+    reply_period(message, f"Завтра ({start.strftime('%d.%m')})", start, end, '%H:%M')
+
+@bot.message_handler(commands=['week'])
+def week_command(message):
+    _, end = day_window(0, days=7)
+    reply_period(message, "Неделя", datetime.now(pytz.timezone(TIMEZONE)), end, '%d.%m %H:%M')
+
 @bot.message_handler(commands=['delete'])
 def delete_command(message):
     parts = message.text.split(' ', 1)
     if len(parts) < 2:
-        bot.reply_to(message, "❌ Укажи ID задачи: /delete 1")
+        bot.reply_to(message, "❌ Укажи ID задачи: /delete 1, /delete 3 5 7, /delete 10-25 или /delete past")
+        return
+    try:
+        deleted = delete_tasks(message.from_user.id, task_io.parse_delete_args(parts[1]))
+        if not deleted:
+            bot.reply_to(message, "❌ Задачи не найдены.")
+        elif len(deleted) == 1:
+            bot.reply_to(message, f"✅ Задача #{deleted[0]} удалена.")
+        else:
+            bot.reply_to(message, f"✅ Удалено задач: {len(deleted)}")
+    except Exception as e:
+        bot.reply_to(message, f"❌ Ошибка: {e}")
+
+# ================== ИМПОРТ ==================
+# Пользователи, от которых после /import ждём файл
+pending_imports = set()
+
+@bot.message_handler(commands=['import'])
+def import_command(message):
+    pending_imports.add(message.from_user.id)
+    bot.reply_to(message, "📥 Пришли файл .csv, .json или .jsonl с колонками description, date, time "
+                          "(как в /add) или description, datetime (ISO 8601).\n"
+                          "Пример CSV:\ndescription,date,time\nВстреча,пн,14.30")
+
+@bot.message_handler(content_types=['document'])
+def import_document(message):
+    user_id = message.from_user.id
+    caption = (message.caption or "").strip()
+    if user_id not in pending_imports and not caption.startswith("/import"):
         return
+    pending_imports.discard(user_id)
     try:
-        tid = int(parts[1])
-        delete_task(tid, message.from_user.id)
-        bot.reply_to(message, f"✅ Задача #{tid} удалена.")
+        if message.document.file_size and message.document.file_size > task_io.IMPORT_MAX_BYTES:
+            bot.reply_to(message, f"❌ Файл больше {task_io.IMPORT_MAX_BYTES // (1024 * 1024)} МБ")
+            return
+        file_info = bot.get_file(message.document.file_id)
+        data = task_io.as_binary(bot.download_file(file_info.file_path))
+        batches, errors = task_io.read_import(data, message.document.file_name, parse_datetime, pytz.timezone(TIMEZONE))
+        task_ids = store.import_tasks(user_id, batches, sync_calendar=calendar_enabled(user_id))
+        bot.reply_to(message, task_io.format_import_report(len(task_ids), errors))
+    except Exception as e:
+        bot.reply_to(message, f"❌ Ошибка импорта: {e}")
+
+# ================== ЭКСПОРТ ==================
+@bot.message_handler(commands=['export'])
+def export_command(message):
+    parts = message.text.split()
+    fmt = parts[1].lower() if len(parts) > 1 else "csv"
+    if fmt not in task_io.EXPORT_FORMATS:
+        bot.reply_to(message, "❌ Формат: /export csv | jsonl | ics")
+        return
+    try:
+        tz = pytz.timezone(TIMEZONE)
+        with task_io.spool_export(store.iter_tasks(message.from_user.id), fmt, tz) as buffer:
+            caption = "📤 Твои задачи"
+            if RENDER_URL:
+                token = task_io.make_export_token(message.from_user.id, fmt, EXPORT_SECRET)
+                caption += f"\n🔗 Ссылка на {task_io.EXPORT_LINK_TTL // 60} мин: {RENDER_URL.rstrip('/')}/export/{token}"
+            bot.send_document(message.chat.id, buffer, caption=caption,
+                              visible_file_name=task_io.export_filename(fmt), reply_to_message_id=message.message_id)
+    except Exception as e:
+        bot.reply_to(message, f"❌ Ошибка экспорта: {e}")
+
+# ================== СВОЙ GOOGLE CALENDAR ==================
+@bot.message_handler(commands=['connect'])
+def connect_command(message):
+    if not user_calendars.enabled or not OAUTH_REDIRECT_URI:
+        bot.reply_to(message, "❌ Подключение календаря не настроено "
+                              "(нужны credentials.json, GOOGLE_TOKEN_KEY и RENDER_URL или GOOGLE_REDIRECT_URI)")
+        return
+    try:
+        url = google_calendar.authorization_url(GOOGLE_CREDENTIALS_FILE, OAUTH_REDIRECT_URI,
+                                                message.from_user.id, OAUTH_SECRET)
+        kb = InlineKeyboardMarkup()
+        kb.add(InlineKeyboardButton("🔗 Войти через Google", url=url))
+        bot.reply_to(message, f"📅 Разреши доступ к своему Google Calendar — ссылка действует "
+                              f"{google_calendar.OAUTH_STATE_TTL // 60} мин.", reply_markup=kb)
+    except Exception as e:
+        bot.reply_to(message, f"❌ Ошибка: {e}")
+
+@bot.message_handler(commands=['disconnect'])
+def disconnect_command(message):
+    try:
+        if user_calendars.unlink(message.from_user.id):
+            bot.reply_to(message, "✅ Google Calendar отключён. Доступ можно отозвать и в настройках "
+                                  "аккаунта Google: https://myaccount.google.com/permissions")
+        else:
+            bot.reply_to(message, "ℹ️ Свой Google Calendar не был подключён")
     except Exception as e:
         bot.reply_to(message, f"❌ Ошибка: {e}")
 
@@ -272,16 +484,75 @@ def webhook():
     else:
         return "Bot is running!", 200
 
+@app.route("/export/<token>", methods=["GET"])
+def export_download(token):
+    try:
+        user_id, fmt = task_io.parse_export_token(token, EXPORT_SECRET)
+    except ValueError as e:
+        return f"❌ {e}", 403
+    chunks = task_io.export_chunks(store.iter_tasks(user_id), fmt, pytz.timezone(TIMEZONE))
+    mimetype, _ = task_io.EXPORT_FORMATS[fmt]
+    return Response(
+        stream_with_context(chunk.encode("utf-8") for chunk in chunks),
+        mimetype=f"{mimetype}; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{task_io.export_filename(fmt)}"'},
+    )
+
+@app.route("/oauth2/callback", methods=["GET"])
+def oauth_callback():
+    """
+    Google возвращает сюда пользователя после /connect: меняем code на токены и сохраняем их.
+    State одноразовый — гасим его сразу, в том числе когда доступ не выдан.
+    """
+    state = request.args.get("state", "")
+    try:
+        user_id = google_calendar.consume_oauth_state(state, OAUTH_SECRET)
+    except ValueError as e:
+        return f"❌ {e}", 403
+    if request.args.get("error") or not request.args.get("code"):
+        bot.send_message(user_id, "❌ Google Calendar не подключён: доступ не выдан")
+        return "❌ Доступ не выдан. Можно вернуться в Telegram и отправить /connect ещё раз", 400
+    try:
+        user_id, creds = google_calendar.exchange_code(GOOGLE_CREDENTIALS_FILE, OAUTH_REDIRECT_URI,
+                                                       state, request.args["code"], OAUTH_SECRET)
+        user_calendars.link(user_id, creds)
+    except Exception as e:
+        logger.error(f"Ошибка подключения Google Calendar пользователя {user_id}: {e}")
+        return "❌ Не удалось подключить календарь, попробуй /connect ещё раз", 502
+    bot.send_message(user_id, "✅ Google Calendar подключён: новые задачи появятся в твоём календаре")
+    return "✅ Календарь подключён, можно вернуться в Telegram", 200
+
+def metrics_allowed():
+    """Статистика шардов, outbox и кэшей — не для всех: вебхук-приложение торчит наружу"""
+    if METRICS_TOKEN:
+        return hmac.compare_digest(request.headers.get("Authorization", "").encode("utf-8"),
+                                   f"Bearer {METRICS_TOKEN}".encode("utf-8"))
+    return request.remote_addr in ("127.0.0.1", "::1")
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    if not metrics_allowed():
+        return "❌ Доступ запрещён", 403
+    return jsonify({
+        "tasks_cache": storage.cache_stats(),
+        "outbox": storage.outbox_stats(),
+        "calendar_service": calendar_service.stats(),
+        "calendar_breaker": google_calendar.breaker.stats(),
+        "calendar_users": user_calendars.stats(),
+    })
+
 # ================== ЗАПУСК ==================
 if __name__ == "__main__":
     init_db()
+    storage.start_maintenance()
+    backup.start_backups()
+    start_outbox_drainer()
     if os.path.exists(GOOGLE_CREDENTIALS_FILE):
         print(f"✅ Google Calendar настроен ({GOOGLE_CREDENTIALS_FILE})")
     else:
         print(f"ℹ️ Google Calendar не найден")
     print("✅ Бот запущен!")
 
-    RENDER_URL = os.getenv("RENDER_URL")
     bot.remove_webhook()
     bot.set_webhook(url=f"{RENDER_URL}")
     print(f"🌐 Webhook установлен: {RENDER_URL}")
@@ -0,0 +1,1576 @@
+import os
+import re
+import sys
+import json
+import queue
+import sqlite3
+import logging
+import threading
+import time
+import uuid
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+# ================== НАСТРОЙКИ ==================
+DB_PATH = os.getenv("DATABASE_PATH", "tasks.db")
+DB_SHARDS = int(os.getenv("DATABASE_SHARDS", "0"))     # 0 — одна база-файл; N — каталог с N шардами
+DB_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DATABASE_POOL_TIMEOUT", "10"))
+# Все записи идут через один поток-писатель на шард; 0 — каждый поток пишет сам со своим commit
+DB_GROUP_COMMIT = os.getenv("DATABASE_GROUP_COMMIT", "1").lower() in ("1", "true", "yes")
+DB_GROUP_COMMIT_BATCH = int(os.getenv("DATABASE_GROUP_COMMIT_BATCH", "64"))
+DB_GROUP_COMMIT_DELAY_MS = float(os.getenv("DATABASE_GROUP_COMMIT_DELAY_MS", "0"))
+DB_WRITE_TIMEOUT = float(os.getenv("DATABASE_WRITE_TIMEOUT", "30"))   # секунд ждём результат записи
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "balanced")
+TASKS_CACHE_ENTRIES = int(os.getenv("TASKS_CACHE_ENTRIES", "1000"))
+TASKS_CACHE_MB = float(os.getenv("TASKS_CACHE_MB", "16"))
+TASKS_CACHE_MAX_PER_USER = int(os.getenv("TASKS_CACHE_MAX_PER_USER", "500"))
+TASKS_CACHE_TTL = float(os.getenv("TASKS_CACHE_TTL", "60"))
+ARCHIVE_INTERVAL_MINUTES = float(os.getenv("ARCHIVE_INTERVAL_MINUTES", "60"))
+ARCHIVE_AFTER_HOURS = float(os.getenv("ARCHIVE_AFTER_HOURS", "24"))
+ARCHIVE_RETENTION_DAYS = float(os.getenv("ARCHIVE_RETENTION_DAYS", "90"))   # 0 — хранить бессрочно
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "500"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "120"))
+TIMEZONE = os.getenv("TIMEZONE", "Europe/Moscow")
+
+logger = logging.getLogger(__name__)
+
+# Верхняя граница id для keyset-курсоров: (due_ts, _MAX_ID) — «после всех задач в due_ts»
+_MAX_ID = 2 ** 63 - 1
+
+# ================== ПРОФИЛИ SQLITE ==================
+# durable  — WAL + synchronous=FULL: ни одна подтверждённая запись не теряется
+# balanced — WAL + synchronous=NORMAL: один fsync на checkpoint, а не на commit;
+#            при отключении питания можно потерять последние транзакции
+# fast     — WAL + synchronous=OFF, большой mmap и кэш: для бенчмарков и тестов
+PROFILES = {
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "mmap_size": 0,
+        "cache_size": -8000,        # отрицательное значение — в КиБ (8 МБ)
+        "busy_timeout": 10000,
+    },
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 64 * 1024 * 1024,
+        "cache_size": -32000,
+        "busy_timeout": 5000,
+    },
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -128000,
+        "busy_timeout": 2000,
+    },
+}
+
+def apply_profile(conn: sqlite3.Connection, profile: str = None):
+    """Применяем PRAGMA выбранного профиля (SQLITE_PROFILE по умолчанию) к соединению"""
+    name = profile or SQLITE_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Неизвестный SQLITE_PROFILE: {name} (доступны: {', '.join(PROFILES)})")
+    # Действует только на новой (пустой) базе и обязательно до journal_mode=WAL,
+    # который записывает заголовок файла; на существующей базе это no-op
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    for pragma, value in PROFILES[name].items():
+        conn.execute(f"PRAGMA {pragma}={value}")
+    return conn
+
+# ================== ПУЛ СОЕДИНЕНИЙ ==================
+class ConnectionPool:
+    """
+    Ограниченный пул долгоживущих соединений SQLite.
+
+    Соединения создаются лениво (не больше size штук) и переиспользуются
+    между потоками Flask-вебхука и воркерами диспетчера, поэтому открытие
+    файла и разбор схемы происходят один раз на соединение, а не на запрос.
+    readonly=True — соединения только для чтения (PRAGMA query_only): в WAL
+    читатели не ждут писателя и не могут случайно взять блокировку записи.
+    """
+
+    def __init__(self, path: str, size: int = DB_POOL_SIZE, timeout: float = DB_POOL_TIMEOUT,
+                 profile: str = None, readonly: bool = False):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.profile = profile
+        self.readonly = readonly
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        # check_same_thread=False: соединение отдаётся строго одному потоку за раз
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        apply_profile(conn, self.profile)
+        if self.readonly:
+            conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Берём свободное соединение или создаём новое, пока не достигнут лимит"""
+        if self._closed:
+            raise RuntimeError("Пул соединений закрыт")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"Нет свободных соединений с БД за {self.timeout} с")
+
+    def release(self, conn: sqlite3.Connection):
+        """Возвращаем соединение в пул (незавершённая транзакция откатывается)"""
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Соединение на время блока with.
+        При нормальном выходе делается commit, при исключении — rollback.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Закрываем все простаивающие соединения"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+# ================== ШАРДЫ ==================
+# С DATABASE_SHARDS=N путь DATABASE_PATH — каталог: shard-000.db ... и shards.json
+# с числом шардов. Пользователь целиком живёт в одном шарде (crc32(user_id) % N),
+# так что у каждого шарда своя блокировка записи и свой fsync.
+# ID задач уникальны по всем шардам: счётчик AUTOINCREMENT шарда k продолжается
+# не ниже k·SHARD_ID_SPAN (после перешардирования — ещё и выше последнего ID исходной базы),
+# так что номер из /delete ID или /edit ID не совпадёт с задачей в другом шарде.
+SHARDS_META = "shards.json"
+SHARD_ID_SPAN = 10 ** 9   # задач на шард до пересечения с диапазоном следующего
+
+def shard_file(directory: str, shard: int) -> str:
+    return os.path.join(directory, f"shard-{shard:03d}.db")
+
+def _reserve_task_ids(conn, shard: int, base: int = 0):
+    """Поднимаем счётчик ID задач шарда до base + shard·SHARD_ID_SPAN (если он ниже)"""
+    floor = base + shard * SHARD_ID_SPAN
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='tasks'").fetchone()
+    if row is None:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('tasks', ?)", (floor,))
+    elif row[0] < floor:
+        conn.execute("UPDATE sqlite_sequence SET seq=? WHERE name='tasks'", (floor,))
+
+def shard_index(user_id, count: int) -> int:
+    """Номер шарда пользователя; не зависит от процесса и PYTHONHASHSEED"""
+    if user_id is None or count <= 1:
+        return 0
+    return zlib.crc32(str(int(user_id)).encode("ascii")) % count
+
+def _write_shards_meta(directory: str, count: int):
+    tmp = os.path.join(directory, SHARDS_META + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"shards": count, "hash": "crc32"}, f)
+    os.replace(tmp, os.path.join(directory, SHARDS_META))
+
+def read_shards_meta(directory: str) -> int:
+    path = os.path.join(directory, SHARDS_META)
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return int(json.load(f)["shards"])
+
+def _resolve_shard_paths() -> list:
+    """Файлы баз по DATABASE_PATH/DATABASE_SHARDS; каталог шардов создаётся при первом запуске"""
+    if not DB_SHARDS and not os.path.isdir(DB_PATH):
+        return [DB_PATH]
+    os.makedirs(DB_PATH, exist_ok=True)
+    stored = read_shards_meta(DB_PATH)
+    if stored and DB_SHARDS and stored != DB_SHARDS:
+        # Другое число шардов перенаправило бы пользователей в чужие файлы
+        raise RuntimeError(
+            f"В {DB_PATH} {stored} шардов, а DATABASE_SHARDS={DB_SHARDS}: используйте reshard.py"
+        )
+    if not stored:
+        if not DB_SHARDS:
+            raise RuntimeError(f"{DB_PATH} — каталог без {SHARDS_META}: задайте DATABASE_SHARDS")
+        _write_shards_meta(DB_PATH, DB_SHARDS)
+    return [shard_file(DB_PATH, i) for i in range(stored or DB_SHARDS)]
+
+
+_pools = {}
+_read_pools = {}
+_shard_paths = None
+_pool_lock = threading.Lock()
+
+def shard_paths() -> list:
+    """Пути к файлам баз: один элемент без шардирования"""
+    global _shard_paths
+    if _shard_paths is None:
+        with _pool_lock:
+            if _shard_paths is None:
+                _shard_paths = _resolve_shard_paths()
+    return _shard_paths
+
+def shard_count() -> int:
+    return len(shard_paths())
+
+def shard_of(user_id) -> int:
+    """Шард, в котором лежат задачи пользователя"""
+    return shard_index(user_id, shard_count())
+
+def get_pool(shard: int = 0, readonly: bool = False) -> ConnectionPool:
+    """Пул соединений шарда: для чтения или для записи (создаётся при первом обращении)"""
+    pools = _read_pools if readonly else _pools
+    pool = pools.get(shard)
+    if pool is None:
+        path = shard_paths()[shard]
+        with _pool_lock:
+            pool = pools.get(shard)
+            if pool is None:
+                pool = pools[shard] = ConnectionPool(path, DB_POOL_SIZE, readonly=readonly)
+    return pool
+
+def connection(shard: int = 0):
+    """Соединение с правом записи: миграции и запись без потока-писателя"""
+    return get_pool(shard).connection()
+
+def read_connection(shard: int = 0):
+    """Соединение только для чтения из пула читателей шарда"""
+    return get_pool(shard, readonly=True).connection()
+
+def close_pool():
+    """Закрываем пулы всех шардов (например, при остановке бота или в бенчмарках)"""
+    global _shard_paths
+    with _pool_lock:
+        for pool in (*_pools.values(), *_read_pools.values()):
+            pool.close()
+        _pools.clear()
+        _read_pools.clear()
+        _shard_paths = None
+
+# ================== ГРУППОВАЯ ЗАПИСЬ ==================
+class GroupCommitWriter:
+    """
+    Единственный поток-писатель шарда: только он держит соединение с правом
+    записи, забирает из очереди операции записи и фиксирует их пачками —
+    один commit (и один fsync) на пачку. Потоки вебхука и диспетчера не
+    конкурируют за блокировку записи, поэтому нет «database is locked» и
+    повторов по busy_timeout.
+
+    Пачка — всё, что накопилось в очереди за время прошлого commit; при
+    конкурентной записи писатель дополнительно ждёт догоняющих, пока не
+    наберётся max_batch операций или не пройдёт max_delay_ms. Каждая операция выполняется внутри
+    SAVEPOINT, поэтому ошибка одной не откатывает остальные. Результат
+    операции отдаётся через Future только после commit.
+
+    Если поток не смог открыть базу или соединение сломалось (ошибка ROLLBACK),
+    он завершается, а все ждущие и новые Future получают исключение;
+    get_writer() создаёт для шарда нового писателя.
+    """
+
+    def __init__(self, path: str, max_batch: int = DB_GROUP_COMMIT_BATCH,
+                 max_delay_ms: float = DB_GROUP_COMMIT_DELAY_MS, profile: str = None):
+        self.path = path
+        self.profile = profile
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self._queue = queue.Queue()
+        self._state_lock = threading.Lock()
+        self.error = None   # исключение, с которым поток завершился
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def alive(self) -> bool:
+        return self.error is None and self._thread.is_alive()
+
+    def submit(self, op) -> Future:
+        """op(conn) -> результат; выполняется в потоке-писателе"""
+        future = Future()
+        with self._state_lock:
+            if self.error is not None:
+                future.set_exception(self.error)
+            else:
+                self._queue.put((op, future))
+        return future
+
+    def close(self):
+        """Дописываем очередь и останавливаем поток"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        # Сначала забираем всё, что уже накопилось, пока шёл прошлый commit
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                return batch
+            batch.append(item)
+        # Ждём догоняющих, только если запись действительно конкурентная
+        # (как commit_siblings в PostgreSQL): одиночная вставка не ждёт зря
+        deadline = time.monotonic() + self.max_delay
+        while 1 < len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        conn = batch = None
+        try:
+            # isolation_level=None: транзакцией управляем сами
+            conn = sqlite3.connect(self.path, timeout=DB_POOL_TIMEOUT, isolation_level=None)
+            apply_profile(conn, self.profile)
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                self._commit_batch(conn, batch)
+                batch = None
+        except BaseException as e:
+            logger.error(f"Поток-писатель {self.path} остановлен: {e}")
+            self._fail(e, batch or [])
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _fail(self, error, batch):
+        """Поток умирает: отклоняем текущую пачку, очередь и все будущие submit"""
+        with self._state_lock:
+            self.error = error
+        pending = list(batch)
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                pending.append(item)
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(error)
+
+    def _commit_batch(self, conn, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for op, future in batch:
+                conn.execute("SAVEPOINT op")
+                try:
+                    results.append((future, op(conn), None))
+                    conn.execute("RELEASE op")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    results.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            # Если не удался и ROLLBACK, исключение уходит в _run: соединение больше не годится
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.error(f"Ошибка групповой записи ({len(batch)} операций): {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+_writers = {}
+_writer_lock = threading.Lock()
+
+def get_writer(shard: int = 0):
+    """Поток-писатель шарда или None, если DATABASE_GROUP_COMMIT выключен"""
+    if not DB_GROUP_COMMIT:
+        return None
+    writer = _writers.get(shard)
+    if writer is None or not writer.alive:
+        path = shard_paths()[shard]
+        with _writer_lock:
+            writer = _writers.get(shard)
+            if writer is not None and not writer.alive:
+                # Упавший писатель убираем: следующая запись попробует открыть базу заново
+                logger.warning(f"Поток-писатель шарда {shard} перезапускается после ошибки: {writer.error}")
+                del _writers[shard]
+                writer = None
+            if writer is None:
+                writer = _writers[shard] = GroupCommitWriter(path)
+    return writer
+
+def close_writer():
+    """Останавливаем потоки-писатели всех шардов, дописав очереди"""
+    with _writer_lock:
+        for writer in _writers.values():
+            writer.close()
+        _writers.clear()
+
+def write_async(op, shard: int = 0) -> Future:
+    """
+    Ставим операцию записи op(conn) в очередь потока-писателя шарда и сразу
+    возвращаем Future с её результатом (он появится после commit).
+    С DATABASE_GROUP_COMMIT=0 операция выполняется здесь же, Future уже готов.
+    """
+    writer = get_writer(shard)
+    if writer is not None:
+        return writer.submit(op)
+    future = Future()
+    try:
+        with connection(shard) as conn:
+            future.set_result(op(conn))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def wait_result(future: Future, timeout: float = None):
+    """Результат записи, но не дольше timeout (DATABASE_WRITE_TIMEOUT) секунд"""
+    timeout = DB_WRITE_TIMEOUT if timeout is None else timeout
+    try:
+        return future.result(timeout)
+    except TimeoutError:
+        if future.done():
+            raise
+        raise TimeoutError(f"Запись в базу не завершилась за {timeout:g} с") from None
+
+def write(op, shard: int = 0):
+    """Выполняем операцию записи op(conn) в шарде и ждём её результат (не дольше DATABASE_WRITE_TIMEOUT)"""
+    return wait_result(write_async(op, shard))
+
+# ================== МИГРАЦИИ СХЕМЫ ==================
+def _column_names(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def _m001_create_tasks(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        description TEXT,
+        datetime TEXT,
+        google_event_id TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+def _m002_add_google_event_id(conn):
+    # Базы, созданные bot.py, не имеют колонки google_event_id
+    if "google_event_id" not in _column_names(conn, "tasks"):
+        conn.execute("ALTER TABLE tasks ADD COLUMN google_event_id TEXT")
+
+def _m003_index_user_datetime(conn):
+    # get_tasks: WHERE user_id=? AND datetime > ? ORDER BY datetime
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_datetime ON tasks (user_id, datetime)")
+
+def _m004_add_due_ts(conn):
+    # Время задачи как целое число секунд UTC: сравнения и сортировка без разбора строк
+    if "due_ts" not in _column_names(conn, "tasks"):
+        conn.execute("ALTER TABLE tasks ADD COLUMN due_ts INTEGER")
+    local_tz = ZoneInfo(TIMEZONE)
+    rows = conn.execute("SELECT id, datetime FROM tasks WHERE due_ts IS NULL").fetchall()
+    updates = []
+    for task_id, dt_str in rows:
+        try:
+            dt = datetime.fromisoformat(dt_str)
+        except (TypeError, ValueError):
+            logger.warning(f"Задача {task_id}: не удалось разобрать дату {dt_str!r}")
+            continue
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=local_tz)
+        updates.append((int(dt.timestamp()), task_id))
+    conn.executemany("UPDATE tasks SET due_ts=? WHERE id=?", updates)
+
+def _m005_index_user_due_ts(conn):
+    # Диапазонные запросы теперь идут по due_ts, старый текстовый индекс не нужен
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_due ON tasks (user_id, due_ts)")
+    conn.execute("DROP INDEX IF EXISTS idx_tasks_user_datetime")
+
+def _m006_tasks_archive(conn):
+    # Прошедшие задачи переезжают сюда, чтобы tasks рос только с предстоящей работой
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS tasks_archive (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        description TEXT,
+        datetime TEXT,
+        due_ts INTEGER,
+        google_event_id TEXT,
+        created_at TIMESTAMP,
+        archived_at INTEGER
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_archive_due ON tasks_archive (due_ts)")
+    # Поиск прошедших задач без привязки к пользователю
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_due ON tasks (due_ts)")
+
+def _m007_tasks_fts(conn):
+    # Полнотекстовый индекс по описаниям (внешний контент — сама таблица tasks).
+    # user_id тоже индексируется: фильтр по пользователю делает FTS, а не JOIN
+    try:
+        conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+            description, user_id,
+            content='tasks', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """)
+    except sqlite3.OperationalError as e:
+        logger.warning(f"FTS5 недоступен, /find будет искать через LIKE: {e}")
+        return
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_ai AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts (rowid, description, user_id) VALUES (new.id, new.description, new.user_id);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_ad AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, description, user_id) VALUES ('delete', old.id, old.description, old.user_id);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_au AFTER UPDATE OF description, user_id ON tasks BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, description, user_id) VALUES ('delete', old.id, old.description, old.user_id);
+        INSERT INTO tasks_fts (rowid, description, user_id) VALUES (new.id, new.description, new.user_id);
+    END
+    """)
+    conn.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+
+def _m008_outbox(conn):
+    # Побочные эффекты в Google Calendar, записанные в той же транзакции, что и задача.
+    # next_attempt_at IS NULL — операция исчерпала попытки и ждёт разбора вручную
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id INTEGER,
+        user_id INTEGER,
+        op TEXT NOT NULL,
+        payload TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at INTEGER DEFAULT 0,
+        last_error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_next ON outbox (next_attempt_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_task ON outbox (task_id)")
+
+def _m009_google_accounts(conn):
+    # Привязанный Google-аккаунт пользователя (/connect): refresh token зашифрован (google_calendar.TokenCipher)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS google_accounts (
+        user_id INTEGER PRIMARY KEY,
+        refresh_token BLOB NOT NULL,
+        scopes TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+def _m010_google_calendar(conn):
+    # В каком календаре лежит событие задачи (CALENDAR_OWN / CALENDAR_SHARED): update и delete
+    # идут туда же, даже если пользователь с тех пор сделал /connect или /disconnect.
+    # NULL — событие создано раньше, такие операции идут по текущей привязке
+    for table in ("tasks", "tasks_archive"):
+        if "google_calendar" not in _column_names(conn, table):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN google_calendar TEXT")
+
+def _m011_oauth_states(conn):
+    # Одноразовые nonce из state ссылок /connect: callback гасит nonce, повторно ссылку не использовать.
+    # Живут минуты (OAUTH_STATE_TTL), поэтому reshard их не переносит
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS oauth_states (
+        nonce TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        expires_at INTEGER NOT NULL
+    )
+    """)
+
+# Порядок важен: миграции применяются строго по возрастанию версии
+MIGRATIONS = [
+    (1, "таблица tasks", _m001_create_tasks),
+    (2, "колонка google_event_id", _m002_add_google_event_id),
+    (3, "индекс (user_id, datetime)", _m003_index_user_datetime),
+    (4, "колонка due_ts (UTC epoch) с заполнением", _m004_add_due_ts),
+    (5, "индекс (user_id, due_ts)", _m005_index_user_due_ts),
+    (6, "таблица tasks_archive", _m006_tasks_archive),
+    (7, "полнотекстовый индекс tasks_fts", _m007_tasks_fts),
+    (8, "таблица outbox для Google Calendar", _m008_outbox),
+    (9, "таблица google_accounts", _m009_google_accounts),
+    (10, "колонка google_calendar", _m010_google_calendar),
+    (11, "таблица oauth_states", _m011_oauth_states),
+]
+
+def schema_version(conn) -> int:
+    """Текущая версия схемы (0 — миграции ещё не применялись)"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+def migrate(conn) -> int:
+    """
+    Применяем недостающие миграции, каждую в своей транзакции.
+    BEGIN IMMEDIATE не даёт двум процессам применить одну миграцию дважды.
+    """
+    current = schema_version(conn)
+    conn.commit()
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= schema_version(conn):
+                conn.rollback()
+                continue
+            step(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info(f"Миграция {version} применена: {description}")
+        current = version
+    return current
+
+def init_db() -> int:
+    """Создаём/обновляем схему БД (каждого шарда) до последней версии"""
+    versions = []
+    for shard in range(shard_count()):
+        with connection(shard) as conn:
+            versions.append(migrate(conn))
+            if shard:
+                _reserve_task_ids(conn, shard)
+    return min(versions)
+
+# ================== КЭШ ПРЕДСТОЯЩИХ ЗАДАЧ ==================
+_TOO_BIG = object()
+
+def _row_key(row):
+    return (row[2], row[0])
+
+def _rows_size(rows) -> int:
+    """Примерный объём списка задач в памяти, байт"""
+    return sys.getsizeof(rows) + sum(sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row) for row in rows)
+
+class UpcomingCache:
+    """
+    LRU-кэш предстоящих задач: user_id → список строк, отсортированный по (due_ts, id).
+
+    Ограничен числом записей и примерным объёмом в байтах. Пользователи, у которых
+    задач больше max_per_user, запоминаются как «слишком большие» и читаются из SQLite.
+    Запись сбрасывается при add_task/delete_task этого пользователя; прошедшие задачи
+    отрезаются при каждом чтении; ttl ограничивает устаревание, если в ту же базу
+    пишет другой процесс (bot.py и simple_bot.py).
+
+    Поколение пользователя защищает от гонки «прочитали до записи — положили после».
+    """
+
+    def __init__(self, max_entries=TASKS_CACHE_ENTRIES, max_bytes=int(TASKS_CACHE_MB * 1024 * 1024),
+                 max_per_user=TASKS_CACHE_MAX_PER_USER, ttl=TASKS_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_per_user = max_per_user
+        self.ttl = ttl
+        self._entries = OrderedDict()   # user_id → (rows | _TOO_BIG, size, loaded_at)
+        self._generations = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def generation(self, user_id) -> int:
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def get(self, user_id, now_ts):
+        """Список предстоящих задач, _TOO_BIG или None при промахе"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or time.monotonic() - entry[2] > self.ttl:
+                if entry is not None:
+                    self._drop(user_id)
+                self.misses += 1
+                return None
+            rows, size, loaded_at = entry
+            if rows is not _TOO_BIG:
+                # Отрезаем задачи, время которых уже прошло
+                passed = bisect_right(rows, (now_ts, _MAX_ID), key=_row_key)
+                if passed:
+                    rows = rows[passed:]
+                    new_size = _rows_size(rows)
+                    self._bytes += new_size - size
+                    self._entries[user_id] = (rows, new_size, loaded_at)
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return rows
+
+    def put(self, user_id, rows, generation):
+        """Кладём список, если с момента чтения пользователь не менялся"""
+        size = 64 if rows is _TOO_BIG else _rows_size(rows)
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation or size > self.max_bytes:
+                return
+            self._drop(user_id)
+            self._entries[user_id] = (rows, size, time.monotonic())
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                evicted, _ = next(iter(self._entries.items()))
+                self._drop(evicted)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            if self._drop(user_id):
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._bytes = 0
+
+    def _drop(self, user_id) -> bool:
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return False
+        self._bytes -= entry[1]
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+upcoming_cache = UpcomingCache()
+
+def cache_stats() -> dict:
+    """Счётчики кэша для мониторинга"""
+    return upcoming_cache.stats()
+
+def _upcoming(user_id, now_ts):
+    """
+    Предстоящие задачи из кэша (с чтением из SQLite при промахе).
+    None — у пользователя слишком много задач для кэша или кэш выключен.
+    """
+    if not upcoming_cache.enabled:
+        return None
+    rows = upcoming_cache.get(user_id, now_ts)
+    if rows is None:
+        generation = upcoming_cache.generation(user_id)
+        with read_connection(shard_of(user_id)) as conn:
+            rows = conn.execute(
+                "SELECT id, description, due_ts, google_event_id FROM tasks "
+                "WHERE user_id=? AND due_ts > ? ORDER BY due_ts, id LIMIT ?",
+                (user_id, now_ts, upcoming_cache.max_per_user + 1)
+            ).fetchall()
+        if len(rows) > upcoming_cache.max_per_user:
+            rows = _TOO_BIG
+        upcoming_cache.put(user_id, rows, generation)
+    return None if rows is _TOO_BIG else rows
+
+# ================== ЗАДАЧИ ==================
+# Строка задачи: (id, description, due_ts, google_event_id), due_ts — секунды UTC.
+# Чтения идут через пул соединений только для чтения, изменения — через поток-писатель
+# шарда; у изменяющих функций wait=False возвращает Future вместо результата.
+
+def _write_for_user(op, user_id, sync_calendar: bool, wait: bool = True):
+    """
+    Изменение задач пользователя: op уходит потоку-писателю его шарда, после commit
+    сбрасываем кэш пользователя и будим обработчик outbox. Сброс привязан к самой записи:
+    если wait_result не дождался её (TimeoutError), запись всё равно сбросит кэш, когда завершится.
+    """
+    def committed(_):
+        upcoming_cache.invalidate(user_id)
+        if sync_calendar:
+            _outbox_signal.set()
+
+    future = write_async(op, shard_of(user_id))
+    future.add_done_callback(committed)
+    if not wait:
+        return future
+    result = wait_result(future)
+    # result() просыпается раньше, чем писатель вызовет колбэки: сбрасываем и здесь,
+    # чтобы следующее чтение этого же потока уже видело запись
+    committed(future)
+    return result
+
+def to_timestamp(dt: datetime) -> int:
+    """Aware-datetime → целые секунды UTC"""
+    return int(dt.timestamp())
+
+def add_task(user_id: int, description: str, dt: datetime, google_event_id=None, sync_calendar: bool = False,
+             wait: bool = True) -> int:
+    """
+    Добавление задачи, возвращает её ID.
+    sync_calendar=True — в той же транзакции ставим в outbox создание события календаря.
+    """
+    def op(conn):
+        task_id = conn.execute(
+            "INSERT INTO tasks (user_id, description, datetime, due_ts, google_event_id) VALUES (?, ?, ?, ?, ?)",
+            (user_id, description, dt.isoformat(), to_timestamp(dt), google_event_id)
+        ).lastrowid
+        if sync_calendar and not google_event_id:
+            _enqueue(conn, [(task_id, user_id, "create", _create_payload(description, to_timestamp(dt)))])
+        return task_id
+    return _write_for_user(op, user_id, sync_calendar, wait)
+
+def get_tasks(user_id: int, now_ts: int = None):
+    """Предстоящие задачи пользователя, отсортированные по времени"""
+    if now_ts is None:
+        now_ts = int(time.time())
+    rows = _upcoming(user_id, now_ts)
+    if rows is not None:
+        return list(rows)
+    with read_connection(shard_of(user_id)) as conn:
+        return conn.execute(
+            "SELECT id, description, due_ts, google_event_id FROM tasks "
+            "WHERE user_id=? AND due_ts > ? ORDER BY due_ts, id",
+            (user_id, now_ts)
+        ).fetchall()
+
+def get_task_by_id(task_id: int, user_id: int):
+    """Задача по ID (или None)"""
+    with read_connection(shard_of(user_id)) as conn:
+        return conn.execute(
+            "SELECT id, description, due_ts, google_event_id FROM tasks WHERE id=? AND user_id=?",
+            (task_id, user_id)
+        ).fetchone()
+
+# Параметров в одном IN (...) — с запасом ниже SQLITE_MAX_VARIABLE_NUMBER старых сборок (999)
+DELETE_CHUNK = 500
+
+def delete_tasks(user_id: int, task_ids, sync_calendar: bool = False, wait: bool = True) -> list:
+    """
+    Удаление нескольких задач пользователя: DELETE ... WHERE user_id=? AND id IN (...)
+    RETURNING — без предварительного SELECT, всё в одной транзакции.
+    sync_calendar=True — удаление событий календаря ставится в outbox той же транзакцией.
+    Возвращает [(id, google_event_id)] реально удалённых задач.
+    """
+    task_ids = list(dict.fromkeys(int(task_id) for task_id in task_ids))
+    if not task_ids:
+        return []
+
+    def op(conn):
+        deleted = []
+        for i in range(0, len(task_ids), DELETE_CHUNK):
+            chunk = task_ids[i:i + DELETE_CHUNK]
+            deleted += conn.execute(
+                f"DELETE FROM tasks WHERE user_id=? AND id IN ({','.join('?' * len(chunk))}) "
+                "RETURNING id, google_event_id, google_calendar",
+                (user_id, *chunk)
+            ).fetchall()
+        if sync_calendar:
+            _enqueue_deletes(conn, user_id, deleted)
+        return [row[:2] for row in deleted]
+    return _write_for_user(op, user_id, sync_calendar, wait)
+
+def delete_task(task_id: int, user_id: int, sync_calendar: bool = False):
+    """
+    Удаление задачи одним запросом.
+    Возвращает (id, google_event_id) удалённой задачи или None, если задачи не было.
+    """
+    deleted = delete_tasks(user_id, [task_id], sync_calendar)
+    return deleted[0] if deleted else None
+
+def delete_past_tasks(user_id: int, now_ts: int = None, sync_calendar: bool = False, wait: bool = True) -> list:
+    """Удаление всех прошедших задач пользователя, возвращает [(id, google_event_id)]"""
+    if now_ts is None:
+        now_ts = int(time.time())
+
+    def op(conn):
+        deleted = conn.execute(
+            "DELETE FROM tasks WHERE user_id=? AND due_ts <= ? RETURNING id, google_event_id, google_calendar",
+            (user_id, now_ts)
+        ).fetchall()
+        if sync_calendar:
+            _enqueue_deletes(conn, user_id, deleted)
+        return [row[:2] for row in deleted]
+    return _write_for_user(op, user_id, sync_calendar, wait)
+
+def get_tasks_between(user_id: int, start: datetime, end: datetime, now_ts: int = None):
+    """Задачи пользователя в полуинтервале [start, end), отсортированные по времени"""
+    if now_ts is None:
+        now_ts = int(time.time())
+    start_ts, end_ts = to_timestamp(start), to_timestamp(end)
+    # В кэше только будущие задачи — он годится, если окно не захватывает прошлое
+    rows = _upcoming(user_id, now_ts) if start_ts >= now_ts else None
+    if rows is not None:
+        lo = bisect_left(rows, (start_ts, 0), key=_row_key)
+        hi = bisect_left(rows, (end_ts, 0), key=_row_key)
+        return rows[lo:hi]
+    with read_connection(shard_of(user_id)) as conn:
+        return conn.execute(
+            "SELECT id, description, due_ts, google_event_id FROM tasks "
+            "WHERE user_id=? AND due_ts >= ? AND due_ts < ? ORDER BY due_ts, id",
+            (user_id, start_ts, end_ts)
+        ).fetchall()
+
+PAGE_SIZE = int(os.getenv("TASKS_PAGE_SIZE", "10"))
+
+def get_tasks_page(user_id: int, after=None, limit: int = PAGE_SIZE, now_ts: int = None):
+    """
+    Страница предстоящих задач (keyset-пагинация).
+
+    after — курсор (due_ts, id) последней задачи предыдущей страницы.
+    Возвращает (rows, next_cursor); next_cursor = None на последней странице.
+    Запрос читает не больше limit + 1 строк, независимо от номера страницы.
+    """
+    if now_ts is None:
+        now_ts = int(time.time())
+    # (due_ts, id) > (now, MAX_ID) эквивалентно due_ts > now
+    cursor = max(tuple(after) if after else (now_ts, _MAX_ID), (now_ts, _MAX_ID))
+    cached = _upcoming(user_id, now_ts)
+    if cached is not None:
+        lo = bisect_right(cached, cursor, key=_row_key)
+        rows = cached[lo:lo + limit + 1]
+    else:
+        with read_connection(shard_of(user_id)) as conn:
+            rows = conn.execute(
+                "SELECT id, description, due_ts, google_event_id FROM tasks "
+                "WHERE user_id=? AND (due_ts, id) > (?, ?) ORDER BY due_ts, id LIMIT ?",
+                (user_id, cursor[0], cursor[1], limit + 1)
+            ).fetchall()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (rows[-1][2], rows[-1][0])
+    return rows, None
+
+def import_tasks(user_id: int, batches, sync_calendar: bool = False, wait: bool = True) -> list:
+    """
+    Массовая вставка: batches — списки пар (описание, aware-datetime).
+    Все пачки пишутся через executemany в одной транзакции; возвращает ID новых задач.
+    sync_calendar=True — создание событий ставится в outbox той же транзакцией.
+    """
+    def op(conn):
+        count = 0
+        for batch in batches:
+            conn.executemany(
+                "INSERT INTO tasks (user_id, description, datetime, due_ts) VALUES (?, ?, ?, ?)",
+                [(user_id, description, dt.isoformat(), to_timestamp(dt)) for description, dt in batch]
+            )
+            count += len(batch)
+        if not count:
+            return []
+        # Блокировка записи удерживается до commit, а AUTOINCREMENT монотонен,
+        # поэтому последние count задач пользователя — ровно вставленные сейчас
+        rows = conn.execute(
+            "SELECT id, description, due_ts FROM tasks WHERE user_id=? ORDER BY id DESC LIMIT ?", (user_id, count)
+        ).fetchall()[::-1]
+        if sync_calendar:
+            _enqueue(conn, [
+                (task_id, user_id, "create", _create_payload(description, due_ts))
+                for task_id, description, due_ts in rows
+            ])
+        return [row[0] for row in rows]
+    return _write_for_user(op, user_id, sync_calendar, wait)
+
+def update_task(task_id: int, user_id: int, description: str = None, dt: datetime = None,
+                sync_calendar: bool = False, wait: bool = True) -> bool:
+    """
+    Изменение описания и/или времени задачи; событие календаря обновляется через outbox.
+    Ещё не забранное создание события просто получает новые данные; если создание уже
+    выполняется (attempts > 0), ставим update — claim_outbox не отдаст его раньше create.
+    """
+    def op(conn):
+        row = conn.execute(
+            "UPDATE tasks SET description=COALESCE(?, description), datetime=COALESCE(?, datetime), "
+            "due_ts=COALESCE(?, due_ts) WHERE id=? AND user_id=? "
+            "RETURNING description, due_ts, google_event_id, google_calendar",
+            (description, dt.isoformat() if dt else None, to_timestamp(dt) if dt else None, task_id, user_id)
+        ).fetchone()
+        if not row or not sync_calendar:
+            return row is not None
+        new_description, due_ts, google_event_id, calendar = row
+        create = conn.execute(
+            "SELECT id, attempts, payload FROM outbox WHERE task_id=? AND op='create' ORDER BY id LIMIT 1",
+            (task_id,)
+        ).fetchone()
+        if create is not None:
+            payload = json.loads(create[2] or "{}")
+            if create[1] == 0 or not payload.get("event_id"):
+                payload.update(description=new_description, due_ts=due_ts)
+                conn.execute("UPDATE outbox SET payload=? WHERE id=?", (json.dumps(payload, ensure_ascii=False), create[0]))
+                return True
+            # Календарь станет известен, когда create выполнится: complete_outbox_many допишет его в update
+            google_event_id = payload["event_id"]
+        if google_event_id:
+            # Незабранные прошлые update больше не нужны: новый несёт актуальные данные
+            conn.execute("DELETE FROM outbox WHERE task_id=? AND op='update' AND attempts=0", (task_id,))
+            _enqueue(conn, [(task_id, user_id, "update", {
+                "event_id": google_event_id, "calendar": calendar, "description": new_description, "due_ts": due_ts
+            })])
+        return True
+    return _write_for_user(op, user_id, sync_calendar, wait)
+
+# ================== OUTBOX (GOOGLE CALENDAR) ==================
+# Операции: create {description, due_ts, event_id} · update {event_id, calendar, description, due_ts} ·
+# delete {event_id, calendar}. calendar — где лежит событие (см. _m010_google_calendar); create идёт
+# в календарь по текущей привязке пользователя, и обработчик сообщает его в complete_outbox_many.
+# Строка пишется в той же транзакции, что и изменение задачи, поэтому падение процесса
+# между записью в БД и вызовом Google не оставляет «осиротевших» событий.
+
+CALENDAR_OWN = "own"         # календарь пользователя, привязанный через /connect
+CALENDAR_SHARED = "shared"   # общий календарь из token.json
+
+def _create_payload(description: str, due_ts: int) -> dict:
+    # ID события выбираем сами (base32hex: 0-9a-v): повтор create после падения
+    # между вставкой в Google и complete_outbox получит 409, а не второе событие
+    return {"description": description, "due_ts": due_ts, "event_id": uuid.uuid4().hex}
+
+def _enqueue(conn, items):
+    """items: [(task_id, user_id, op, payload)]"""
+    conn.executemany(
+        "INSERT INTO outbox (task_id, user_id, op, payload) VALUES (?, ?, ?, ?)",
+        [(task_id, user_id, op, json.dumps(payload, ensure_ascii=False)) for task_id, user_id, op, payload in items]
+    )
+
+def _enqueue_deletes(conn, user_id, deleted):
+    # Создание, которое ещё не выполнено, просто отменяем; для созданных событий ставим удаление
+    task_ids = [task_id for task_id, _, _ in deleted]
+    for i in range(0, len(task_ids), DELETE_CHUNK):
+        chunk = task_ids[i:i + DELETE_CHUNK]
+        conn.execute(
+            f"DELETE FROM outbox WHERE op IN ('create', 'update') AND task_id IN ({','.join('?' * len(chunk))})",
+            chunk
+        )
+    _enqueue(conn, [
+        (task_id, user_id, "delete", {"event_id": google_event_id, "calendar": calendar})
+        for task_id, google_event_id, calendar in deleted if google_event_id
+    ])
+
+_outbox_signal = threading.Event()
+
+# ID операции outbox снаружи — глобальный: local_id * число шардов + шард.
+# Без шардирования он совпадает с id строки.
+def _outbox_key(shard: int, local_id: int) -> int:
+    return local_id * shard_count() + shard
+
+def _outbox_shard(outbox_id: int):
+    return outbox_id % shard_count(), outbox_id // shard_count()
+
+def wait_for_outbox(timeout: float) -> bool:
+    """Ждём новых операций в outbox (в этом процессе) не дольше timeout секунд"""
+    signalled = _outbox_signal.wait(timeout)
+    _outbox_signal.clear()
+    return signalled
+
+def claim_outbox(limit: int = 50, lease_seconds: int = OUTBOX_LEASE_SECONDS, now_ts: int = None) -> list:
+    """
+    Забираем до limit готовых к выполнению операций и «арендуем» их на lease_seconds:
+    если процесс упадёт посреди вызова Google, операция вернётся в очередь по истечении аренды.
+    Операции одной задачи выполняются по порядку: следующая не забирается, пока в outbox
+    есть более ранняя (кроме исчерпавших попытки). Очередь идёт по (next_attempt_at, id) — этот порядок
+    отдаёт индекс idx_outbox_next без сканирования таблицы и сортировки.
+    Возвращает [(id, task_id, user_id, op, payload dict, attempts)].
+    """
+    if now_ts is None:
+        now_ts = int(time.time())
+
+    def op(conn):
+        return conn.execute(
+            "UPDATE outbox SET next_attempt_at=?, attempts=attempts + 1 WHERE id IN "
+            "(SELECT id FROM outbox WHERE next_attempt_at <= ? AND (task_id IS NULL OR NOT EXISTS ("
+            "    SELECT 1 FROM outbox earlier WHERE earlier.task_id = outbox.task_id AND earlier.id < outbox.id"
+            "    AND earlier.next_attempt_at IS NOT NULL)) "
+            "ORDER BY next_attempt_at, id LIMIT ?) "
+            "RETURNING id, task_id, user_id, op, payload, attempts",
+            (now_ts + lease_seconds, now_ts, limit - len(items))
+        ).fetchall()
+
+    items = []
+    for shard in range(shard_count()):
+        if len(items) >= limit:
+            break
+        items += sorted(
+            (_outbox_key(shard, local_id), task_id, user_id, kind, json.loads(payload or "{}"), attempts)
+            for local_id, task_id, user_id, kind, payload, attempts in write(op, shard)
+        )
+    return items
+
+def complete_outbox(outbox_id: int, task_id: int = None, google_event_id: str = None, user_id: int = None,
+                    calendar: str = None):
+    """
+    Операция выполнена: удаляем её из outbox. Для create записываем google_event_id и календарь
+    в задачу; если задачу успели удалить, пока создавалось событие, ставим удаление этого события.
+    """
+    complete_outbox_many([(outbox_id, task_id, user_id, google_event_id, calendar)])
+
+def complete_outbox_many(done):
+    """
+    Пачка выполненных операций [(outbox_id, task_id, user_id, google_event_id, calendar)] — как
+    complete_outbox, но одной транзакцией на шард (результаты batch-запроса к Calendar API).
+    user_id берётся из операции, а не из строки outbox: её мог удалить delete_tasks.
+    """
+    by_shard = {}
+    for outbox_id, *rest in done:
+        shard, local_id = _outbox_shard(outbox_id)
+        by_shard.setdefault(shard, []).append((local_id, *rest))
+
+    def op_for(items):
+        def op(conn):
+            users, orphaned = set(), []
+            for local_id, task_id, user_id, google_event_id, calendar in items:
+                conn.execute("DELETE FROM outbox WHERE id=?", (local_id,))
+                if not google_event_id:
+                    continue
+                updated = conn.execute(
+                    "UPDATE tasks SET google_event_id=?, google_calendar=? WHERE id=? RETURNING id",
+                    (google_event_id, calendar, task_id)
+                ).fetchone()
+                if updated is None:
+                    orphaned.append((task_id, user_id, "delete", {"event_id": google_event_id, "calendar": calendar}))
+                    continue
+                users.add(user_id)
+                # update, поставленные пока create выполнялся, не знали календаря
+                conn.execute(
+                    "UPDATE outbox SET payload=json_set(payload, '$.calendar', ?) "
+                    "WHERE task_id=? AND op='update' AND json_extract(payload, '$.calendar') IS NULL",
+                    (calendar, task_id)
+                )
+            if orphaned:
+                _enqueue(conn, orphaned)
+            return users, bool(orphaned)
+        return op
+
+    futures = [write_async(op_for(items), shard) for shard, items in by_shard.items()]
+    for future in futures:
+        users, orphaned = wait_result(future)
+        for user_id in users:
+            upcoming_cache.invalidate(user_id)
+        if orphaned:
+            _outbox_signal.set()
+
+def retry_outbox(outbox_id: int, attempts: int, error: str, delay: float, max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+    """Операция не удалась: откладываем на delay секунд или, после max_attempts, оставляем для разбора"""
+    next_attempt_at = None if attempts >= max_attempts else int(time.time() + delay)
+    shard, local_id = _outbox_shard(outbox_id)
+    write(lambda conn: conn.execute(
+        "UPDATE outbox SET next_attempt_at=?, last_error=? WHERE id=?",
+        (next_attempt_at, str(error)[:500], local_id)
+    ), shard)
+    if next_attempt_at is None:
+        logger.error(f"Outbox {outbox_id}: попытки исчерпаны ({attempts}), последняя ошибка: {error}")
+
+def outbox_stats() -> dict:
+    """Размер очереди outbox (по всем шардам) для мониторинга"""
+    stats = {"pending": 0, "dead": 0}
+    for shard in range(shard_count()):
+        with read_connection(shard) as conn:
+            pending, dead = conn.execute(
+                "SELECT COUNT(*) FILTER (WHERE next_attempt_at IS NOT NULL), "
+                "COUNT(*) FILTER (WHERE next_attempt_at IS NULL) FROM outbox"
+            ).fetchone()
+        stats["pending"] += pending
+        stats["dead"] += dead
+    return stats
+
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "10"))
+
+def _fts_query(user_id: int, words) -> str:
+    # user_id в FTS — только токен ("-100123" и "100123" совпадают), изоляцию даёт t.user_id в запросе.
+    # Каждое слово — префиксный поиск в кавычках, чтобы операторы FTS5 в тексте не срабатывали
+    terms = " AND ".join(f'"{word}"*' for word in words)
+    return f'user_id : "{int(user_id)}" AND description : ({terms})'
+
+def search_tasks(user_id: int, text: str, limit: int = SEARCH_LIMIT):
+    """
+    Поиск задач пользователя по словам описания (все слова, по префиксу),
+    самые релевантные (bm25) первыми; не больше limit результатов.
+    """
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return []
+    with read_connection(shard_of(user_id)) as conn:
+        try:
+            return conn.execute(
+                "SELECT t.id, t.description, t.due_ts, t.google_event_id "
+                "FROM tasks_fts JOIN tasks t ON t.id = tasks_fts.rowid "
+                "WHERE tasks_fts MATCH ? AND t.user_id = ? ORDER BY bm25(tasks_fts) LIMIT ?",
+                (_fts_query(user_id, words), user_id, limit)
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            if "no such table" not in str(e):
+                raise
+        # Сборка SQLite без FTS5: медленный, но рабочий запасной вариант
+        where = " AND ".join("description LIKE ?" for _ in words)
+        return conn.execute(
+            "SELECT id, description, due_ts, google_event_id FROM tasks "
+            f"WHERE user_id=? AND {where} ORDER BY due_ts, id LIMIT ?",
+            (user_id, *[f"%{word}%" for word in words], limit)
+        ).fetchall()
+
+EXPORT_FETCH_SIZE = 500
+
+def iter_tasks(user_id: int, fetch_size: int = EXPORT_FETCH_SIZE):
+    """
+    Все задачи пользователя (включая прошедшие, ещё не ушедшие в архив) по порядку due_ts.
+    Генератор: строки читаются keyset-порциями по fetch_size после (due_ts, id) прошлой порции,
+    соединение берётся из пула только на время одной порции. Медленный клиент /export
+    не держит соединение пула и снимок WAL (checkpoint не ждёт его) на всё скачивание.
+    """
+    shard = shard_of(user_id)
+    after = (-_MAX_ID, 0)
+    while True:
+        with read_connection(shard) as conn:
+            rows = conn.execute(
+                "SELECT id, description, due_ts, google_event_id FROM tasks "
+                "WHERE user_id=? AND (due_ts, id) > (?, ?) ORDER BY due_ts, id LIMIT ?",
+                (user_id, after[0], after[1], fetch_size)
+            ).fetchall()
+        yield from rows
+        if len(rows) < fetch_size:
+            return
+        after = (rows[-1][2], rows[-1][0])
+
+# ================== GOOGLE-АККАУНТЫ ==================
+# Refresh token сюда приходит уже зашифрованным: storage не знает ключа шифрования
+def save_google_account(user_id: int, refresh_token: bytes, scopes: str = None):
+    write(lambda conn: conn.execute(
+        "INSERT INTO google_accounts (user_id, refresh_token, scopes) VALUES (?, ?, ?) "
+        "ON CONFLICT (user_id) DO UPDATE SET refresh_token=excluded.refresh_token, scopes=excluded.scopes, "
+        "updated_at=CURRENT_TIMESTAMP",
+        (user_id, refresh_token, scopes)
+    ), shard_of(user_id))
+
+def get_google_account(user_id: int):
+    """(зашифрованный refresh token, scopes) или None, если аккаунт не привязан"""
+    with read_connection(shard_of(user_id)) as conn:
+        return conn.execute(
+            "SELECT refresh_token, scopes FROM google_accounts WHERE user_id=?", (user_id,)
+        ).fetchone()
+
+def delete_google_account(user_id: int) -> bool:
+    return write(lambda conn: conn.execute(
+        "DELETE FROM google_accounts WHERE user_id=?", (user_id,)
+    ).rowcount, shard_of(user_id)) > 0
+
+def save_oauth_nonce(user_id: int, nonce: str, expires_at: int):
+    """Запоминаем nonce выданной ссылки /connect; заодно убираем просроченные"""
+    def op(conn):
+        conn.execute("DELETE FROM oauth_states WHERE expires_at < ?", (int(time.time()),))
+        conn.execute("INSERT INTO oauth_states (nonce, user_id, expires_at) VALUES (?, ?, ?)",
+                     (nonce, user_id, expires_at))
+    write(op, shard_of(user_id))
+
+def consume_oauth_nonce(user_id: int, nonce: str) -> bool:
+    """Гасим nonce: True только при первом использовании непросроченной ссылки этого пользователя"""
+    return write(lambda conn: conn.execute(
+        "DELETE FROM oauth_states WHERE nonce=? AND user_id=? AND expires_at >= ?",
+        (nonce, user_id, int(time.time()))
+    ).rowcount, shard_of(user_id)) > 0
+
+# ================== АРХИВ И ОЧИСТКА ==================
+def archive_past_tasks(before_ts: int = None, batch_size: int = ARCHIVE_BATCH) -> int:
+    """
+    Переносим задачи с due_ts < before_ts в tasks_archive небольшими транзакциями,
+    чтобы не держать блокировку записи надолго. Возвращает число перенесённых задач.
+    """
+    if before_ts is None:
+        before_ts = int(time.time() - ARCHIVE_AFTER_HOURS * 3600)
+
+    def op(conn):
+        # Задачу, чьё событие ещё создаётся или обновляется, не трогаем: иначе complete_outbox_many
+        # не найдёт её и удалит только что созданное событие как осиротевшее
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM tasks WHERE due_ts < ? AND NOT EXISTS ("
+            "    SELECT 1 FROM outbox o WHERE o.task_id = tasks.id AND o.op IN ('create', 'update')"
+            "    AND o.next_attempt_at IS NOT NULL) "
+            "ORDER BY due_ts LIMIT ?", (before_ts, batch_size)
+        )]
+        if not ids:
+            return 0
+        marks = ",".join("?" * len(ids))
+        conn.execute(
+            "INSERT OR REPLACE INTO tasks_archive "
+            "(id, user_id, description, datetime, due_ts, google_event_id, google_calendar, created_at, archived_at) "
+            "SELECT id, user_id, description, datetime, due_ts, google_event_id, google_calendar, created_at, ? "
+            f"FROM tasks WHERE id IN ({marks})",
+            (int(time.time()), *ids)
+        )
+        conn.execute(f"DELETE FROM tasks WHERE id IN ({marks})", ids)
+        return len(ids)
+
+    total = 0
+    for shard in range(shard_count()):
+        while True:
+            moved = write(op, shard)
+            total += moved
+            if moved < batch_size:
+                break
+    return total
+
+def purge_archive(retention_days: float = ARCHIVE_RETENTION_DAYS, batch_size: int = ARCHIVE_BATCH) -> int:
+    """Удаляем из архива задачи старше retention_days (0 — архив хранится бессрочно)"""
+    if retention_days <= 0:
+        return 0
+    cutoff = int(time.time() - retention_days * 86400)
+
+    def op(conn):
+        return conn.execute(
+            "DELETE FROM tasks_archive WHERE id IN "
+            "(SELECT id FROM tasks_archive WHERE due_ts < ? ORDER BY due_ts LIMIT ?)",
+            (cutoff, batch_size)
+        ).rowcount
+
+    total = 0
+    for shard in range(shard_count()):
+        while True:
+            purged = write(op, shard)
+            total += purged
+            if purged < batch_size:
+                break
+    return total
+
+_vacuum_warned = set()
+
+def incremental_vacuum(pages: int = 1000) -> int:
+    """
+    Возвращаем ОС до pages свободных страниц каждого шарда (работает при auto_vacuum=INCREMENTAL).
+    Базу, созданную до этого режима, нужно один раз перевести: enable_incremental_vacuum() / vacuum.py
+    """
+    def op(conn):
+        mode, = conn.execute("PRAGMA auto_vacuum").fetchone()
+        if mode != 2:
+            return None
+        free_before, = conn.execute("PRAGMA freelist_count").fetchone()
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        free_after, = conn.execute("PRAGMA freelist_count").fetchone()
+        return free_before - free_after
+
+    # Освобождение страниц — тоже запись: идёт через поток-писатель шарда
+    freed = 0
+    for shard in range(shard_count()):
+        pages_freed = write(op, shard)
+        if pages_freed is None:
+            if shard not in _vacuum_warned:
+                _vacuum_warned.add(shard)
+                logger.warning(f"{shard_paths()[shard]}: auto_vacuum не INCREMENTAL, место не возвращается ОС. "
+                               f"Переведите базу один раз: python vacuum.py (бот должен быть остановлен)")
+            continue
+        freed += pages_freed
+    return freed
+
+def enable_incremental_vacuum() -> list:
+    """
+    Однократный перевод существующих шардов в auto_vacuum=INCREMENTAL: режим меняется
+    только полным VACUUM (перезапись файла, нужно столько же свободного места на диске).
+    Бот должен быть остановлен. Возвращает [(путь, было ли уже включено)].
+    """
+    close_writer()
+    close_pool()
+    result = []
+    for path in shard_paths():
+        conn = sqlite3.connect(path, isolation_level=None)
+        try:
+            mode, = conn.execute("PRAGMA auto_vacuum").fetchone()
+            if mode != 2:
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+                mode, = conn.execute("PRAGMA auto_vacuum").fetchone()
+                if mode != 2:
+                    raise RuntimeError(f"{path}: не удалось включить auto_vacuum=INCREMENTAL")
+                logger.info(f"{path}: auto_vacuum=INCREMENTAL включён")
+                result.append((path, False))
+            else:
+                result.append((path, True))
+        finally:
+            conn.close()
+    _vacuum_warned.clear()
+    return result
+
+def run_maintenance() -> dict:
+    """Один проход обслуживания: архив → очистка архива → incremental_vacuum"""
+    stats = {
+        "archived": archive_past_tasks(),
+        "purged": purge_archive(),
+    }
+    stats["vacuumed_pages"] = incremental_vacuum()
+    if stats["archived"] or stats["purged"]:
+        logger.info(f"Обслуживание БД: {stats}")
+    return stats
+
+_maintenance_stop = threading.Event()
+_maintenance_thread = None
+
+def start_maintenance(interval_minutes: float = ARCHIVE_INTERVAL_MINUTES):
+    """Фоновый поток, который периодически запускает run_maintenance()"""
+    global _maintenance_thread
+    if _maintenance_thread is not None or interval_minutes <= 0:
+        return _maintenance_thread
+
+    def loop():
+        while not _maintenance_stop.wait(interval_minutes * 60):
+            try:
+                run_maintenance()
+            except Exception as e:
+                logger.error(f"Ошибка обслуживания БД: {e}")
+
+    _maintenance_stop.clear()
+    _maintenance_thread = threading.Thread(target=loop, name="db-maintenance", daemon=True)
+    _maintenance_thread.start()
+    return _maintenance_thread
+
+def stop_maintenance():
+    global _maintenance_thread
+    _maintenance_stop.set()
+    if _maintenance_thread is not None:
+        _maintenance_thread.join()
+        _maintenance_thread = None
+
+# ================== ПЕРЕШАРДИРОВАНИЕ ==================
+def reshard(source: str, target_dir: str, shards: int, profile: str = None) -> list:
+    """
+    Раскладываем однофайловую базу source по shards файлам каталога target_dir.
+    Бот на время переноса должен быть остановлен.
+
+    ID задач и операций outbox сохраняются. Счётчик задач шарда k продолжается
+    с последнего ID исходной базы плюс k·SHARD_ID_SPAN, поэтому новые задачи не повторят
+    ни старые номера, ни номера других шардов. Возвращает число задач в каждом шарде.
+    """
+    if shards < 1:
+        raise ValueError("Число шардов должно быть не меньше 1")
+    if not os.path.isfile(source):
+        raise ValueError(f"{source} — не файл базы SQLite")
+    if os.path.isdir(target_dir) and os.listdir(target_dir):
+        raise ValueError(f"Каталог {target_dir} не пуст")
+    os.makedirs(target_dir, exist_ok=True)
+
+    src = sqlite3.connect(source)
+    try:
+        migrate(src)
+        total, = src.execute("SELECT COUNT(*) FROM tasks").fetchone()
+        sequences = dict(src.execute("SELECT name, seq FROM sqlite_sequence"))
+    finally:
+        src.close()
+
+    counts = []
+    for shard in range(shards):
+        conn = sqlite3.connect(shard_file(target_dir, shard))
+        try:
+            apply_profile(conn, profile)
+            migrate(conn)
+            conn.create_function("shard_index", 2, shard_index, deterministic=True)
+            conn.execute("ATTACH DATABASE ? AS src", (source,))
+            conn.execute("BEGIN IMMEDIATE")
+            where = "WHERE shard_index(user_id, ?) = ?"
+            conn.execute(
+                "INSERT INTO tasks (id, user_id, description, datetime, due_ts, google_event_id, google_calendar, created_at) "
+                "SELECT id, user_id, description, datetime, due_ts, google_event_id, google_calendar, created_at "
+                f"FROM src.tasks {where}",
+                (shards, shard)
+            )
+            conn.execute(
+                "INSERT INTO tasks_archive "
+                "(id, user_id, description, datetime, due_ts, google_event_id, google_calendar, created_at, archived_at) "
+                "SELECT id, user_id, description, datetime, due_ts, google_event_id, google_calendar, created_at, archived_at "
+                f"FROM src.tasks_archive {where}",
+                (shards, shard)
+            )
+            # Операции без user_id (удаление события уже удалённой задачи) уходят в шард 0
+            conn.execute(
+                "INSERT INTO outbox "
+                "(id, task_id, user_id, op, payload, attempts, next_attempt_at, last_error, created_at) "
+                "SELECT id, task_id, user_id, op, payload, attempts, next_attempt_at, last_error, created_at "
+                f"FROM src.outbox {where}",
+                (shards, shard)
+            )
+            conn.execute(
+                "INSERT INTO google_accounts (user_id, refresh_token, scopes, updated_at) "
+                f"SELECT user_id, refresh_token, scopes, updated_at FROM src.google_accounts {where}",
+                (shards, shard)
+            )
+            # ID операций outbox снаружи и так содержат шард (_outbox_key), а ID задач — нет
+            if "outbox" in sequences:
+                conn.execute("DELETE FROM sqlite_sequence WHERE name='outbox'")
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('outbox', ?)", (sequences["outbox"],))
+            _reserve_task_ids(conn, shard, sequences.get("tasks", 0))
+            counts.append(conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0])
+            conn.commit()
+            conn.execute("DETACH DATABASE src")
+        finally:
+            conn.close()
+        logger.info(f"Шард {shard}: {counts[-1]} задач")
+
+    if sum(counts) != total:
+        raise RuntimeError(f"Перенесено {sum(counts)} задач из {total}")
+    # shards.json пишется последним: без него каталог не примут за готовый
+    _write_shards_meta(target_dir, shards)
+    return counts
@@ -0,0 +1,313 @@
+import io
+import os
+import csv
+import hmac
+import json
+import time
+import base64
+import codecs
+import hashlib
+import logging
+import tempfile
+from datetime import datetime, timezone, timedelta
+
+# ================== НАСТРОЙКИ ==================
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "5000"))
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(5 * 1024 * 1024)))
+IMPORT_BATCH = int(os.getenv("IMPORT_BATCH", "500"))
+EXPORT_LINK_TTL = int(os.getenv("EXPORT_LINK_TTL", "3600"))
+DELETE_MAX_IDS = int(os.getenv("DELETE_MAX_IDS", "1000"))
+
+logger = logging.getLogger(__name__)
+
+# ================== ИМПОРТ ==================
+# Поддерживаемые форматы (по расширению файла):
+#   .csv   — колонки description,date,time (как в /add) или description,datetime (ISO 8601);
+#            строка заголовка необязательна, без неё порядок: описание, дата, время
+#   .json  — массив объектов с теми же ключами
+#   .jsonl — по объекту на строку
+
+def _iter_csv(stream):
+    reader = csv.reader(stream)
+    header = None
+    for row_no, row in enumerate(reader, start=1):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        cells = [cell.strip() for cell in row]
+        if header is None and row_no == 1 and "description" in [c.lower() for c in cells]:
+            header = [c.lower() for c in cells]
+            continue
+        if header:
+            yield row_no, dict(zip(header, cells))
+        else:
+            yield row_no, dict(zip(("description", "date", "time"), cells))
+
+def _iter_jsonl(stream):
+    for row_no, line in enumerate(stream, start=1):
+        if line.strip():
+            try:
+                yield row_no, json.loads(line)
+            except ValueError as e:
+                yield row_no, ValueError(f"некорректный JSON: {e}")
+
+def _iter_json(stream):
+    # JSON-массив целиком помещается в память — размер файла ограничен IMPORT_MAX_BYTES
+    data = json.load(stream)
+    if not isinstance(data, list):
+        raise ValueError("ожидался JSON-массив задач")
+    for row_no, item in enumerate(data, start=1):
+        yield row_no, item
+
+def iter_import_records(fileobj, filename: str):
+    """
+    Читаем загруженный файл построчно: (номер строки, dict полей | исключение).
+    fileobj — бинарный файловый объект.
+    """
+    ext = os.path.splitext(filename or "")[1].lower()
+    stream = codecs.getreader("utf-8-sig")(fileobj)
+    if ext == ".csv":
+        return _iter_csv(stream)
+    if ext in (".jsonl", ".ndjson"):
+        return _iter_jsonl(stream)
+    if ext == ".json":
+        return _iter_json(stream)
+    raise ValueError("Поддерживаются файлы .csv, .json и .jsonl")
+
+def _localize(tz, dt: datetime) -> datetime:
+    return tz.localize(dt) if hasattr(tz, "localize") else dt.replace(tzinfo=tz)
+
+def parse_import_record(record, parse_datetime, tz):
+    """Поля записи → (описание, aware-datetime); ValueError с понятным текстом при ошибке"""
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError("ожидался объект с полями description, date, time")
+    description = str(record.get("description") or "").strip()
+    if not description:
+        raise ValueError("нет описания")
+    if record.get("datetime"):
+        try:
+            dt = datetime.fromisoformat(str(record["datetime"]).strip())
+        except ValueError:
+            raise ValueError(f"неверная дата {record['datetime']!r}, нужен ISO 8601")
+        return description, dt if dt.tzinfo else _localize(tz, dt)
+    date_str, time_str = str(record.get("date") or ""), str(record.get("time") or "")
+    if not date_str or not time_str:
+        raise ValueError("нужны поля date и time или datetime")
+    return description, parse_datetime(date_str, time_str)
+
+def read_import(fileobj, filename: str, parse_datetime, tz, max_rows: int = IMPORT_MAX_ROWS):
+    """
+    Разбираем файл импорта. Возвращает (batches, errors):
+    batches — списки по IMPORT_BATCH пар (описание, datetime), готовые для executemany;
+    errors — [(номер строки, текст ошибки)].
+    """
+    batches, batch, errors, total = [], [], [], 0
+    for row_no, record in iter_import_records(fileobj, filename):
+        if total >= max_rows:
+            errors.append((row_no, f"превышен лимит в {max_rows} задач, остальные строки пропущены"))
+            break
+        try:
+            batch.append(parse_import_record(record, parse_datetime, tz))
+            total += 1
+        except ValueError as e:
+            errors.append((row_no, str(e)))
+            continue
+        if len(batch) == IMPORT_BATCH:
+            batches.append(batch)
+            batch = []
+    if batch:
+        batches.append(batch)
+    return batches, errors
+
+def format_import_report(imported: int, errors, limit: int = 20) -> str:
+    """Текст ответа пользователю: сколько загружено и в каких строках ошибки"""
+    text = f"📥 Импортировано задач: {imported}"
+    if errors:
+        text += f"\n❌ Ошибок: {len(errors)}\n"
+        text += "\n".join(f"строка {row_no}: {error}" for row_no, error in errors[:limit])
+        if len(errors) > limit:
+            text += f"\n… и ещё {len(errors) - limit}"
+    return text
+
+def as_binary(data) -> io.BufferedIOBase:
+    """bytes → файловый объект (pyTelegramBotAPI отдаёт загруженный файл байтами)"""
+    return io.BytesIO(data) if isinstance(data, (bytes, bytearray)) else data
+
+# ================== АРГУМЕНТЫ /delete ==================
+def parse_delete_args(text: str, max_ids: int = DELETE_MAX_IDS):
+    """
+    Аргументы /delete (общие для обоих ботов) → список ID или "past":
+    /delete 3 5 7, /delete 3,5 10-25, /delete past. Размер диапазона проверяется
+    до его разворачивания, поэтому /delete 1-2000000000 отклоняется сразу.
+    """
+    text = text.strip().lower()
+    if text in ("past", "прошедшие"):
+        return "past"
+    task_ids = []
+    for part in text.replace(",", " ").split():
+        try:
+            if "-" in part:
+                first, last = sorted(int(x) for x in part.split("-", 1))
+            else:
+                first = last = int(part)
+        except ValueError:
+            raise ValueError("ID задачи должен быть числом: /delete 3 5 7, /delete 10-25 или /delete past")
+        if len(task_ids) + (last - first + 1) > max_ids:
+            raise ValueError(f"Можно удалить не больше {max_ids} задач за раз")
+        task_ids.extend(range(first, last + 1))
+    return task_ids
+
+# ================== АРГУМЕНТЫ /edit ==================
+def parse_edit_args(text: str, parse_datetime):
+    """
+    Аргументы /edit → (task_id, описание или None, datetime или None):
+    /edit 5 Новое описание, /edit 5 пн 14.30, /edit 5 пн 14.30 Новое описание.
+    Дата и время — первые два слова после ID, если parse_datetime их принимает.
+    """
+    words = text.split()
+    if len(words) < 2:
+        raise ValueError("Формат: /edit ID описание, /edit ID дата время или /edit ID дата время описание")
+    try:
+        task_id = int(words[0])
+    except ValueError:
+        raise ValueError("ID задачи должен быть числом")
+    dt = None
+    rest = words[1:]
+    if len(rest) >= 2:
+        try:
+            dt = parse_datetime(rest[0], rest[1])
+            rest = rest[2:]
+        except ValueError:
+            pass
+    return task_id, " ".join(rest) or None, dt
+
+# ================== ЭКСПОРТ ==================
+# Экспорт — генераторы строк: на вход поток задач (id, description, due_ts, google_event_id),
+# на выход куски текста. Ни весь результат, ни все строки в памяти не собираются.
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    "ics": ("text/calendar", "ics"),
+}
+
+def _csv_line(values) -> str:
+    buf = io.StringIO()
+    csv.writer(buf).writerow(values)
+    return buf.getvalue()
+
+def export_csv(rows, tz):
+    # Колонки совместимы с /import: description,datetime
+    yield _csv_line(["id", "description", "datetime", "google_event_id"])
+    for task_id, description, due_ts, google_event_id in rows:
+        dt = datetime.fromtimestamp(due_ts, tz).isoformat()
+        yield _csv_line([task_id, description, dt, google_event_id or ""])
+
+def export_jsonl(rows, tz):
+    for task_id, description, due_ts, google_event_id in rows:
+        yield json.dumps({
+            "id": task_id,
+            "description": description,
+            "datetime": datetime.fromtimestamp(due_ts, tz).isoformat(),
+            "google_event_id": google_event_id,
+        }, ensure_ascii=False) + "\n"
+
+def _ics_escape(text: str) -> str:
+    return (text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+def _ics_fold(line: str) -> str:
+    """RFC 5545: строки длиннее 75 октетов переносятся с пробелом в начале продолжения"""
+    out, chunk, size = [], "", 0
+    for char in line:
+        char_size = len(char.encode("utf-8"))
+        if size + char_size > 75:
+            out.append(chunk)
+            chunk, size = " ", 1
+        chunk += char
+        size += char_size
+    out.append(chunk)
+    return "\r\n".join(out) + "\r\n"
+
+def export_ics(rows, tz=None):
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    yield "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Telegram Task Bot//RU\r\nCALSCALE:GREGORIAN\r\n"
+    for task_id, description, due_ts, _ in rows:
+        start = datetime.fromtimestamp(due_ts, timezone.utc)
+        yield (
+            "BEGIN:VEVENT\r\n"
+            f"UID:task-{task_id}@telegram-task-bot\r\n"
+            f"DTSTAMP:{stamp}\r\n"
+            f"DTSTART:{start.strftime('%Y%m%dT%H%M%SZ')}\r\n"
+            f"DTEND:{(start + timedelta(hours=1)).strftime('%Y%m%dT%H%M%SZ')}\r\n"
+            + _ics_fold(f"SUMMARY:{_ics_escape(description or '')}")
+            + "END:VEVENT\r\n"
+        )
+    yield "END:VCALENDAR\r\n"
+
+_EXPORTERS = {"csv": export_csv, "jsonl": export_jsonl, "ics": export_ics}
+
+def export_chunks(rows, fmt: str, tz):
+    """Куски текста выбранного формата"""
+    if fmt not in _EXPORTERS:
+        raise ValueError(f"Неизвестный формат {fmt}: доступны {', '.join(_EXPORTERS)}")
+    return _EXPORTERS[fmt](rows, tz)
+
+def export_filename(fmt: str) -> str:
+    return f"tasks-{datetime.now().strftime('%Y%m%d')}.{EXPORT_FORMATS[fmt][1]}"
+
+def spool_export(rows, fmt: str, tz, max_memory: int = 1024 * 1024):
+    """
+    Пишем экспорт во временный файл для отправки в Telegram: до max_memory байт
+    он живёт в памяти, дальше — на диске. Возвращает файл, перемотанный в начало.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=max_memory, mode="w+b")
+    for chunk in export_chunks(rows, fmt, tz):
+        buffer.write(chunk.encode("utf-8"))
+    buffer.seek(0)
+    return buffer
+
+# ================== ПОДПИСАННЫЕ ТОКЕНЫ ==================
+# Токен: base64(поле:...:expires).подпись — HMAC-SHA256 на секрете бота.
+# Ссылки на экспорт и state для /connect (google_calendar) — без хранения сессий
+
+class TokenExpired(ValueError):
+    pass
+
+def _sign(payload: bytes, secret: str) -> str:
+    digest = hmac.new(secret.encode("utf-8"), payload, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode("ascii").rstrip("=")
+
+def make_signed_token(fields, secret: str, ttl: int) -> str:
+    payload = ":".join([*map(str, fields), str(int(time.time()) + ttl)]).encode("ascii")
+    encoded = base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+    return f"{encoded}.{_sign(payload, secret)}"
+
+def parse_signed_token(token: str, secret: str, count: int) -> list:
+    """
+    count полей (строками) из подписанного токена; ValueError, если подпись неверна,
+    TokenExpired, если срок истёк
+    """
+    try:
+        encoded, signature = token.split(".", 1)
+        payload = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+        *fields, expires = payload.decode("ascii").split(":")
+        expires = int(expires)
+    except Exception:
+        raise ValueError("некорректная ссылка")
+    if len(fields) != count or not hmac.compare_digest(signature, _sign(payload, secret)):
+        raise ValueError("некорректная ссылка")
+    if expires < time.time():
+        raise TokenExpired("срок действия ссылки истёк")
+    return fields
+
+# ================== ССЫЛКИ НА ЭКСПОРТ ==================
+def make_export_token(user_id: int, fmt: str, secret: str, ttl: int = EXPORT_LINK_TTL) -> str:
+    return make_signed_token((user_id, fmt), secret, ttl)
+
+def parse_export_token(token: str, secret: str):
+    """(user_id, fmt) из подписанного токена; ValueError, если подпись неверна или срок истёк"""
+    user_id, fmt = parse_signed_token(token, secret, 2)
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError("неизвестный формат")
+    return int(user_id), fmt
@@ -0,0 +1,218 @@
+import re
+import time
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from typing import Protocol, runtime_checkable
+
+import storage
+# Порядок (due_ts, id) и граница курсора — те же, что у keyset-запросов storage
+from storage import _MAX_ID, _row_key
+
+# ================== ИНТЕРФЕЙС ХРАНИЛИЩА ==================
+# Строка задачи везде одна: (id, description, due_ts, google_event_id), due_ts — секунды UTC.
+# Боты получают хранилище снаружи (use_store), поэтому обработчики можно гонять
+# в бенчмарках и тестах на MemoryTaskStore без диска.
+
+@runtime_checkable
+class TaskStore(Protocol):
+    def init_db(self) -> int: ...
+
+    def add_task(self, user_id: int, description: str, dt: datetime,
+                 google_event_id=None, sync_calendar: bool = False) -> int: ...
+
+    def get_tasks(self, user_id: int, now_ts: int = None) -> list: ...
+
+    def get_task_by_id(self, task_id: int, user_id: int): ...
+
+    def get_tasks_page(self, user_id: int, after=None, limit: int = storage.PAGE_SIZE,
+                       now_ts: int = None): ...
+
+    def get_tasks_between(self, user_id: int, start: datetime, end: datetime, now_ts: int = None) -> list: ...
+
+    def delete_tasks(self, user_id: int, task_ids, sync_calendar: bool = False) -> list: ...
+
+    def delete_past_tasks(self, user_id: int, now_ts: int = None, sync_calendar: bool = False) -> list: ...
+
+    def import_tasks(self, user_id: int, batches, sync_calendar: bool = False) -> list: ...
+
+    def update_task(self, task_id: int, user_id: int, description: str = None, dt: datetime = None,
+                    sync_calendar: bool = False) -> bool: ...
+
+    def search_tasks(self, user_id: int, text: str, limit: int = storage.SEARCH_LIMIT) -> list: ...
+
+    def iter_tasks(self, user_id: int): ...
+
+
+# ================== SQLITE ==================
+class SqliteTaskStore:
+    """Хранилище поверх storage: пул, групповая запись, кэш, шарды и outbox — всё там"""
+
+    def init_db(self) -> int:
+        return storage.init_db()
+
+    def add_task(self, user_id, description, dt, google_event_id=None, sync_calendar=False):
+        return storage.add_task(user_id, description, dt, google_event_id, sync_calendar)
+
+    def get_tasks(self, user_id, now_ts=None):
+        return storage.get_tasks(user_id, now_ts)
+
+    def get_task_by_id(self, task_id, user_id):
+        return storage.get_task_by_id(task_id, user_id)
+
+    def get_tasks_page(self, user_id, after=None, limit=storage.PAGE_SIZE, now_ts=None):
+        return storage.get_tasks_page(user_id, after, limit, now_ts)
+
+    def get_tasks_between(self, user_id, start, end, now_ts=None):
+        return storage.get_tasks_between(user_id, start, end, now_ts)
+
+    def delete_tasks(self, user_id, task_ids, sync_calendar=False):
+        return storage.delete_tasks(user_id, task_ids, sync_calendar)
+
+    def delete_past_tasks(self, user_id, now_ts=None, sync_calendar=False):
+        return storage.delete_past_tasks(user_id, now_ts, sync_calendar)
+
+    def import_tasks(self, user_id, batches, sync_calendar=False):
+        return storage.import_tasks(user_id, batches, sync_calendar)
+
+    def update_task(self, task_id, user_id, description=None, dt=None, sync_calendar=False):
+        return storage.update_task(task_id, user_id, description, dt, sync_calendar)
+
+    def search_tasks(self, user_id, text, limit=storage.SEARCH_LIMIT):
+        return storage.search_tasks(user_id, text, limit)
+
+    def iter_tasks(self, user_id):
+        return storage.iter_tasks(user_id)
+
+
+# ================== В ПАМЯТИ ==================
+class MemoryTaskStore:
+    """
+    Хранилище в памяти процесса: у каждого пользователя список задач,
+    отсортированный по (due_ts, id), диапазоны и страницы ищутся bisect.
+    Календарь не синхронизируется (sync_calendar игнорируется), архива нет.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}       # user_id → [строка], по (due_ts, id)
+        self._owners = {}     # task_id → (user_id, due_ts): ключ для bisect
+        self._next_id = 1
+
+    def init_db(self) -> int:
+        return 0
+
+    def _insert(self, user_id, description, due_ts, google_event_id=None) -> int:
+        task_id = self._next_id
+        self._next_id += 1
+        insort(self._rows.setdefault(user_id, []), (task_id, description, due_ts, google_event_id), key=_row_key)
+        self._owners[task_id] = (user_id, due_ts)
+        return task_id
+
+    def _find(self, user_id, task_id):
+        """Позиция задачи в списке пользователя или None"""
+        owner = self._owners.get(task_id)
+        if owner is None or owner[0] != user_id:
+            return None
+        return bisect_left(self._rows[user_id], (owner[1], task_id), key=_row_key)
+
+    def _remove(self, user_id, task_id):
+        i = self._find(user_id, task_id)
+        if i is None:
+            return None
+        del self._owners[task_id]
+        return self._rows[user_id].pop(i)
+
+    def add_task(self, user_id, description, dt, google_event_id=None, sync_calendar=False):
+        with self._lock:
+            return self._insert(user_id, description, storage.to_timestamp(dt), google_event_id)
+
+    def get_tasks(self, user_id, now_ts=None):
+        if now_ts is None:
+            now_ts = int(time.time())
+        with self._lock:
+            rows = self._rows.get(user_id, [])
+            return rows[bisect_right(rows, (now_ts, _MAX_ID), key=_row_key):]
+
+    def get_task_by_id(self, task_id, user_id):
+        with self._lock:
+            i = self._find(user_id, task_id)
+            return None if i is None else self._rows[user_id][i]
+
+    def get_tasks_page(self, user_id, after=None, limit=storage.PAGE_SIZE, now_ts=None):
+        if now_ts is None:
+            now_ts = int(time.time())
+        cursor = max(tuple(after) if after else (now_ts, _MAX_ID), (now_ts, _MAX_ID))
+        with self._lock:
+            rows = self._rows.get(user_id, [])
+            lo = bisect_right(rows, cursor, key=_row_key)
+            rows = rows[lo:lo + limit + 1]
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, (rows[-1][2], rows[-1][0])
+        return rows, None
+
+    def get_tasks_between(self, user_id, start, end, now_ts=None):
+        start_ts, end_ts = storage.to_timestamp(start), storage.to_timestamp(end)
+        with self._lock:
+            rows = self._rows.get(user_id, [])
+            lo = bisect_left(rows, (start_ts, 0), key=_row_key)
+            hi = bisect_left(rows, (end_ts, 0), key=_row_key)
+            return rows[lo:hi]
+
+    def delete_tasks(self, user_id, task_ids, sync_calendar=False):
+        deleted = []
+        with self._lock:
+            for task_id in dict.fromkeys(int(task_id) for task_id in task_ids):
+                row = self._remove(user_id, task_id)
+                if row is not None:
+                    deleted.append((row[0], row[3]))
+        return deleted
+
+    def delete_past_tasks(self, user_id, now_ts=None, sync_calendar=False):
+        if now_ts is None:
+            now_ts = int(time.time())
+        with self._lock:
+            rows = self._rows.get(user_id, [])
+            hi = bisect_right(rows, (now_ts, _MAX_ID), key=_row_key)
+            past, rows[:hi] = rows[:hi], []
+            for row in past:
+                del self._owners[row[0]]
+        return [(row[0], row[3]) for row in past]
+
+    def import_tasks(self, user_id, batches, sync_calendar=False):
+        with self._lock:
+            return [
+                self._insert(user_id, description, storage.to_timestamp(dt))
+                for batch in batches for description, dt in batch
+            ]
+
+    def update_task(self, task_id, user_id, description=None, dt=None, sync_calendar=False):
+        with self._lock:
+            row = self._remove(user_id, task_id)
+            if row is None:
+                return False
+            row = (task_id, description or row[1], storage.to_timestamp(dt) if dt else row[2], row[3])
+            insort(self._rows[user_id], row, key=_row_key)
+            self._owners[task_id] = (user_id, row[2])
+            return True
+
+    def search_tasks(self, user_id, text, limit=storage.SEARCH_LIMIT):
+        # Как в FTS: все слова запроса, каждое — префикс слова описания
+        words = re.findall(r"\w+", text.lower())
+        if not words:
+            return []
+        found = []
+        with self._lock:
+            for row in self._rows.get(user_id, []):
+                tokens = re.findall(r"\w+", (row[1] or "").lower())
+                if all(any(token.startswith(word) for token in tokens) for word in words):
+                    found.append(row)
+                    if len(found) == limit:
+                        break
+        return found
+
+    def iter_tasks(self, user_id):
+        with self._lock:
+            rows = list(self._rows.get(user_id, []))
+        yield from rows
@@ -0,0 +1,25 @@
+"""Общая подготовка тестов на SQLite: у каждого теста своя пустая база во временном каталоге"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+
+class SqliteTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._saved = storage.DB_PATH, storage.DB_SHARDS
+        storage.DB_PATH = os.path.join(self._tmp.name, "tasks.db")
+        storage.DB_SHARDS = 0
+        storage.init_db()
+
+    def tearDown(self):
+        storage.close_writer()
+        storage.close_pool()
+        storage.upcoming_cache.clear()
+        storage.DB_PATH, storage.DB_SHARDS = self._saved
+        self._tmp.cleanup()
@@ -0,0 +1,68 @@
+"""Архив прошедших задач: перенос, ожидание outbox и очистка"""
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from sqlite_case import SqliteTestCase
+
+import storage
+
+USER = 5
+
+
+class ArchiveTest(SqliteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.past = datetime.now(timezone.utc) - timedelta(days=2)
+        self.cutoff = int(time.time())
+
+    def archived_ids(self):
+        with storage.read_connection() as conn:
+            return [row[0] for row in conn.execute("SELECT id FROM tasks_archive ORDER BY id")]
+
+    def test_moves_past_tasks(self):
+        past_id = storage.add_task(USER, "прошедшая", self.past)
+        future_id = storage.add_task(USER, "будущая", datetime.now(timezone.utc) + timedelta(days=1))
+        self.assertEqual(storage.archive_past_tasks(self.cutoff, batch_size=1), 1)
+        self.assertEqual(self.archived_ids(), [past_id])
+        self.assertIsNone(storage.get_task_by_id(past_id, USER))
+        self.assertIsNotNone(storage.get_task_by_id(future_id, USER))
+
+    def test_keeps_task_with_pending_create(self):
+        task_id = storage.add_task(USER, "прошедшая", self.past, sync_calendar=True)
+        self.assertEqual(storage.archive_past_tasks(self.cutoff), 0)
+        self.assertIsNotNone(storage.get_task_by_id(task_id, USER))
+
+        # Create выполнился — событие записано в задачу, теперь её можно архивировать
+        [item] = storage.claim_outbox()
+        storage.complete_outbox(item[0], task_id, item[4]["event_id"], USER, storage.CALENDAR_SHARED)
+        self.assertEqual(storage.outbox_stats(), {"pending": 0, "dead": 0})
+        self.assertEqual(storage.archive_past_tasks(self.cutoff), 1)
+        self.assertEqual(self.archived_ids(), [task_id])
+
+    def test_keeps_task_with_inflight_update(self):
+        task_id = storage.add_task(USER, "прошедшая", self.past, sync_calendar=True)
+        [item] = storage.claim_outbox()
+        storage.complete_outbox(item[0], task_id, item[4]["event_id"], USER, storage.CALENDAR_SHARED)
+        storage.update_task(task_id, USER, description="новая", sync_calendar=True)
+        storage.claim_outbox()
+        self.assertEqual(storage.archive_past_tasks(self.cutoff), 0)
+
+    def test_dead_create_does_not_block(self):
+        task_id = storage.add_task(USER, "прошедшая", self.past, sync_calendar=True)
+        [item] = storage.claim_outbox()
+        storage.retry_outbox(item[0], item[5], "ошибка", delay=0, max_attempts=1)
+        self.assertEqual(storage.archive_past_tasks(self.cutoff), 1)
+        self.assertEqual(self.archived_ids(), [task_id])
+
+    def test_purge(self):
+        storage.add_task(USER, "давняя", self.past - timedelta(days=30))
+        storage.add_task(USER, "недавняя", self.past)
+        storage.archive_past_tasks(self.cutoff)
+        self.assertEqual(storage.purge_archive(retention_days=10), 1)
+        self.assertEqual(len(self.archived_ids()), 1)
+        self.assertEqual(storage.purge_archive(retention_days=0), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""Горячие снимки базы: создание во время записи, ротация и восстановление"""
+import os
+import threading
+import unittest
+from datetime import datetime, timezone
+
+from sqlite_case import SqliteTestCase
+
+import backup
+import storage
+
+USER = 11
+DUE = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+
+class BackupTest(SqliteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.backup_dir = os.path.join(self._tmp.name, "backups")
+
+    def descriptions(self):
+        return [row[1] for row in storage.iter_tasks(USER)]
+
+    def test_snapshot_and_restore(self):
+        storage.add_task(USER, "до снимка", DUE)
+        snapshot = backup.create_snapshot(self.backup_dir)
+        storage.add_task(USER, "после снимка", DUE)
+        self.assertEqual(self.descriptions(), ["до снимка", "после снимка"])
+
+        backup.restore_snapshot(os.path.basename(snapshot), self.backup_dir)
+        self.assertEqual(self.descriptions(), ["до снимка"])
+        # Кэш сброшен, запись после восстановления работает
+        self.assertEqual([row[1] for row in storage.get_tasks(USER, 0)], ["до снимка"])
+        storage.add_task(USER, "после восстановления", DUE)
+        self.assertEqual(len(self.descriptions()), 2)
+
+    def test_snapshot_during_writes_is_consistent(self):
+        stop = threading.Event()
+
+        def writer():
+            while not stop.is_set():
+                storage.import_tasks(USER, [[("пачка", DUE)] * 10])
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            snapshot = backup.create_snapshot(self.backup_dir)
+        finally:
+            stop.set()
+            thread.join()
+        backup.restore_snapshot(snapshot, self.backup_dir)
+        # Пачки пишутся одной транзакцией: в снимке их только целое число
+        self.assertEqual(len(self.descriptions()) % 10, 0)
+
+    def test_concurrent_snapshots_get_unique_names(self):
+        storage.add_task(USER, "задача", DUE)
+        paths = []
+        threads = [threading.Thread(target=lambda: paths.append(backup.create_snapshot(self.backup_dir)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(paths)), 4)
+        self.assertEqual(len(backup.list_snapshots(self.backup_dir)), 4)
+
+    def test_rotation_keeps_newest(self):
+        snapshots = [os.path.basename(backup.create_snapshot(self.backup_dir)) for _ in range(3)]
+        self.assertEqual(backup.rotate_snapshots(self.backup_dir, keep=2), snapshots[:1])
+        self.assertEqual(backup.list_snapshots(self.backup_dir), snapshots[1:])
+        self.assertEqual(backup.rotate_snapshots(self.backup_dir, keep=0), [])
+
+    def test_restore_errors(self):
+        with self.assertRaises(ValueError):
+            backup.restore_snapshot("snapshot-нет", self.backup_dir)
+        snapshot = backup.create_snapshot(self.backup_dir)
+        os.remove(os.path.join(snapshot, os.path.basename(storage.DB_PATH)))
+        with self.assertRaises(ValueError):
+            backup.restore_snapshot(snapshot, self.backup_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
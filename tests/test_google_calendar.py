@@ -0,0 +1,355 @@
+"""Клиент Google Calendar без сети: batch-запросы поверх поддельного HTTP, предохранитель, повторы, шифрование токенов, OAuth state и календари пользователей"""
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+
+from cryptography.fernet import Fernet
+from google.oauth2.credentials import Credentials
+from googleapiclient.http import HttpMockSequence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import google_calendar  # noqa: E402
+import storage  # noqa: E402
+import task_io  # noqa: E402
+from sqlite_case import SqliteTestCase  # noqa: E402
+
+BOUNDARY = "batch_boundary"
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 503: "Service Unavailable"}
+
+
+def batch_response(*parts):
+    """Ответ batch-запроса: parts — (request_id, HTTP-статус, тело JSON) в любом порядке"""
+    chunks = []
+    for request_id, status, body in parts:
+        chunks.append(
+            f"--{BOUNDARY}\r\n"
+            "Content-Type: application/http\r\n"
+            f"Content-ID: <response-test + {request_id}>\r\n\r\n"
+            f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            "Content-Type: application/json\r\n\r\n"
+            f"{json.dumps(body)}\r\n"
+        )
+    content = "".join(chunks) + f"--{BOUNDARY}--"
+    return {"status": "200", "content-type": f'multipart/mixed; boundary="{BOUNDARY}"'}, content
+
+
+def error(status, reason="backendError"):
+    return {"error": {"code": status, "message": reason, "errors": [{"reason": reason}]}}
+
+
+class EventBatchTest(unittest.TestCase):
+    def setUp(self):
+        self._backoff, google_calendar.GOOGLE_BACKOFF = google_calendar.GOOGLE_BACKOFF, 0
+        self.circuit = google_calendar.CircuitBreaker()
+
+    def tearDown(self):
+        google_calendar.GOOGLE_BACKOFF = self._backoff
+
+    def batch(self, *responses, batch_size=google_calendar.CALENDAR_BATCH_SIZE):
+        self.http = HttpMockSequence(list(responses))
+        service = google_calendar.build_service(self.http)
+        return google_calendar.EventBatch(service, batch_size=batch_size, circuit=self.circuit)
+
+    def test_sub_responses_map_back_to_keys(self):
+        # Google отвечает частями в произвольном порядке — сопоставляем по Content-ID, а не по позиции
+        batch = self.batch(batch_response(
+            (2, 404, error(404, "notFound")),
+            (0, 200, {"id": "evt-101"}),
+            (1, 400, error(400, "invalid")),
+        ))
+        batch.insert(101, {"summary": "новая"})
+        batch.patch(102, "evt-102", {"summary": "правка"})
+        batch.delete(103, "evt-103")
+        self.assertEqual(len(batch), 3)
+
+        results = batch.execute()
+        self.assertEqual(len(batch), 0)
+        self.assertEqual(results[101], ({"id": "evt-101"}, None))
+        self.assertEqual(google_calendar.http_status(results[102][1]), 400)
+        self.assertEqual(results[103], (None, None))   # событие уже удалено — это успех
+        self.assertEqual(len(self.http.request_sequence), 1)   # один HTTP-вызов на всю пачку
+
+    def test_only_retryable_operations_are_resent(self):
+        batch = self.batch(
+            batch_response((0, 200, {"id": "evt-1"}), (1, 503, error(503))),
+            batch_response((0, 200, {"id": "evt-2"})),
+        )
+        batch.insert("a", {"summary": "раз"})
+        batch.insert("b", {"summary": "два"})
+        results = batch.execute()
+        self.assertEqual(results, {"a": ({"id": "evt-1"}, None), "b": ({"id": "evt-2"}, None)})
+        self.assertEqual(self.circuit.retries, 1)
+        self.assertEqual(self.http.request_sequence[1][2].count("POST /calendar/v3/calendars/primary/events"), 1)
+
+    def test_chunks_by_batch_size(self):
+        batch = self.batch(
+            batch_response((0, 200, {"id": "evt-1"}), (1, 200, {"id": "evt-2"})),
+            batch_response((0, 200, {"id": "evt-3"})),
+            batch_size=2,
+        )
+        for key in (1, 2, 3):
+            batch.insert(key, {"summary": str(key)})
+        results = batch.execute()
+        self.assertEqual({key: response["id"] for key, (response, _) in results.items()},
+                         {1: "evt-1", 2: "evt-2", 3: "evt-3"})
+
+    def test_failed_http_call_is_reported_for_every_operation(self):
+        batch = self.batch(({"status": "400"}, json.dumps(error(400, "badRequest"))))
+        batch.insert(1, {"summary": "раз"})
+        batch.delete(2, "evt-2")
+        results = batch.execute()
+        self.assertEqual(set(results), {1, 2})
+        self.assertTrue(all(response is None and google_calendar.http_status(exc) == 400
+                            for response, exc in results.values()))
+
+
+class Clock:
+    """Подменяет time.monotonic: время в тесте двигается только вручную"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def fail(exc):
+    def func():
+        raise exc
+    return func
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch.object(google_calendar.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.circuit = google_calendar.CircuitBreaker(window=4, min_calls=4, error_rate=0.5, cooldown=30)
+
+    def trip(self):
+        for ok in (True, True, False, False):
+            self.circuit.record(ok)
+
+    def test_opens_only_after_min_calls_at_error_rate(self):
+        for ok in (False, False, False):
+            self.circuit.record(ok)
+        self.assertEqual(self.circuit.state, "closed")   # вызовов меньше min_calls
+        self.circuit.record(True)
+        self.assertEqual(self.circuit.state, "open")
+        self.assertEqual(self.circuit.retry_after(), 30)
+
+    def test_window_forgets_old_failures(self):
+        for ok in (False, True, True, True, False, True):
+            self.circuit.record(ok)
+        self.assertEqual(self.circuit.state, "closed")   # в окне из 4 одна ошибка
+
+    def test_open_rejects_until_cooldown(self):
+        self.trip()
+        with self.assertRaises(google_calendar.CircuitOpenError):
+            self.circuit.call(lambda: "не вызовется")
+        self.clock.now += 10
+        self.assertEqual(self.circuit.retry_after(), 20)
+        self.assertFalse(self.circuit.allow())
+        self.assertEqual(self.circuit.stats()["rejected"], 2)
+
+    def test_half_open_probe_closes_on_success(self):
+        self.trip()
+        self.clock.now += 30
+        self.assertEqual(self.circuit.state, "half_open")
+        self.assertTrue(self.circuit.allow())
+        self.assertFalse(self.circuit.allow())   # пробный вызов один
+        self.circuit.record(True)
+        self.assertEqual(self.circuit.state, "closed")
+        self.assertEqual(self.circuit.stats()["error_rate"], 0.0)
+
+    def test_half_open_probe_failure_reopens(self):
+        self.trip()
+        self.clock.now += 30
+        with self.assertRaises(TimeoutError):
+            self.circuit.call(fail(TimeoutError()))
+        self.assertEqual(self.circuit.state, "open")
+        self.assertEqual(self.circuit.retry_after(), 30)
+        self.assertEqual(self.circuit.opened, 2)
+
+    def test_permanent_errors_do_not_trip(self):
+        for _ in range(4):
+            with self.assertRaises(ValueError):
+                self.circuit.call(fail(ValueError("неверный запрос")))
+        self.assertEqual(self.circuit.state, "closed")
+
+
+class CallRetryTest(unittest.TestCase):
+    def setUp(self):
+        self._backoff, google_calendar.GOOGLE_BACKOFF = google_calendar.GOOGLE_BACKOFF, 0
+        self.circuit = google_calendar.CircuitBreaker(min_calls=100)
+
+    def tearDown(self):
+        google_calendar.GOOGLE_BACKOFF = self._backoff
+
+    def flaky(self, *outcomes):
+        """Функция, которая по очереди бросает исключения из outcomes или возвращает значение"""
+        outcomes = list(outcomes)
+        self.calls = 0
+
+        def func():
+            self.calls += 1
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, BaseException):
+                raise outcome
+            return outcome
+        return func
+
+    def test_retries_transient_errors(self):
+        func = self.flaky(TimeoutError(), ConnectionError(), "ok")
+        self.assertEqual(google_calendar.call(func, retries=3, circuit=self.circuit), "ok")
+        self.assertEqual((self.calls, self.circuit.retries), (3, 2))
+
+    def test_gives_up_after_retries(self):
+        func = self.flaky(TimeoutError(), TimeoutError(), "ok")
+        with self.assertRaises(TimeoutError):
+            google_calendar.call(func, retries=1, circuit=self.circuit)
+        self.assertEqual(self.calls, 2)
+
+    def test_permanent_error_is_not_retried(self):
+        func = self.flaky(ValueError("неверный запрос"), "ok")
+        with self.assertRaises(ValueError):
+            google_calendar.call(func, retries=3, circuit=self.circuit)
+        self.assertEqual(self.calls, 1)
+
+    def test_open_circuit_is_not_retried(self):
+        self.circuit._trip()
+        func = self.flaky("ok")
+        with self.assertRaises(google_calendar.CircuitOpenError):
+            google_calendar.call(func, retries=3, circuit=self.circuit)
+        self.assertEqual(self.calls, 0)
+
+    def test_deadline_stops_retries(self):
+        google_calendar.GOOGLE_BACKOFF = 10
+        func = self.flaky(TimeoutError(), "ok")
+        with self.assertRaises(TimeoutError):
+            google_calendar.call(func, retries=3, deadline=1, circuit=self.circuit)
+        self.assertEqual(self.calls, 1)
+
+
+class TokenCipherTest(unittest.TestCase):
+    def test_roundtrip(self):
+        cipher = google_calendar.TokenCipher(Fernet.generate_key().decode())
+        token = cipher.encrypt("1//refresh-токен")
+        self.assertNotIn(b"refresh", token)
+        self.assertEqual(cipher.decrypt(token), "1//refresh-токен")
+        self.assertEqual(cipher.decrypt(memoryview(token)), "1//refresh-токен")   # BLOB из SQLite
+
+    def test_key_rotation(self):
+        old, new = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+        token = google_calendar.TokenCipher(old).encrypt("refresh")
+        rotated = google_calendar.TokenCipher(f"{new}, {old}")
+        self.assertEqual(rotated.decrypt(token), "refresh")
+        # Новые токены шифруются первым ключом — старый можно будет убрать
+        self.assertEqual(google_calendar.TokenCipher(new).decrypt(rotated.encrypt("refresh")), "refresh")
+
+    def test_unknown_key_or_damaged_token(self):
+        cipher = google_calendar.TokenCipher(Fernet.generate_key().decode())
+        token = google_calendar.TokenCipher(Fernet.generate_key().decode()).encrypt("refresh")
+        for bad in (token, cipher.encrypt("refresh")[:-4], b"garbage"):
+            with self.assertRaises(ValueError):
+                cipher.decrypt(bad)
+
+    def test_from_env(self):
+        self.assertIsNone(google_calendar.TokenCipher.from_env(" "))
+        self.assertIsInstance(google_calendar.TokenCipher.from_env(Fernet.generate_key().decode()),
+                              google_calendar.TokenCipher)
+
+
+class OAuthStateTest(SqliteTestCase):
+    SECRET = "secret"
+
+    def test_state_is_single_use(self):
+        state = google_calendar.make_oauth_state(7, self.SECRET)
+        self.assertEqual(google_calendar.parse_oauth_state(state, self.SECRET), 7)   # проверка подписи не гасит
+        self.assertEqual(google_calendar.consume_oauth_state(state, self.SECRET), 7)
+        with self.assertRaises(ValueError):
+            google_calendar.consume_oauth_state(state, self.SECRET)
+
+    def test_states_are_independent(self):
+        first, second = (google_calendar.make_oauth_state(7, self.SECRET) for _ in range(2))
+        self.assertNotEqual(first, second)
+        self.assertEqual(google_calendar.consume_oauth_state(second, self.SECRET), 7)
+        self.assertEqual(google_calendar.consume_oauth_state(first, self.SECRET), 7)
+
+    def test_unknown_nonce_is_rejected(self):
+        # Подпись верна, но сервер такой nonce не выдавал
+        state = task_io.make_signed_token((7, "0" * 32), self.SECRET, 60)
+        with self.assertRaises(ValueError):
+            google_calendar.consume_oauth_state(state, self.SECRET)
+
+    def test_bad_signature_and_expired(self):
+        state = google_calendar.make_oauth_state(7, self.SECRET)
+        with self.assertRaises(ValueError):
+            google_calendar.consume_oauth_state(state, "other")
+        expired = google_calendar.make_oauth_state(7, self.SECRET, ttl=-1)
+        with self.assertRaisesRegex(ValueError, "истёк"):
+            google_calendar.consume_oauth_state(expired, self.SECRET)
+        self.assertEqual(google_calendar.consume_oauth_state(state, self.SECRET), 7)
+
+    def test_expired_nonces_are_cleaned_up(self):
+        google_calendar.make_oauth_state(7, self.SECRET, ttl=-10)
+        google_calendar.make_oauth_state(8, self.SECRET)
+        with storage.read_connection() as conn:
+            self.assertEqual([row[0] for row in conn.execute("SELECT user_id FROM oauth_states")], [8])
+
+
+class UserCalendarServicesTest(SqliteTestCase):
+    def setUp(self):
+        super().setUp()
+        credentials_file = os.path.join(self._tmp.name, "credentials.json")
+        with open(credentials_file, "w") as f:
+            json.dump({"web": {"client_id": "test", "client_secret": "test",
+                               "token_uri": "https://oauth2.googleapis.com/token"}}, f)
+        cipher = google_calendar.TokenCipher(Fernet.generate_key().decode())
+        self.services = google_calendar.UserCalendarServices(credentials_file, cipher, unlinked_entries=2)
+        patcher = mock.patch.object(storage, "get_google_account", wraps=storage.get_google_account)
+        self.reads = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def creds(self):
+        return Credentials("token", refresh_token="refresh", token_uri="https://oauth2.googleapis.com/token",
+                           client_id="test", client_secret="test", scopes=google_calendar.SCOPES)
+
+    def test_not_linked_is_cached(self):
+        self.assertFalse(self.services.is_linked(1))
+        self.assertIsNone(self.services.get(1))
+        self.assertFalse(self.services.is_linked(1))
+        self.assertEqual(self.reads.call_count, 1)
+        self.assertEqual(self.services.stats()["unlinked_hits"], 2)
+
+    def test_link_clears_not_linked(self):
+        self.assertFalse(self.services.is_linked(1))
+        self.services.link(1, self.creds())
+        self.assertTrue(self.services.is_linked(1))
+        # Сервис вытеснен из LRU — привязку находим в базе, а не в устаревшей отметке
+        self.services._entries.clear()
+        self.assertTrue(self.services.is_linked(1))
+        self.assertEqual(self.reads.call_count, 2)
+
+    def test_unlink_marks_not_linked(self):
+        self.services.link(1, self.creds())
+        self.assertTrue(self.services.unlink(1))
+        self.assertFalse(self.services.is_linked(1))
+        self.assertIsNone(self.services.get(1))
+        self.assertEqual(self.reads.call_count, 0)
+        self.assertFalse(self.services.unlink(1))
+
+    def test_not_linked_cache_is_bounded(self):
+        for user_id in (1, 2, 3):
+            self.services.is_linked(user_id)
+        self.assertEqual(self.services.stats()["unlinked"], 2)
+        self.services.is_linked(1)   # самая старая отметка вытеснена — снова читаем базу
+        self.assertEqual(self.reads.call_count, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+"""Очерёдность операций outbox: claim / complete / delete / update вперемешку"""
+import unittest
+from datetime import datetime, timezone
+
+from sqlite_case import SqliteTestCase
+
+import storage
+
+USER = 42
+DUE = datetime(2030, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class OutboxTest(SqliteTestCase):
+    def add(self, description="задача"):
+        return storage.add_task(USER, description, DUE, sync_calendar=True)
+
+    def claim(self, now_ts=None):
+        return [(op, task_id, payload) for _, task_id, _, op, payload, _ in storage.claim_outbox(now_ts=now_ts)]
+
+    def complete(self, items, calendar=storage.CALENDAR_OWN):
+        storage.complete_outbox_many([
+            (outbox_id, task_id, user_id, payload.get("event_id") if op == "create" else None, calendar)
+            for outbox_id, task_id, user_id, op, payload, _ in items
+        ])
+
+    def test_create_records_event_and_calendar(self):
+        task_id = self.add()
+        items = storage.claim_outbox()
+        self.assertEqual([item[3] for item in items], ["create"])
+        event_id = items[0][4]["event_id"]
+        self.complete(items)
+        self.assertEqual(storage.get_task_by_id(task_id, USER)[3], event_id)
+        self.assertEqual(storage.claim_outbox(), [])
+        self.assertEqual(storage.outbox_stats(), {"pending": 0, "dead": 0})
+
+    def test_create_event_ids_are_unique(self):
+        self.add()
+        self.add()
+        first, second = (payload["event_id"] for _, _, payload in self.claim())
+        self.assertNotEqual(first, second)
+
+    def test_update_folds_into_unclaimed_create(self):
+        task_id = self.add("старое")
+        storage.update_task(task_id, USER, description="новое", sync_calendar=True)
+        [(op, _, payload)] = self.claim()
+        self.assertEqual((op, payload["description"]), ("create", "новое"))
+
+    def test_update_waits_for_inflight_create(self):
+        task_id = self.add("старое")
+        items = storage.claim_outbox()
+        storage.update_task(task_id, USER, description="новое", sync_calendar=True)
+        # create ещё выполняется: его payload не трогаем, update не отдаём раньше create
+        self.assertEqual(items[0][4]["description"], "старое")
+        self.assertEqual(storage.claim_outbox(), [])
+        self.complete(items)
+        [(op, _, payload)] = self.claim()
+        self.assertEqual(op, "update")
+        self.assertEqual(payload["description"], "новое")
+        self.assertEqual(payload["event_id"], items[0][4]["event_id"])
+        self.assertEqual(payload["calendar"], storage.CALENDAR_OWN)
+
+    def test_repeated_updates_keep_only_latest(self):
+        task_id = self.add()
+        self.complete(storage.claim_outbox())
+        for description in ("раз", "два", "три"):
+            storage.update_task(task_id, USER, description=description, sync_calendar=True)
+        [(op, _, payload)] = self.claim()
+        self.assertEqual((op, payload["description"]), ("update", "три"))
+
+    def test_delete_cancels_unclaimed_create(self):
+        task_id = self.add()
+        storage.delete_tasks(USER, [task_id], sync_calendar=True)
+        self.assertEqual(storage.claim_outbox(), [])
+
+    def test_delete_during_inflight_create_deletes_orphan_event(self):
+        task_id = self.add()
+        items = storage.claim_outbox()
+        storage.delete_tasks(USER, [task_id], sync_calendar=True)
+        self.complete(items)
+        [item] = storage.claim_outbox()
+        _, orphan_task_id, user_id, op, payload, _ = item
+        self.assertEqual((orphan_task_id, user_id, op), (task_id, USER, "delete"))
+        self.assertEqual(payload, {"event_id": items[0][4]["event_id"], "calendar": storage.CALENDAR_OWN})
+
+    def test_delete_goes_to_owning_calendar(self):
+        task_id = self.add()
+        self.complete(storage.claim_outbox(), calendar=storage.CALENDAR_SHARED)
+        storage.delete_tasks(USER, [task_id], sync_calendar=True)
+        [(op, _, payload)] = self.claim()
+        self.assertEqual((op, payload["calendar"]), ("delete", storage.CALENDAR_SHARED))
+
+    def test_lease_returns_operation_after_expiry(self):
+        self.add()
+        [item] = storage.claim_outbox(now_ts=1000, lease_seconds=60)
+        self.assertEqual(storage.claim_outbox(now_ts=1059), [])
+        [again] = storage.claim_outbox(now_ts=1060)
+        self.assertEqual((again[0], again[5]), (item[0], 2))
+
+    def test_retry_and_dead_operations(self):
+        self.add()
+        [item] = storage.claim_outbox()
+        storage.retry_outbox(item[0], item[5], "ошибка", delay=0, max_attempts=1)
+        self.assertEqual(storage.outbox_stats(), {"pending": 0, "dead": 1})
+        self.assertEqual(storage.claim_outbox(now_ts=int(DUE.timestamp())), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
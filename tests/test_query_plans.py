@@ -0,0 +1,88 @@
+"""Планы запросов горячих путей: только поиск по индексу, без полного сканирования tasks и outbox"""
+import random
+import sqlite3
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from sqlite_case import SqliteTestCase
+
+import storage
+
+USERS = 40
+TASKS_PER_USER = 50
+SYNCED_USERS = range(0, USERS, 4)   # у этих пользователей задачи идут в outbox
+FORBIDDEN = ("SCAN tasks", "SCAN outbox", "SCAN earlier")
+
+
+class QueryPlanTest(SqliteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = int(time.time())
+        rng = random.Random(0)
+        for user_id in range(USERS):
+            batch = [(f"задача {i}", datetime.fromtimestamp(self.now + rng.randint(-30 * 86400, 365 * 86400),
+                                                              timezone.utc))
+                     for i in range(TASKS_PER_USER)]
+            storage.import_tasks(user_id, [batch], sync_calendar=user_id in SYNCED_USERS)
+        # Часть create выполнена, часть исчерпала попытки — в outbox остаются строки всех видов
+        items = storage.claim_outbox(limit=100, now_ts=self.now)
+        storage.complete_outbox_many([(outbox_id, task_id, user_id, payload["event_id"], storage.CALENDAR_OWN)
+                                      for outbox_id, task_id, user_id, _, payload, _ in items[:80]])
+        for outbox_id, _, _, _, _, attempts in items[80:]:
+            storage.retry_outbox(outbox_id, attempts, "ошибка", delay=0, max_attempts=1)
+        storage.close_writer()
+        storage.close_pool()
+        with sqlite3.connect(storage.DB_PATH) as conn:
+            conn.execute("ANALYZE")
+
+        self.statements = []
+        self._apply_profile = storage.apply_profile
+        self._max_entries = storage.upcoming_cache.max_entries
+        storage.upcoming_cache.max_entries = 0      # проверяем SQL, а не кэш
+
+        def traced(conn, profile=None):
+            conn.set_trace_callback(self.statements.append)
+            return self._apply_profile(conn, profile)
+        storage.apply_profile = traced
+
+    def tearDown(self):
+        storage.apply_profile = self._apply_profile
+        storage.upcoming_cache.max_entries = self._max_entries
+        super().tearDown()
+
+    def plan(self, call):
+        """Планы всех запросов к данным, которые выполнил call"""
+        self.statements.clear()
+        call()
+        statements = [sql for sql in self.statements
+                      if "tasks_fts_" not in sql
+                      and sql.lstrip().split(" ", 1)[0].upper() in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")]
+        self.assertTrue(statements, "не выполнено ни одного запроса")
+        with sqlite3.connect(storage.DB_PATH) as conn:
+            return [row[3] for sql in statements for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+    def assertPlan(self, plan, *required):
+        for fragment in required:
+            self.assertTrue(any(fragment in line for line in plan), f"нет {fragment!r} в {plan}")
+        for fragment in FORBIDDEN + ("TEMP B-TREE",):
+            self.assertFalse(any(fragment in line for line in plan), f"{fragment!r} в {plan}")
+
+    def test_get_tasks_page(self):
+        plan = self.plan(lambda: storage.get_tasks_page(3, (self.now + 86400, 0), now_ts=self.now))
+        self.assertPlan(plan, "SEARCH tasks USING INDEX idx_tasks_user_due (user_id=? AND due_ts>?)")
+
+    def test_get_tasks_between(self):
+        start = datetime.fromtimestamp(self.now, timezone.utc)
+        plan = self.plan(lambda: storage.get_tasks_between(3, start, start + timedelta(days=7), self.now))
+        self.assertPlan(plan, "SEARCH tasks USING INDEX idx_tasks_user_due (user_id=? AND due_ts>? AND due_ts<?)")
+
+    def test_claim_outbox(self):
+        plan = self.plan(lambda: storage.claim_outbox(now_ts=self.now))
+        self.assertPlan(plan,
+                        "SEARCH outbox USING INDEX idx_outbox_next (next_attempt_at<?)",
+                        "SEARCH earlier USING INDEX idx_outbox_task (task_id=?")
+
+
+if __name__ == "__main__":
+    unittest.main()
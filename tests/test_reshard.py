@@ -0,0 +1,83 @@
+"""Перешардирование однофайловой базы и уникальность ID задач между шардами"""
+import os
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from sqlite_case import SqliteTestCase
+
+import storage
+
+SHARDS = 3
+USERS = range(1, 31)
+DUE = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+
+class ReshardTest(SqliteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.source = storage.DB_PATH
+        self.target = os.path.join(self._tmp.name, "shards")
+        self.tasks = {user_id: storage.import_tasks(user_id, [[(f"задача {user_id}", DUE)] * 2])
+                      for user_id in USERS}
+        storage.add_task(1, "в календарь", DUE + timedelta(days=1), sync_calendar=True)
+        storage.save_google_account(2, b"refresh", "scope")
+        storage.archive_past_tasks(int(DUE.timestamp()) + 1)   # архив переезжает вместе с задачами
+        self.max_id = storage.add_task(1, "после архива", DUE + timedelta(days=2))
+        storage.close_writer()
+        storage.close_pool()
+        storage.upcoming_cache.clear()
+
+    def use_shards(self):
+        storage.DB_PATH = self.target
+        storage.init_db()
+
+    def test_moves_every_user_into_its_shard(self):
+        counts = storage.reshard(self.source, self.target, SHARDS)
+        self.assertEqual(sum(counts), 2)
+        self.use_shards()
+        self.assertEqual(storage.shard_count(), SHARDS)
+        for user_id, task_ids in self.tasks.items():
+            shard = storage.shard_of(user_id)
+            with storage.read_connection(shard) as conn:
+                archived = [row[0] for row in conn.execute(
+                    "SELECT id FROM tasks_archive WHERE user_id=? ORDER BY id", (user_id,))]
+            self.assertEqual(archived, task_ids)
+        self.assertEqual(len(storage.get_tasks(1, 0)), 2)
+        self.assertIsNotNone(storage.get_google_account(2))
+        [item] = storage.claim_outbox()
+        self.assertEqual((item[2], item[3]), (1, "create"))
+
+    def test_new_task_ids_are_unique_across_shards(self):
+        storage.reshard(self.source, self.target, SHARDS)
+        self.use_shards()
+        users = {storage.shard_of(user_id): user_id for user_id in USERS}
+        self.assertEqual(len(users), SHARDS)
+        ids = [storage.add_task(user_id, "новая", DUE) for user_id in users.values() for _ in range(3)]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertGreater(min(ids), self.max_id)
+
+    def test_fresh_shard_directory(self):
+        storage.DB_PATH, storage.DB_SHARDS = self.target, SHARDS
+        storage.init_db()
+        storage.init_db()   # повторный запуск не двигает счётчики
+        users = {storage.shard_of(user_id): user_id for user_id in USERS}
+        ids = [storage.add_task(user_id, "новая", DUE) for user_id in users.values()]
+        self.assertEqual(sorted(ids), [shard * storage.SHARD_ID_SPAN + 1 for shard in range(SHARDS)])
+
+    def test_refuses_bad_targets(self):
+        with self.assertRaises(ValueError):
+            storage.reshard(self.source, self.target, 0)
+        os.makedirs(self.target)
+        open(os.path.join(self.target, "junk"), "w").close()
+        with self.assertRaises(ValueError):
+            storage.reshard(self.source, self.target, SHARDS)
+
+    def test_changed_shard_count_is_refused(self):
+        storage.reshard(self.source, self.target, SHARDS)
+        storage.DB_PATH, storage.DB_SHARDS = self.target, SHARDS + 1
+        with self.assertRaises(RuntimeError):
+            storage.shard_count()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,240 @@
+import io
+import os
+import sys
+import time
+import unittest
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+import task_io  # noqa: E402
+from sqlite_case import SqliteTestCase  # noqa: E402
+
+
+def parse_datetime(date_str, time_str):
+    return datetime.strptime(f"{date_str} {time_str}", "%d.%m.%Y %H:%M").replace(tzinfo=timezone.utc)
+
+
+class ReadImportTest(unittest.TestCase):
+    def read(self, text, filename, max_rows=task_io.IMPORT_MAX_ROWS):
+        batches, errors = task_io.read_import(io.BytesIO(text.encode("utf-8")), filename, parse_datetime,
+                                              timezone.utc, max_rows)
+        return [task for batch in batches for task in batch], errors
+
+    def test_csv_with_header_and_bom(self):
+        tasks, errors = self.read("﻿description,date,time\nЗвонок,01.02.2030,14:30\n\n", "tasks.csv")
+        self.assertEqual(tasks, [("Звонок", datetime(2030, 2, 1, 14, 30, tzinfo=timezone.utc))])
+        self.assertEqual(errors, [])
+
+    def test_csv_error_rows_keep_line_numbers(self):
+        tasks, errors = self.read(
+            "Раз,01.02.2030,14:30\n"
+            ",01.02.2030,14:30\n"
+            "Два,01.02.2030\n"
+            "Три,2030-02-01,14:30\n"
+            "Четыре,01.02.2030,15:00\n",
+            "tasks.csv",
+        )
+        self.assertEqual([description for description, _ in tasks], ["Раз", "Четыре"])
+        self.assertEqual([row_no for row_no, _ in errors], [2, 3, 4])
+        self.assertEqual(errors[0][1], "нет описания")
+        self.assertEqual(errors[1][1], "нужны поля date и time или datetime")
+
+    def test_iso_datetime_without_zone_is_localized(self):
+        tasks, errors = self.read('[{"description": "A", "datetime": "2030-02-01T14:30"}]', "tasks.json")
+        self.assertEqual(tasks, [("A", datetime(2030, 2, 1, 14, 30, tzinfo=timezone.utc))])
+        tasks, errors = self.read('[{"description": "A", "datetime": "завтра"}]', "tasks.json")
+        self.assertEqual((tasks, errors[0][0]), ([], 1))
+
+    def test_jsonl_bad_lines(self):
+        tasks, errors = self.read(
+            '{"description": "A", "date": "01.02.2030", "time": "14:30"}\n'
+            "{не json}\n"
+            "[1, 2]\n",
+            "tasks.jsonl",
+        )
+        self.assertEqual(len(tasks), 1)
+        self.assertEqual([row_no for row_no, _ in errors], [2, 3])
+        self.assertTrue(errors[0][1].startswith("некорректный JSON"))
+
+    def test_row_limit(self):
+        text = "".join(f"Задача {i},01.02.2030,14:30\n" for i in range(5))
+        tasks, errors = self.read(text, "tasks.csv", max_rows=3)
+        self.assertEqual(len(tasks), 3)
+        self.assertEqual(errors, [(4, "превышен лимит в 3 задач, остальные строки пропущены")])
+
+    def test_unsupported_files(self):
+        with self.assertRaises(ValueError):
+            self.read("x", "tasks.xlsx")
+        with self.assertRaises(ValueError):
+            self.read('{"description": "A"}', "tasks.json")
+
+    def test_report(self):
+        report = task_io.format_import_report(1, [(i, "ошибка") for i in range(1, 4)], limit=2)
+        self.assertIn("Ошибок: 3", report)
+        self.assertIn("… и ещё 1", report)
+
+
+ROWS = [(1, "Звонок, важный", 1896179400, None), (2, "Отчёт", 1896183000, "evt2")]
+
+
+class ExportTest(unittest.TestCase):
+    def export(self, rows, fmt):
+        return "".join(task_io.export_chunks(rows, fmt, timezone.utc))
+
+    def test_csv_roundtrips_through_import(self):
+        text = self.export(ROWS, "csv")
+        batches, errors = task_io.read_import(io.BytesIO(text.encode("utf-8")), "tasks.csv", parse_datetime,
+                                              timezone.utc)
+        self.assertEqual(errors, [])
+        self.assertEqual([(d, int(dt.timestamp())) for d, dt in batches[0]], [(row[1], row[2]) for row in ROWS])
+
+    def test_jsonl(self):
+        lines = self.export(ROWS, "jsonl").splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('"google_event_id": "evt2"', lines[1])
+
+    def test_ics_escapes_and_folds_long_lines(self):
+        description = "Очень длинное описание, с запятой; и точкой с запятой " * 3
+        text = self.export([(1, description, 1896179400, None)], "ics")
+        self.assertTrue(text.startswith("BEGIN:VCALENDAR\r\n") and text.endswith("END:VCALENDAR\r\n"))
+        lines = text.split("\r\n")
+        # RFC 5545: не длиннее 75 октетов, продолжение начинается с пробела
+        self.assertTrue(all(len(line.encode("utf-8")) <= 75 for line in lines))
+        start = next(i for i, line in enumerate(lines) if line.startswith("SUMMARY:"))
+        end = next(i for i in range(start + 1, len(lines)) if not lines[i].startswith(" "))
+        self.assertGreater(end - start, 1)
+        unfolded = lines[start] + "".join(line[1:] for line in lines[start + 1:end])
+        self.assertEqual(unfolded, "SUMMARY:" + description.replace(",", "\\,").replace(";", "\\;"))
+
+    def test_ics_does_not_split_characters(self):
+        text = self.export([(1, "ж" * 100, 1896179400, None)], "ics")
+        for line in text.split("\r\n"):
+            line.encode("utf-8").decode("utf-8")
+            self.assertLessEqual(len(line.encode("utf-8")), 75)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            self.export(ROWS, "xml")
+
+
+class IterTasksTest(SqliteTestCase):
+    def test_keyset_chunks_return_every_task_once_in_order(self):
+        # Одинаковые due_ts на границе порций: курсор (due_ts, id) не теряет и не повторяет строки
+        batches = [[(f"задача {i}", datetime.fromtimestamp(1896179400 + i // 3, timezone.utc)) for i in range(25)]]
+        ids = storage.import_tasks(9, batches)
+        rows = list(storage.iter_tasks(9, fetch_size=4))
+        self.assertEqual(sorted(row[0] for row in rows), sorted(ids))
+        self.assertEqual(rows, sorted(rows, key=lambda row: (row[2], row[0])))
+
+    def test_connection_is_released_between_chunks(self):
+        storage.import_tasks(9, [[(f"задача {i}", datetime.fromtimestamp(1896179400 + i, timezone.utc))
+                                  for i in range(10)]])
+        # Один читатель на шард: пока экспорт стоит между порциями, другие чтения не ждут
+        size, storage.DB_POOL_SIZE = storage.DB_POOL_SIZE, 1
+        try:
+            chunks = storage.iter_tasks(9, fetch_size=4)
+            next(chunks)
+            self.assertEqual(len(storage.get_tasks_between(
+                9, datetime.fromtimestamp(0, timezone.utc), datetime.fromtimestamp(1896179500, timezone.utc), 0)), 10)
+            self.assertEqual(len(list(chunks)), 9)
+        finally:
+            storage.DB_POOL_SIZE = size
+
+
+class ParseDeleteArgsTest(unittest.TestCase):
+    def test_ids_and_ranges(self):
+        self.assertEqual(task_io.parse_delete_args("3 5,7 10-12"), [3, 5, 7, 10, 11, 12])
+
+    def test_reversed_range(self):
+        self.assertEqual(task_io.parse_delete_args("12-10"), [10, 11, 12])
+
+    def test_past(self):
+        self.assertEqual(task_io.parse_delete_args(" Past "), "past")
+        self.assertEqual(task_io.parse_delete_args("прошедшие"), "past")
+
+    def test_not_a_number(self):
+        for text in ("abc", "3 x", "1-", "-5"):
+            with self.assertRaises(ValueError, msg=text):
+                task_io.parse_delete_args(text)
+
+    def test_limit_is_inclusive(self):
+        self.assertEqual(len(task_io.parse_delete_args("1-10", max_ids=10)), 10)
+        with self.assertRaises(ValueError):
+            task_io.parse_delete_args("1-11", max_ids=10)
+
+    def test_limit_counts_all_parts(self):
+        with self.assertRaises(ValueError):
+            task_io.parse_delete_args("1-5 7-11", max_ids=9)
+
+    def test_huge_range_is_rejected_before_expanding(self):
+        started = time.monotonic()
+        with self.assertRaises(ValueError):
+            task_io.parse_delete_args("1-2000000000")
+        self.assertLess(time.monotonic() - started, 1)
+
+
+class ParseEditArgsTest(unittest.TestCase):
+    def test_description_only(self):
+        self.assertEqual(task_io.parse_edit_args("5 Новое описание", parse_datetime), (5, "Новое описание", None))
+
+    def test_datetime_only(self):
+        self.assertEqual(task_io.parse_edit_args("5 01.02.2030 14:30", parse_datetime),
+                         (5, None, datetime(2030, 2, 1, 14, 30, tzinfo=timezone.utc)))
+
+    def test_datetime_and_description(self):
+        self.assertEqual(task_io.parse_edit_args("5 01.02.2030 14:30 Звонок маме", parse_datetime),
+                         (5, "Звонок маме", datetime(2030, 2, 1, 14, 30, tzinfo=timezone.utc)))
+
+    def test_words_that_are_not_a_date_stay_in_description(self):
+        self.assertEqual(task_io.parse_edit_args("5 Купить 2 хлеба", parse_datetime), (5, "Купить 2 хлеба", None))
+
+    def test_errors(self):
+        for text in ("", "5", "x описание"):
+            with self.assertRaises(ValueError, msg=text):
+                task_io.parse_edit_args(text, parse_datetime)
+
+
+class DeleteTasksTest(SqliteTestCase):
+    def test_only_own_tasks_in_chunks(self):
+        due = datetime(2030, 1, 1, tzinfo=timezone.utc)
+        own = storage.import_tasks(1, [[(f"моя {i}", due) for i in range(storage.DELETE_CHUNK + 5)]])
+        other = storage.add_task(2, "чужая", due)
+        deleted = storage.delete_tasks(1, task_io.parse_delete_args(f"{own[0]}-{other}", max_ids=10_000))
+        self.assertEqual(sorted(task_id for task_id, _ in deleted), own)
+        self.assertIsNotNone(storage.get_task_by_id(other, 2))
+
+
+class SignedTokenTest(unittest.TestCase):
+    def test_export_token_roundtrip(self):
+        token = task_io.make_export_token(-100123, "csv", "secret")
+        self.assertEqual(task_io.parse_export_token(token, "secret"), (-100123, "csv"))
+
+    def test_wrong_secret_or_tampered(self):
+        token = task_io.make_export_token(1, "csv", "secret")
+        _, signature = token.split(".")
+        forged = task_io.make_export_token(2, "csv", "secret").split(".")[0]
+        for bad in (token + "x", f"{forged}.{signature}", "garbage"):
+            with self.assertRaises(ValueError, msg=bad):
+                task_io.parse_export_token(bad, "secret")
+        with self.assertRaises(ValueError):
+            task_io.parse_export_token(token, "other")
+
+    def test_field_count(self):
+        token = task_io.make_signed_token((1,), "secret", 60)
+        with self.assertRaises(ValueError):
+            task_io.parse_export_token(token, "secret")
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            task_io.parse_export_token(task_io.make_export_token(1, "xml", "secret"), "secret")
+
+    def test_expired(self):
+        token = task_io.make_export_token(1, "csv", "secret", ttl=-1)
+        with self.assertRaises(task_io.TokenExpired):
+            task_io.parse_export_token(token, "secret")
+
+
+if __name__ == "__main__":
+    unittest.main()
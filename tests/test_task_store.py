@@ -0,0 +1,90 @@
+"""Одинаковые операции на SqliteTaskStore и MemoryTaskStore должны давать одинаковый результат"""
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from sqlite_case import SqliteTestCase
+from task_store import TaskStore, SqliteTaskStore, MemoryTaskStore
+
+NOW = datetime(2030, 1, 1, 12, 0, tzinfo=timezone.utc)
+NOW_TS = int(NOW.timestamp())
+ALICE, BOB = 100123, -100123   # в FTS это один и тот же токен
+
+
+class TaskStoreParityTest(SqliteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.stores = [SqliteTaskStore(), MemoryTaskStore()]
+
+    def each(self, call):
+        """Результат call(store) на обоих хранилищах; проверяем, что они совпали"""
+        sqlite_result, memory_result = (call(store) for store in self.stores)
+        self.assertEqual(sqlite_result, memory_result)
+        return sqlite_result
+
+    def fill(self):
+        rows = [
+            (ALICE, "купить молоко", NOW - timedelta(hours=2)),
+            (ALICE, "позвонить маме", NOW + timedelta(hours=1)),
+            (BOB, "купить хлеб", NOW + timedelta(hours=1)),
+            (ALICE, "купить билеты", NOW + timedelta(hours=1)),
+            (ALICE, "отчёт", NOW + timedelta(days=1, hours=3)),
+            (ALICE, "встреча", NOW + timedelta(days=3)),
+        ]
+        return [self.each(lambda store: store.add_task(user_id, text, dt)) for user_id, text, dt in rows]
+
+    def test_protocol(self):
+        for store in self.stores:
+            self.assertIsInstance(store, TaskStore)
+
+    def test_reads(self):
+        ids = self.fill()
+        self.each(lambda store: store.get_tasks(ALICE, NOW_TS))
+        self.each(lambda store: store.get_tasks(BOB, NOW_TS))
+        self.each(lambda store: store.get_task_by_id(ids[1], ALICE))
+        self.assertIsNone(self.each(lambda store: store.get_task_by_id(ids[2], ALICE)))
+        self.each(lambda store: store.get_tasks_between(ALICE, NOW - timedelta(days=1), NOW + timedelta(days=1), NOW_TS))
+        self.each(lambda store: list(store.iter_tasks(ALICE)))
+
+    def test_pages(self):
+        self.fill()
+        after, pages = None, []
+        while True:
+            rows, after = self.each(lambda store: store.get_tasks_page(ALICE, after, limit=2, now_ts=NOW_TS))
+            pages.append(rows)
+            if after is None:
+                break
+        self.assertEqual([len(rows) for rows in pages], [2, 2])
+
+    def test_search(self):
+        self.fill()
+        # Порядок разный (bm25 против due_ts), состав — один
+        found = self.each(lambda store: sorted(store.search_tasks(ALICE, "куп")))
+        self.assertEqual({row[1] for row in found}, {"купить молоко", "купить билеты"})
+        self.each(lambda store: store.search_tasks(ALICE, "купить бил"))
+        self.assertEqual(self.each(lambda store: store.search_tasks(ALICE, "хлеб")), [])
+        self.assertEqual(self.each(lambda store: store.search_tasks(ALICE, "!!")), [])
+
+    def test_delete(self):
+        ids = self.fill()
+        self.each(lambda store: store.delete_tasks(ALICE, [ids[1], ids[2], ids[1], 999]))
+        self.each(lambda store: store.delete_past_tasks(ALICE, NOW_TS))
+        self.each(lambda store: list(store.iter_tasks(ALICE)))
+        self.each(lambda store: list(store.iter_tasks(BOB)))
+
+    def test_update(self):
+        ids = self.fill()
+        self.assertTrue(self.each(lambda store: store.update_task(ids[1], ALICE, description="перезвонить")))
+        self.assertTrue(self.each(lambda store: store.update_task(ids[3], ALICE, dt=NOW + timedelta(days=5))))
+        self.assertFalse(self.each(lambda store: store.update_task(ids[2], ALICE, description="чужая")))
+        self.each(lambda store: list(store.iter_tasks(ALICE)))
+        self.each(lambda store: store.get_tasks_page(ALICE, now_ts=NOW_TS))
+        self.each(lambda store: store.search_tasks(ALICE, "перезвонить"))
+
+    def test_import(self):
+        batches = [[("раз", NOW + timedelta(hours=3)), ("два", NOW + timedelta(hours=1))], [("три", NOW)]]
+        self.each(lambda store: store.import_tasks(ALICE, batches))
+        self.each(lambda store: list(store.iter_tasks(ALICE)))
+
+
+if __name__ == "__main__":
+    unittest.main()
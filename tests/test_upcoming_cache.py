@@ -0,0 +1,86 @@
+"""Кэш предстоящих задач: изменения задач пользователя сбрасывают его запись"""
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from sqlite_case import SqliteTestCase
+
+import storage
+
+USER, OTHER = 7, 8
+
+
+class UpcomingCacheInvalidationTest(SqliteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = datetime.now(timezone.utc)
+        self.task_id = storage.add_task(USER, "первая", self.now + timedelta(hours=1))
+        storage.add_task(OTHER, "чужая", self.now + timedelta(hours=1))
+        self.descriptions(USER)   # кладём пользователя в кэш
+        self.descriptions(OTHER)
+
+    def descriptions(self, user_id):
+        return [row[1] for row in storage.get_tasks(user_id)]
+
+    def test_hit(self):
+        hits = storage.upcoming_cache.hits
+        self.assertEqual(self.descriptions(USER), ["первая"])
+        self.assertEqual(storage.upcoming_cache.hits, hits + 1)
+
+    def test_add(self):
+        storage.add_task(USER, "вторая", self.now + timedelta(hours=2))
+        self.assertEqual(self.descriptions(USER), ["первая", "вторая"])
+
+    def test_delete(self):
+        storage.delete_tasks(USER, [self.task_id])
+        self.assertEqual(self.descriptions(USER), [])
+
+    def test_update(self):
+        storage.update_task(self.task_id, USER, description="изменённая")
+        self.assertEqual(self.descriptions(USER), ["изменённая"])
+
+    def test_import(self):
+        storage.import_tasks(USER, [[("импорт", self.now + timedelta(minutes=30))]])
+        self.assertEqual(self.descriptions(USER), ["импорт", "первая"])
+
+    def test_other_user_stays_cached(self):
+        storage.add_task(USER, "вторая", self.now + timedelta(hours=2))
+        hits = storage.upcoming_cache.hits
+        self.assertEqual(self.descriptions(OTHER), ["чужая"])
+        self.assertEqual(storage.upcoming_cache.hits, hits + 1)
+
+
+class UpcomingCacheTest(unittest.TestCase):
+    def rows(self, *due):
+        return [(i, f"задача {i}", ts, None) for i, ts in enumerate(due, 1)]
+
+    def test_stale_put_is_dropped(self):
+        # Прочитали до записи, положили после неё — такой список устарел
+        cache = storage.UpcomingCache()
+        generation = cache.generation(USER)
+        cache.invalidate(USER)
+        cache.put(USER, self.rows(100), generation)
+        self.assertIsNone(cache.get(USER, 0))
+
+    def test_passed_tasks_are_trimmed(self):
+        cache = storage.UpcomingCache()
+        cache.put(USER, self.rows(100, 200, 300), cache.generation(USER))
+        self.assertEqual([row[2] for row in cache.get(USER, 200)], [300])
+
+    def test_lru_eviction(self):
+        cache = storage.UpcomingCache(max_entries=2)
+        for user_id in (1, 2, 3):
+            cache.put(user_id, self.rows(100), cache.generation(user_id))
+        self.assertIsNone(cache.get(1, 0))
+        self.assertIsNotNone(cache.get(3, 0))
+        self.assertEqual(cache.evictions, 1)
+
+    def test_ttl(self):
+        cache = storage.UpcomingCache(ttl=0.01)
+        cache.put(USER, self.rows(100), cache.generation(USER))
+        time.sleep(0.02)
+        self.assertIsNone(cache.get(USER, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+"""Поток-писатель шарда: пачки с SAVEPOINT, гибель потока и таймаут ожидания записи"""
+import os
+import threading
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from sqlite_case import SqliteTestCase
+
+import storage
+
+USER = 3
+
+
+class Boom(BaseException):
+    """Исключение, которое не ловит обработка отдельной операции — поток-писатель умирает"""
+
+
+def insert(description):
+    def op(conn):
+        return conn.execute("INSERT INTO tasks (user_id, description, due_ts) VALUES (?, ?, 0)",
+                            (USER, description)).lastrowid
+    return op
+
+
+def hold_writer():
+    """Занимаем писателя, чтобы следующие операции попали в одну пачку"""
+    started, release = threading.Event(), threading.Event()
+
+    def blocker(conn):
+        started.set()
+        release.wait(5)
+    future = storage.write_async(blocker)
+    started.wait(5)
+    return release, future
+
+
+class GroupCommitWriterTest(SqliteTestCase):
+    def descriptions(self):
+        with storage.read_connection() as conn:
+            return [row[0] for row in conn.execute("SELECT description FROM tasks ORDER BY id")]
+
+    def test_failed_op_is_rolled_back_alone(self):
+        def failing(conn):
+            insert("откатится")(conn)
+            raise ValueError("ошибка операции")
+
+        release, blocker = hold_writer()
+        futures = [storage.write_async(op) for op in (insert("первая"), failing, insert("третья"))]
+        release.set()
+        blocker.result(5)
+        self.assertIsInstance(futures[0].result(5), int)
+        with self.assertRaises(ValueError):
+            futures[1].result(5)
+        self.assertIsInstance(futures[2].result(5), int)
+        self.assertEqual(self.descriptions(), ["первая", "третья"])
+
+    def test_dead_writer_fails_pending_writes_and_is_replaced(self):
+        def boom(conn):
+            raise Boom()
+
+        writer = storage.get_writer()
+        release, _ = hold_writer()
+        dying, queued = storage.write_async(boom), storage.write_async(insert("в очереди"))
+        release.set()
+        with self.assertRaises(Boom):
+            dying.result(5)
+        with self.assertRaises(Boom):
+            queued.result(5)
+        self.assertFalse(writer.alive)
+        with self.assertRaises(Boom):
+            writer.submit(insert("после гибели")).result(0)
+
+        self.assertIsInstance(storage.write(insert("новый писатель")), int)
+        self.assertIsNot(storage.get_writer(), writer)
+        self.assertEqual(self.descriptions(), ["новый писатель"])
+
+    def test_writer_that_cannot_open_database(self):
+        writer = storage.GroupCommitWriter(os.path.join(self._tmp.name, "нет", "такого", "каталога.db"))
+        writer._thread.join(5)
+        self.assertFalse(writer.alive)
+        future = writer.submit(insert("никуда"))
+        with self.assertRaises(Exception):
+            future.result(0)
+
+    def test_without_group_commit(self):
+        storage.close_writer()
+        saved, storage.DB_GROUP_COMMIT = storage.DB_GROUP_COMMIT, False
+        try:
+            future = storage.write_async(insert("сразу"))
+            self.assertTrue(future.done())
+            self.assertIsNone(storage.get_writer())
+        finally:
+            storage.DB_GROUP_COMMIT = saved
+        self.assertEqual(self.descriptions(), ["сразу"])
+
+
+class WriteTimeoutTest(SqliteTestCase):
+    def test_timed_out_write_still_invalidates_cache_when_it_lands(self):
+        due = datetime.now(timezone.utc) + timedelta(hours=1)
+        storage.add_task(USER, "первая", due)
+        self.assertEqual(len(storage.get_tasks(USER)), 1)
+
+        release, _ = hold_writer()
+        saved, storage.DB_WRITE_TIMEOUT = storage.DB_WRITE_TIMEOUT, 0.05
+        try:
+            with self.assertRaises(TimeoutError):
+                storage.add_task(USER, "вторая", due + timedelta(minutes=1))
+        finally:
+            storage.DB_WRITE_TIMEOUT = saved
+        # Пока запись в очереди, чтение кладёт в кэш старый список
+        self.assertEqual(len(storage.get_tasks(USER)), 1)
+        release.set()
+        storage.write(lambda conn: None)   # дожидаемся пачки с отложенной записью
+        self.assertEqual([row[1] for row in storage.get_tasks(USER)], ["первая", "вторая"])
+
+
+if __name__ == "__main__":
+    unittest.main()
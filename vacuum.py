@@ -0,0 +1,31 @@
+"""
+Однократный перевод базы задач в auto_vacuum=INCREMENTAL.
+
+Фоновое обслуживание (storage.run_maintenance) возвращает ОС место после архивации
+через PRAGMA incremental_vacuum, но только если база в этом режиме. Новая база
+создаётся сразу в нём, а существующую нужно один раз перезаписать полным VACUUM:
+это занимает время и место на диске размером с базу. Бот должен быть остановлен.
+
+Запуск:
+    python vacuum.py                 # DATABASE_PATH (все шарды)
+"""
+import sys
+import time
+import sqlite3
+
+import storage
+
+def main():
+    start = time.perf_counter()
+    try:
+        result = storage.enable_incremental_vacuum()
+    except (sqlite3.Error, RuntimeError) as e:
+        print(f"❌ {e}")
+        return 1
+    for path, already in result:
+        print(f"{'ℹ️ уже' if already else '✅'} {path}: auto_vacuum=INCREMENTAL")
+    print(f"Готово за {time.perf_counter() - start:.1f} с")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())